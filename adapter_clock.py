@@ -0,0 +1,142 @@
+import os
+import re
+from typing import Dict, List, Union
+
+from tclrpc import OpenOcdTclRpc, TclException
+from utils import read_json_file, update_json_file
+
+
+AUTO = 'auto'
+
+# Ступени скорости отладчика в кГц, проверяемые по возрастанию
+SPEED_STEPS = [1000, 2000, 4000, 6000, 8000, 10000, 15000, 20000, 30000]
+# Запас: выбирается ступень на SAFETY_STEPS ниже самой быстрой устойчивой
+SAFETY_STEPS = 1
+# Область ОЗУ для проверки записи и чтения, восстанавливается после проверки
+CHECK_ADDRESS = 0x02000000
+CHECK_WORDS = 256
+CHECK_ROUNDS = 2
+
+default_cache_path = os.path.join(os.path.expanduser('~'), '.mik32-uploader', 'adapter-speed.json')
+
+_RE_SPEED = re.compile(r'(\d+) kHz')
+
+
+def cache_key(openocd_interface: str, adapter_serial: Union[str, None]) -> str:
+    return f"{adapter_serial or 'default'}|{os.path.abspath(openocd_interface)}"
+
+
+def load_cache(path: str) -> Dict[str, int]:
+    return read_json_file(path)
+
+
+def save_cache(path: str, key: str, speed: int):
+    """Сохранение скорости для платы, скорости других плат (потоков --gang) не затираются"""
+    try:
+        update_json_file(path, lambda cache: cache.update({key: speed}))
+    except OSError as e:
+        print(f"WARNING: Adapter speed cache {path} is not written: {e}")
+
+
+def set_speed(openocd: OpenOcdTclRpc, speed: int) -> int:
+    """
+    Установить скорость отладчика.
+    @return: скорость, установленная OpenOCD, она может быть ниже запрошенной
+    """
+    openocd.run(f"adapter speed {speed}")
+    match = _RE_SPEED.search(openocd.run("capture \"adapter speed\""))
+    if match is None:
+        return speed
+    return int(match.group(1))
+
+
+def check_pattern(openocd: OpenOcdTclRpc, rounds: int = CHECK_ROUNDS) -> bool:
+    """
+    Проверка обмена: запись и чтение слов, в которых чередуются и сдвигаются
+    нули и единицы. Ошибка OpenOCD считается непрохождением проверки
+    """
+    for pass_index in range(rounds):
+        pattern: List[int] = []
+        for i in range(CHECK_WORDS):
+            value = ((i + pass_index) * 0x9E3779B9) & 0xFFFFFFFF
+            if i % 4 == 0:
+                value = 0xAAAAAAAA if (i // 4 + pass_index) % 2 else 0x55555555
+            elif i % 4 == 1:
+                value = 1 << ((i + pass_index) % 32)
+            pattern.append(value)
+
+        try:
+            openocd.write_memory(CHECK_ADDRESS, 32, pattern)
+            if openocd.read_memory(CHECK_ADDRESS, 32, CHECK_WORDS) != pattern:
+                return False
+        except (TclException, ValueError, IndexError):
+            return False
+
+    return True
+
+
+def calibrate(openocd: OpenOcdTclRpc, start_speed: int) -> int:
+    """
+    Повышение скорости по ступеням SPEED_STEPS, пока проходит проверка обмена.
+    @return: самая быстрая устойчивая скорость с запасом SAFETY_STEPS ступеней
+    """
+    stable: List[int] = [start_speed]
+    for step in SPEED_STEPS:
+        if step <= stable[-1]:
+            continue
+        try:
+            speed = set_speed(openocd, step)
+        except TclException:
+            break
+        if speed <= stable[-1]:
+            # отладчик не поддерживает более высокую скорость
+            break
+        if not check_pattern(openocd):
+            break
+        stable.append(speed)
+
+    return stable[max(stable.__len__() - 1 - SAFETY_STEPS, 0)]
+
+
+def select_speed(
+    openocd: OpenOcdTclRpc,
+    openocd_interface: str,
+    adapter_serial: Union[str, None] = None,
+    start_speed: int = 500,
+    cache_path: Union[str, None] = default_cache_path,
+) -> int:
+    """
+    Выбор скорости отладчика для --adapter-speed auto. Скорость, сохраненная
+    для отладчика и файла настроек интерфейса, проверяется и используется повторно,
+    иначе скорость подбирается заново и сохраняется.
+    @start_speed: заведомо рабочая скорость, с которой начинается подбор
+    @cache_path: путь к файлу сохраненных скоростей, None - не сохранять
+    @return: установленная скорость в кГц
+    """
+    openocd.halt()
+    set_speed(openocd, start_speed)
+    backup = openocd.read_memory(CHECK_ADDRESS, 32, CHECK_WORDS)
+
+    key = cache_key(openocd_interface, adapter_serial)
+    cached = load_cache(cache_path).get(key) if cache_path is not None else None
+
+    speed = None
+    if cached is not None:
+        speed = set_speed(openocd, cached)
+        if check_pattern(openocd):
+            print(f"Adapter speed {speed} kHz (cached)")
+        else:
+            print(f"Cached adapter speed {cached} kHz is unstable, selecting again")
+            set_speed(openocd, start_speed)
+            speed = None
+
+    if speed is None:
+        speed = set_speed(openocd, calibrate(openocd, start_speed))
+        if not check_pattern(openocd):
+            speed = set_speed(openocd, start_speed)
+        print(f"Adapter speed {speed} kHz selected")
+        if cache_path is not None:
+            save_cache(cache_path, key, speed)
+
+    openocd.write_memory(CHECK_ADDRESS, 32, backup)
+    return speed
@@ -0,0 +1,68 @@
+"""
+Сравнение скорости передачи буферов в ОЗУ МК списком Tcl (write_memory)
+и через временный файл и load_image.
+
+Без аргументов измеряются затраты на стороне скрипта с заглушкой Tcl сервера.
+Для измерения с реальным МК укажите порт запущенного OpenOCD:
+
+    python benchmarks/bench_transfer.py --openocd-port 6666
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from tclrpc import OpenOcdTclRpc  # noqa: E402
+from transfer import TransferMode  # noqa: E402
+from benchmarks.stub_server import TclStubServer  # noqa: E402
+
+
+RAM_BUFFER_OFFSET = 0x02001000
+
+default_sizes = [256, 1024, 4 * 1024, 8 * 1024]
+
+
+def measure(host: str, port: int, mode: TransferMode, data: List[int], repeat: int) -> float:
+    with OpenOcdTclRpc(host, port, mode) as openocd:
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            openocd.write_buffer(RAM_BUFFER_OFFSET, data)
+        return (time.perf_counter() - start_time) / repeat
+
+
+def run(host: str, port: int, sizes: List[int], repeat: int):
+    print(f"{'size':>8} {'tcl-text, kB/s':>16} {'load-image, kB/s':>18} {'speedup':>8}")
+    for size in sizes:
+        data = [random.randrange(256) for _ in range(size)]
+        text_time = measure(host, port, TransferMode.TCL_TEXT, data, repeat)
+        image_time = measure(host, port, TransferMode.LOAD_IMAGE, data, repeat)
+        print(f"{size:>8} {size / (text_time * 1024):>16.1f} "
+              f"{size / (image_time * 1024):>18.1f} {text_time / image_time:>8.2f}")
+
+
+def createParser():
+    parser = argparse.ArgumentParser(
+        prog='bench_transfer.py',
+        description='Сравнение способов передачи буферов в ОЗУ МК'
+    )
+    parser.add_argument('--openocd-host', dest='openocd_host', default='127.0.0.1')
+    parser.add_argument('--openocd-port', dest='openocd_port', type=int, default=None,
+                        help='Порт Tcl сервера запущенного OpenOCD. По умолчанию используется заглушка')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=20)
+    parser.add_argument('--sizes', dest='sizes', type=int, nargs='+', default=default_sizes)
+    return parser
+
+
+if __name__ == '__main__':
+    namespace = createParser().parse_args()
+
+    if namespace.openocd_port is None:
+        with TclStubServer() as stub:
+            print("Using Tcl server stub, only host side time is measured")
+            run(stub.host, stub.port, namespace.sizes, namespace.repeat)
+    else:
+        run(namespace.openocd_host, namespace.openocd_port, namespace.sizes, namespace.repeat)
@@ -0,0 +1,162 @@
+import socket
+import threading
+from typing import Union
+
+from gdbrsp import GdbRspClient, rsp_checksum
+
+
+def rsp_unescape(data: bytes) -> bytes:
+    """Обратное преобразование к gdbrsp.rsp_escape"""
+    out = bytearray()
+    i = 0
+    while i < data.__len__():
+        if data[i] == 0x7D:
+            out.append(data[i + 1] ^ 0x20)
+            i += 2
+        else:
+            out.append(data[i])
+            i += 1
+    return bytes(out)
+
+
+class GdbStubServer:
+    """
+    Заглушка GDB сервера OpenOCD на локальном порту.
+    Поддерживает пакеты qSupported, QStartNoAckMode, чтение (m) и запись (X, M)
+    памяти модели МК, запись регистров (P), продолжение (c) и остановку (0x03)
+    с немедленным ответом об остановке, точки наблюдения (Z2-Z4, z2-z4).
+    Память - модель benchmarks.sim_target.SimulatedTarget, выровненные данные
+    передаются ей словами, как командами write_memory и read_memory через Tcl;
+    без модели чтение возвращает нули.
+    С binary_write=False пакеты X не поддерживаются, как в старых GDB серверах
+    """
+
+    PACKET_SIZE = 0x4000
+
+    def __init__(self, target=None, host: str = '127.0.0.1', no_ack=True, binary_write=True):
+        self.target = target
+        self.no_ack_supported = no_ack
+        self.binary_write = binary_write
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, 0))
+        self.server.listen(1)
+        self.host = host
+        self.port = self.server.getsockname()[1]
+        self.packets = 0
+        self.registers = {}
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn: socket.socket):
+        data = bytes()
+        no_ack = False
+        with conn:
+            while True:
+                chunk = conn.recv(GdbRspClient.BUFFER_SIZE)
+                if not chunk:
+                    return
+                data += chunk
+                while data:
+                    if data[:1] in (b'+', b'-'):
+                        data = data[1:]
+                        continue
+                    if data[:1] == b'\x03':
+                        data = data[1:]
+                        self._send(conn, b'T02')
+                        continue
+
+                    start = data.find(b'$')
+                    end = data.find(b'#', start + 1) if start >= 0 else -1
+                    if start < 0 or end < 0 or data.__len__() < end + 3:
+                        break
+                    payload = data[start + 1:end]
+                    checksum = int(data[end + 1:end + 3], base=16)
+                    data = data[end + 3:]
+
+                    if rsp_checksum(payload) != checksum:
+                        conn.sendall(b'-')
+                        continue
+                    if not no_ack:
+                        conn.sendall(b'+')
+
+                    self.packets += 1
+                    reply = self.reply(payload)
+                    if reply is not None:
+                        self._send(conn, reply)
+                    if payload == b'QStartNoAckMode' and reply == b'OK':
+                        no_ack = True
+
+    def _send(self, conn: socket.socket, payload: bytes):
+        conn.sendall(b'$' + payload + b'#' + b'%02x' % rsp_checksum(payload))
+
+    def _read(self, address: int, size: int) -> bytes:
+        if self.target is None:
+            return bytes(size)
+        if address % 4 == 0 and size % 4 == 0:
+            return b''.join(self.target.read(address + offset, 32).to_bytes(4, 'little')
+                            for offset in range(0, size, 4))
+        return self.target.read_bytes(address, size)
+
+    def _write(self, address: int, data: bytes):
+        if self.target is None:
+            return
+        if address % 4 == 0 and data.__len__() % 4 == 0:
+            for offset in range(0, data.__len__(), 4):
+                self.target.write(address + offset, 32, int.from_bytes(data[offset:offset + 4], 'little'))
+        else:
+            self.target.write_bytes(address, data)
+
+    def reply(self, payload: bytes) -> Union[bytes, None]:
+        """Ответ на пакет, None - ответ не отправляется"""
+        try:
+            if payload.startswith(b'qSupported'):
+                features = b'PacketSize=%x' % self.PACKET_SIZE
+                if self.no_ack_supported:
+                    features += b';QStartNoAckMode+'
+                return features
+            if payload == b'QStartNoAckMode':
+                return b'OK' if self.no_ack_supported else b''
+            if payload.startswith(b'm'):
+                address, size = (int(value, 16) for value in payload[1:].split(b','))
+                return self._read(address, size).hex().encode('ascii')
+            if payload.startswith(b'X'):
+                if not self.binary_write:
+                    return b''
+                header, data = payload[1:].split(b':', 1)
+                address, size = (int(value, 16) for value in header.split(b','))
+                data = rsp_unescape(data)
+                if data.__len__() != size:
+                    return b'E01'
+                self._write(address, data)
+                return b'OK'
+            if payload.startswith(b'M'):
+                header, data = payload[1:].split(b':', 1)
+                address, size = (int(value, 16) for value in header.split(b','))
+                self._write(address, bytes.fromhex(data.decode('ascii'))[:size])
+                return b'OK'
+            if payload.startswith(b'P'):
+                number, value = payload[1:].split(b'=')
+                self.registers[int(number, 16)] = int.from_bytes(bytes.fromhex(value.decode('ascii')), 'little')
+                return b'OK'
+            if payload.startswith(b'c'):
+                return b'T05'
+            if payload[:2] in (b'Z2', b'Z3', b'Z4', b'z2', b'z3', b'z4'):
+                return b'OK'
+        except (ValueError, TypeError, AttributeError):
+            return b'E01'
+        return b''
@@ -0,0 +1,362 @@
+"""
+Набор измерений скорости скрипта: разбор HEX, формирование страниц,
+преобразования данных и полная запись EEPROM, SPIFI и ОЗУ в модель МК
+(benchmarks/sim_target.py) за заглушками Tcl и GDB серверов.
+
+Для каждого измерения записываются время (лучшее из --repeat запусков),
+число обращений к OpenOCD и объем переданных данных. Результаты сравниваются
+с бюджетами из benchmarks/budgets.json, при превышении бюджета скрипт
+завершается с кодом 1.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --compare results.json
+    python benchmarks/run_benchmarks.py --update-budgets
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Tuple, Union
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from _version import applicaton_version  # noqa: E402
+from hex_parser import FirmwareFile, MemoryType, Segment  # noqa: E402
+from mik32_debug_hal.eeprom import combine_pages  # noqa: E402
+import mik32_debug_hal.ram as ram  # noqa: E402
+from mik32_debug_hal.spifi import SPIFI  # noqa: E402
+from flash_drivers.generic_flash import GenericFlash  # noqa: E402
+from mik32_check import check_firmware  # noqa: E402
+from mik32_upload import Pages, PreparedFirmware, form_pages, mik32_sections, read_driver_images, \
+    write_firmware  # noqa: E402
+from gdbrsp import OpenOcdGdbRpc  # noqa: E402
+from tclrpc import OpenOcdTclRpc, RpcStats  # noqa: E402
+from transfer import TransferMode  # noqa: E402
+from utils import bytes2words  # noqa: E402
+from benchmarks.sim_target import SimulatedTarget  # noqa: E402
+from benchmarks.stub_server import TclStubServer  # noqa: E402
+from benchmarks.gdb_stub_server import GdbStubServer  # noqa: E402
+
+
+default_budgets_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'budgets.json')
+
+# запас бюджета времени при обновлении бюджетов: время зависит от компьютера
+TIME_BUDGET_FACTOR = 5
+TIME_BUDGET_MIN = 0.1
+
+
+@dataclass
+class BenchResult:
+    name: str
+    wall: float
+    rpc_count: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+
+def write_hex(path: str, blocks: List[Tuple[int, bytes]]):
+    """Запись блоков данных в файл Intel HEX"""
+    def record(record_type: int, address: int, data: bytes) -> str:
+        body = bytes([data.__len__(), (address >> 8) & 0xFF, address & 0xFF, record_type]) + data
+        return f":{body.hex().upper()}{(-sum(body)) & 0xFF:02X}\n"
+
+    with open(path, 'w') as f:
+        for address, data in blocks:
+            upper = -1
+            for offset in range(0, data.__len__(), 16):
+                line_address = address + offset
+                if line_address >> 16 != upper:
+                    upper = line_address >> 16
+                    f.write(record(0x04, 0, upper.to_bytes(2, 'big')))
+                f.write(record(0x00, line_address & 0xFFFF, data[offset:offset + 16]))
+        f.write(record(0x01, 0, b''))
+
+
+class BenchContext:
+    """Тестовая прошивка и заглушки Tcl и GDB серверов, общие для всех измерений"""
+
+    def __init__(self, directory: str, stub: TclStubServer, gdb_stub: GdbStubServer):
+        rng = random.Random(32)
+        self.eeprom_data = bytes(rng.randrange(256) for _ in range(8 * 1024))
+        self.spifi_data = bytes(rng.randrange(256) for _ in range(64 * 1024))
+        self.ram_data = bytes(rng.randrange(256) for _ in range(4 * 1024))
+
+        self.hex_path = os.path.join(directory, 'bench.hex')
+        write_hex(self.hex_path, [
+            (0x01000000, self.eeprom_data),
+            (0x80000000, self.spifi_data),
+            (0x02000000, self.ram_data),
+        ])
+
+        self.segments: List[Segment] = FirmwareFile(self.hex_path, mik32_sections).get_segments()
+        self.pages = form_pages(self.segments)
+        self.drivers = read_driver_images()
+        self.stub = stub
+        self.gdb_stub = gdb_stub
+        self.target = SimulatedTarget()
+
+    def connect(self, transfer_mode=TransferMode.TCL_TEXT, gdb=False) -> OpenOcdTclRpc:
+        """Подключение к новой модели МК, с gdb=True объемные данные передаются через заглушку GDB сервера"""
+        self.target = SimulatedTarget()
+        self.stub.handler = self.target.handle
+        self.gdb_stub.target = self.target
+        if gdb:
+            return OpenOcdGdbRpc(self.stub.host, self.stub.port, self.gdb_stub.port, transfer_mode)
+        return OpenOcdTclRpc(self.stub.host, self.stub.port, transfer_mode)
+
+    def upload(self, firmware: PreparedFirmware, transfer_mode=TransferMode.TCL_TEXT, use_driver=True,
+               gdb=False) -> RpcStats:
+        with self.connect(transfer_mode, gdb) as openocd:
+            if write_firmware(openocd, firmware.segments, firmware.pages,
+                              use_driver=use_driver, drivers=firmware.drivers,
+                              target_cache_path=None) != 0:
+                raise AssertionError('Upload failed')
+            return openocd.stats
+
+    def check(self, address: int, data: bytes):
+        if self.target.read_bytes(address, data.__len__()) != data:
+            raise AssertionError(f'Memory at {address:#010x} does not match the firmware')
+
+
+def bench_hex_parse(context: BenchContext):
+    FirmwareFile(context.hex_path, mik32_sections)
+
+
+def bench_form_pages(context: BenchContext):
+    form_pages(context.segments)
+
+
+def bench_bytes2words(context: BenchContext):
+    bytes2words(list(context.spifi_data))
+
+
+def bench_combine_pages(context: BenchContext):
+    combine_pages(context.pages.pages_eeprom)
+
+
+def bench_write_memory(context: BenchContext) -> RpcStats:
+    words = bytes2words(list(context.ram_data))
+    with context.connect() as openocd:
+        openocd.write_memory(0x02000000, 32, words)
+        return openocd.stats
+
+
+def _eeprom_firmware(context: BenchContext) -> PreparedFirmware:
+    return PreparedFirmware(
+        [], Pages(context.pages.pages_eeprom, {}, context.pages.bytes_eeprom, 0), context.drivers)
+
+
+def _spifi_firmware(context: BenchContext) -> PreparedFirmware:
+    return PreparedFirmware(
+        [], Pages({}, context.pages.pages_spifi, 0, context.pages.bytes_spifi), context.drivers)
+
+
+def bench_eeprom_upload(context: BenchContext) -> RpcStats:
+    stats = context.upload(_eeprom_firmware(context))
+    context.check(0x01000000, context.eeprom_data)
+    return stats
+
+
+def bench_eeprom_upload_no_driver(context: BenchContext) -> RpcStats:
+    stats = context.upload(_eeprom_firmware(context), use_driver=False)
+    context.check(0x01000000, context.eeprom_data)
+    return stats
+
+
+def bench_spifi_upload(context: BenchContext) -> RpcStats:
+    stats = context.upload(_spifi_firmware(context))
+    context.check(0x80000000, context.spifi_data)
+    return stats
+
+
+def bench_spifi_upload_load_image(context: BenchContext) -> RpcStats:
+    stats = context.upload(_spifi_firmware(context), TransferMode.LOAD_IMAGE)
+    context.check(0x80000000, context.spifi_data)
+    return stats
+
+
+def bench_spifi_upload_gdb(context: BenchContext) -> RpcStats:
+    stats = context.upload(_spifi_firmware(context), gdb=True)
+    context.check(0x80000000, context.spifi_data)
+    return stats
+
+
+def _spifi_verify(context: BenchContext, gdb=False) -> RpcStats:
+    with context.connect(gdb=gdb) as openocd:
+        context.target.write_bytes(0x80000000, context.spifi_data)
+        if GenericFlash(SPIFI(openocd)).check_pages(context.pages.pages_spifi) != 0:
+            raise AssertionError('Verify failed')
+        return openocd.stats
+
+
+def bench_spifi_verify(context: BenchContext) -> RpcStats:
+    return _spifi_verify(context)
+
+
+def bench_spifi_verify_gdb(context: BenchContext) -> RpcStats:
+    return _spifi_verify(context, gdb=True)
+
+
+def bench_spifi_crc_verify(context: BenchContext) -> RpcStats:
+    with context.connect() as openocd:
+        context.target.write_bytes(0x80000000, context.spifi_data)
+        reports = check_firmware(openocd, [], _spifi_firmware(context).pages, target_cache_path=None)
+        if reports is None or any(report.mismatches for report in reports):
+            raise AssertionError('Verify failed')
+        return openocd.stats
+
+
+def bench_ram_upload(context: BenchContext) -> RpcStats:
+    segments_ram = [segment for segment in context.segments
+                    if segment.memory is not None and segment.memory.type == MemoryType.RAM]
+    with context.connect() as openocd:
+        ram.write_segments(segments_ram, openocd)
+        stats = openocd.stats
+    context.check(0x02000000, context.ram_data)
+    return stats
+
+
+benchmarks: List[Tuple[str, Callable[[BenchContext], Union[RpcStats, None]]]] = [
+    ('hex parse 76K', bench_hex_parse),
+    ('form_pages 76K', bench_form_pages),
+    ('bytes2words 64K', bench_bytes2words),
+    ('combine_pages 8K', bench_combine_pages),
+    ('write_memory 4K', bench_write_memory),
+    ('eeprom upload 8K', bench_eeprom_upload),
+    ('eeprom no driver 8K', bench_eeprom_upload_no_driver),
+    ('spifi upload 64K', bench_spifi_upload),
+    ('spifi load_image 64K', bench_spifi_upload_load_image),
+    ('spifi gdb 64K', bench_spifi_upload_gdb),
+    ('spifi verify 64K', bench_spifi_verify),
+    ('spifi gdb verify 64K', bench_spifi_verify_gdb),
+    ('spifi crc verify 64K', bench_spifi_crc_verify),
+    ('ram upload 4K', bench_ram_upload),
+]
+
+
+def run(context: BenchContext, repeat: int, selected: Union[List[str], None] = None) -> List[BenchResult]:
+    results: List[BenchResult] = []
+    for name, bench in benchmarks:
+        if selected and name not in selected:
+            continue
+
+        best = None
+        stats = None
+        for _ in range(repeat):
+            with redirect_stdout(io.StringIO()):
+                start_time = time.perf_counter()
+                stats = bench(context)
+                wall = time.perf_counter() - start_time
+            best = wall if best is None else min(best, wall)
+
+        result = BenchResult(name, best)
+        if stats is not None:
+            result.rpc_count = stats.commands
+            result.bytes_sent = stats.bytes_sent
+            result.bytes_received = stats.bytes_received
+        results.append(result)
+    return results
+
+
+def check_budgets(results: List[BenchResult], budgets: Dict[str, Dict]) -> List[str]:
+    """Список превышений бюджетов числа обращений и времени"""
+    violations: List[str] = []
+    for result in results:
+        budget = budgets.get(result.name)
+        if budget is None:
+            continue
+        if result.rpc_count > budget.get('rpc', result.rpc_count):
+            violations.append(f"{result.name}: {result.rpc_count} RPC, budget {budget['rpc']}")
+        if result.wall > budget.get('time', result.wall):
+            violations.append(f"{result.name}: {result.wall:.3f} s, budget {budget['time']} s")
+    return violations
+
+
+def make_budgets(results: List[BenchResult]) -> Dict[str, Dict]:
+    return {
+        result.name: {
+            'rpc': result.rpc_count,
+            'time': round(max(result.wall * TIME_BUDGET_FACTOR, TIME_BUDGET_MIN), 3),
+        } for result in results
+    }
+
+
+def print_results(results: List[BenchResult], budgets: Dict[str, Dict], previous: Dict[str, Dict]):
+    print(f"{'Benchmark':<22} {'Time, ms':>9} {'Budget':>8} {'RPC':>6} {'Budget':>6} "
+          f"{'Sent':>9} {'Received':>9} {'Change':>8}")
+    for result in results:
+        budget = budgets.get(result.name, {})
+        change = ''
+        if result.name in previous and previous[result.name]['wall'] > 0:
+            change = f"{(result.wall / previous[result.name]['wall'] - 1) * 100:+.0f}%"
+        print(f"{result.name:<22} {result.wall * 1000:>9.2f} {budget.get('time', 0) * 1000:>8.0f} "
+              f"{result.rpc_count:>6} {budget.get('rpc', ''):>6} "
+              f"{result.bytes_sent:>9} {result.bytes_received:>9} {change:>8}")
+
+
+def createParser():
+    parser = argparse.ArgumentParser(
+        prog='run_benchmarks.py',
+        description='Измерение скорости скрипта с бюджетами числа обращений к OpenOCD и времени'
+    )
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3,
+                        help='Число запусков каждого измерения, учитывается лучшее время. По умолчанию: 3')
+    parser.add_argument('--output', dest='output', default=None,
+                        help='Путь к файлу JSON для записи результатов')
+    parser.add_argument('--compare', dest='compare', default=None,
+                        help='Путь к файлу JSON с результатами предыдущего запуска для сравнения')
+    parser.add_argument('--budgets', dest='budgets', default=default_budgets_path,
+                        help=f"Путь к файлу бюджетов. По умолчанию: {default_budgets_path}")
+    parser.add_argument('--update-budgets', dest='update_budgets', action='store_true', default=False,
+                        help='Записать бюджеты по результатам текущего запуска')
+    parser.add_argument('benchmarks', nargs='*', help='Имена измерений. По умолчанию: все')
+    return parser
+
+
+if __name__ == '__main__':
+    namespace = createParser().parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='mik32-bench-') as directory, TclStubServer() as stub, \
+            GdbStubServer() as gdb_stub:
+        results = run(BenchContext(directory, stub, gdb_stub), namespace.repeat, namespace.benchmarks)
+
+    budgets: Dict[str, Dict] = {}
+    if os.path.exists(namespace.budgets):
+        with open(namespace.budgets, 'r', encoding='utf-8') as f:
+            budgets = json.load(f)
+
+    previous: Dict[str, Dict] = {}
+    if namespace.compare is not None:
+        with open(namespace.compare, 'r', encoding='utf-8') as f:
+            previous = {result['name']: result for result in json.load(f)['results']}
+
+    if namespace.update_budgets:
+        budgets.update(make_budgets(results))
+        with open(namespace.budgets, 'w', encoding='utf-8') as f:
+            json.dump(budgets, f, indent=2)
+            f.write('\n')
+        print(f"Budgets written to {namespace.budgets}")
+
+    print_results(results, budgets, previous)
+
+    if namespace.output is not None:
+        with open(namespace.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': applicaton_version,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': [asdict(result) for result in results],
+            }, f, indent=2)
+        print(f"Results written to {namespace.output}")
+
+    violations = check_budgets(results, budgets)
+    for violation in violations:
+        print(f"ERROR: Budget exceeded: {violation}")
+    sys.exit(1 if violations else 0)
@@ -0,0 +1,185 @@
+import re
+import zlib
+from typing import Dict, List, Tuple, Union
+
+import mik32_debug_hal.registers.memory_map as mem_map
+import mik32_debug_hal.registers.bitfields.eeprom as eeprom_fields
+
+
+_RE_WRAPPED_COMMAND = re.compile(r'^set _code \[catch \{(.*)\} _msg\];expr', re.DOTALL)
+_RE_SET_REG_T6 = re.compile(r'\{t6 (\S+)\}')
+_RE_SET_REG_CRC = re.compile(r'\{a0 (\S+) a1 (\S+) a2 (\S+)\}')
+
+
+class SimulatedTarget:
+    """
+    Упрощенная модель MIK32 за Tcl сервером OpenOCD для измерений без отладчика.
+
+    Моделируются EEPROM, ОЗУ и флеш память SPIFI, регистры установки и сброса
+    тактирования PM, контроллер EEPROM (буфер EEDAT, стирание и запись страниц),
+    драйверы EEPROM и SPIFI в ОЗУ (запуск resume выполняет запись по слову
+    статуса или сектору в t6), программа подсчета CRC mik32_debug_hal.crc
+    (запуск resume после установки a0, a1, a2), процедуры Tcl контроллера EEPROM из
+    mik32_debug_hal.eeprom. Обмен по SPIFI и DMA не моделируется: чтение
+    регистров возвращает 0, флеш память всегда готова
+    """
+
+    EEPROM_DRIVER_STATUS = 0x02003800
+    EEPROM_DRIVER_BUFFER = 0x02001800
+    SPIFI_DRIVER_STATUS = 0x02003000
+    SPIFI_DRIVER_BUFFER = 0x02002000
+    SPIFI_SECTOR_SIZE = 4 * 1024
+
+    def __init__(self):
+        self.regions: List[Tuple[int, bytearray]] = [
+            (0x01000000, bytearray(8 * 1024)),
+            (0x02000000, bytearray(16 * 1024)),
+            (0x80000000, bytearray(8 * 1024 * 1024)),
+        ]
+        self.registers: Dict[int, int] = {}
+        self.eeprom_address = 0
+        self.eeprom_buffer: List[int] = []
+        self.sector: int = -1
+        self.crc_regions: Union[Tuple[int, int], None] = None
+        self.commands: Dict[str, int] = {}
+
+    def _region(self, address: int, size: int):
+        for base, memory in self.regions:
+            if base <= address and address + size <= base + memory.__len__():
+                return memory, address - base
+        return None, 0
+
+    def read(self, address: int, width: int) -> int:
+        if address == mem_map.EEPROM_REGS_EEDAT and width == 32:
+            value = self.read(0x01000000 + self.eeprom_address, 32)
+            self.eeprom_address += 4
+            return value
+
+        memory, offset = self._region(address, width // 8)
+        if memory is None:
+            return self.registers.get(address, 0)
+        return int.from_bytes(memory[offset:offset + width // 8], 'little')
+
+    def write(self, address: int, width: int, value: int):
+        pm_set_clear = {
+            mem_map.PM_Clk_AHB_Set_OFFSET: (mem_map.PM_Clk_AHB_Set_OFFSET, True),
+            mem_map.PM_Clk_AHB_Clear_OFFSET: (mem_map.PM_Clk_AHB_Set_OFFSET, False),
+            mem_map.PM_Clk_APB_M_Set_OFFSET: (mem_map.PM_Clk_APB_M_Set_OFFSET, True),
+            mem_map.PM_Clk_APB_M_Clear_OFFSET: (mem_map.PM_Clk_APB_M_Set_OFFSET, False),
+            mem_map.PM_Clk_APB_P_Set_OFFSET: (mem_map.PM_Clk_APB_P_Set_OFFSET, True),
+            mem_map.PM_Clk_APB_P_Clear_OFFSET: (mem_map.PM_Clk_APB_P_Set_OFFSET, False),
+        }
+        if address in pm_set_clear:
+            register, is_set = pm_set_clear[address]
+            current = self.registers.get(register, 0)
+            self.registers[register] = (current | value) if is_set else (current & ~value & 0xFFFFFFFF)
+            return
+
+        if address == mem_map.EEPROM_REGS_EEA:
+            self.eeprom_address = value
+            self.eeprom_buffer = []
+        elif address == mem_map.EEPROM_REGS_EEDAT:
+            self.eeprom_buffer.append(value)
+        elif address == mem_map.EEPROM_REGS_EECON and value & (1 << eeprom_fields.EECON_EX_S):
+            self._eeprom_operation(value)
+
+        memory, offset = self._region(address, width // 8)
+        if memory is None:
+            self.registers[address] = value
+            return
+        memory[offset:offset + width // 8] = value.to_bytes(width // 8, 'little')
+
+    def _eeprom_operation(self, eecon: int):
+        op = (eecon >> eeprom_fields.EECON_OP_S) & 0b11
+        eeprom = self.regions[0][1]
+        if op == eeprom_fields.OP_ER:
+            eeprom[:] = bytes(eeprom.__len__())
+        elif op == eeprom_fields.OP_PR:
+            for i, word in enumerate(self.eeprom_buffer):
+                offset = self.eeprom_address + i * 4
+                eeprom[offset:offset + 4] = word.to_bytes(4, 'little')
+        self.eeprom_buffer = []
+
+    def write_bytes(self, address: int, data: bytes):
+        memory, offset = self._region(address, data.__len__())
+        memory[offset:offset + data.__len__()] = data
+
+    def read_bytes(self, address: int, size: int) -> bytes:
+        memory, offset = self._region(address, size)
+        return bytes(memory[offset:offset + size])
+
+    def _run_crc(self):
+        address, count = self.crc_regions
+        for entry in range(address, address + count * 8, 8):
+            region, size = self.read(entry, 32), self.read(entry + 4, 32)
+            self.write(entry + 4, 32, zlib.crc32(self.read_bytes(region, size)))
+        self.crc_regions = None
+
+    def _run_driver(self):
+        status = self.read(self.EEPROM_DRIVER_STATUS, 32)
+        if status & 0xFF == 1:
+            size = ((status >> 8) & 0x3F) * 128
+            self.write_bytes(0x01000000, self.read_bytes(self.EEPROM_DRIVER_BUFFER, size))
+            self.write(self.EEPROM_DRIVER_STATUS, 32, 0)
+
+        if self.sector >= 0:
+            self.write_bytes(0x80000000 + self.sector,
+                             self.read_bytes(self.SPIFI_DRIVER_BUFFER, self.SPIFI_SECTOR_SIZE))
+            self.write(self.SPIFI_DRIVER_STATUS, 32, 0)
+            self.sector = -1
+
+    def execute(self, cmd: str) -> str:
+        if cmd.startswith('capture '):
+            cmd = cmd[len('capture '):].strip('"')
+
+        words = cmd.split()
+        self.commands[words[0]] = self.commands.get(words[0], 0) + 1
+
+        if words[0] == 'write_memory':
+            address, width = int(words[1], 0), int(words[2])
+            data = cmd[cmd.index('{') + 1:cmd.rindex('}')].split()
+            for i, value in enumerate(data):
+                self.write(address + i * width // 8, width, int(value, 0))
+        elif words[0] == 'read_memory':
+            address, width, count = int(words[1], 0), int(words[2]), int(words[3])
+            return ' '.join(f"{self.read(address + i * width // 8, width):#x}" for i in range(count))
+        elif words[0] == 'load_image':
+            path = cmd[cmd.index('{') + 1:cmd.index('}')]
+            arguments = cmd[cmd.index('}') + 1:].split()
+            if arguments and arguments[-1] == 'bin':
+                with open(path, 'rb') as f:
+                    self.write_bytes(int(arguments[0], 0), f.read())
+        elif words[0] == 'set_reg':
+            match = _RE_SET_REG_T6.search(cmd)
+            if match is not None:
+                self.sector = int(match.group(1), 0)
+            match = _RE_SET_REG_CRC.search(cmd)
+            if match is not None:
+                self.crc_regions = (int(match.group(1), 0), int(match.group(2), 0))
+        elif words[0] == 'resume':
+            if self.crc_regions is not None:
+                self._run_crc()
+            else:
+                self._run_driver()
+        elif words[0] == 'mik32_eeprom_execute':
+            data = cmd[cmd.index('{') + 1:cmd.rindex('}')].split()
+            control = cmd[cmd.rindex('}') + 1:].split()
+            self.write(mem_map.EEPROM_REGS_EEA, 32, int(words[1], 0))
+            self.write(mem_map.EEPROM_REGS_EECON, 32, int(words[2], 0))
+            for value in data:
+                self.write(mem_map.EEPROM_REGS_EEDAT, 32, int(value, 0))
+            self.write(mem_map.EEPROM_REGS_EECON, 32, int(control[0], 0))
+        elif words[0] == 'mik32_eeprom_read':
+            self.write(mem_map.EEPROM_REGS_EEA, 32, int(words[1], 0))
+            return ' '.join(f"{self.read(mem_map.EEPROM_REGS_EEDAT, 32):#x}" for _ in range(int(words[2])))
+
+        return ''
+
+    def handle(self, wrapped: str) -> str:
+        """Обработчик для TclStubServer: команда в обертке OpenOcdTclRpc.run"""
+        match = _RE_WRAPPED_COMMAND.match(wrapped)
+        cmd = match.group(1) if match is not None else wrapped
+        try:
+            return '0 ' + self.execute(cmd)
+        except (ValueError, IndexError) as e:
+            return f'1 {e!r}'
@@ -0,0 +1,59 @@
+import socket
+import threading
+from typing import Callable, Union
+
+from tclrpc import OpenOcdTclRpc
+
+
+class TclStubServer:
+    """
+    Заглушка Tcl сервера OpenOCD на локальном порту.
+    На каждую команду отвечает результатом обработчика, по умолчанию
+    успешным пустым ответом. Используется для измерения затрат на стороне скрипта
+    """
+
+    def __init__(self, handler: Union[Callable[[str], str], None] = None, host: str = '127.0.0.1'):
+        self.handler = handler if handler is not None else (lambda cmd: '0 ')
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, 0))
+        self.server.listen(1)
+        self.host = host
+        self.port = self.server.getsockname()[1]
+        self.commands = 0
+        self.bytes_received = 0
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn: socket.socket):
+        data = bytes()
+        with conn:
+            while True:
+                chunk = conn.recv(OpenOcdTclRpc.BUFFER_SIZE)
+                if not chunk:
+                    return
+                data += chunk
+                while True:
+                    index = data.find(OpenOcdTclRpc.SEPARATOR_BYTES)
+                    if index < 0:
+                        break
+                    cmd = data[:index].decode('utf-8')
+                    data = data[index + 1:]
+                    self.commands += 1
+                    self.bytes_received += index + 1
+                    reply = self.handler(cmd)
+                    conn.sendall(reply.encode('utf-8') + OpenOcdTclRpc.SEPARATOR_BYTES)
@@ -0,0 +1,164 @@
+from enum import Enum
+from typing import Dict, List, NamedTuple, Tuple, Union
+
+import flash_drivers.sfdp as sfdp
+
+
+# Возможности внешней флеш памяти: объем и команды стирания, способ установки
+# бита QE, команды чтения и программирования Quad SPI. Параметры берутся
+# из SFDP и дополняются встроенной таблицей по JEDEC ID: в BFPT нет команды
+# программирования Quad SPI, а для микросхем без SFDP таблица задает
+# все параметры. Для неизвестных микросхем без SFDP используются команды W25Q.
+
+
+class QuadEnable(Enum):
+    """Способ установки бита QE, значения поля QER DWORD 15 BFPT"""
+    NONE = 0                # бита QE нет, Quad SPI доступен всегда
+    SR2_BIT1_NO_READ = 1    # бит 1 SR2, запись 01h двумя байтами
+    SR1_BIT6 = 2            # бит 6 SR1, запись 01h одним байтом
+    SR2_BIT7 = 3            # бит 7 SR2, чтение 3Fh, запись 3Eh
+    SR2_BIT1 = 4            # бит 1 SR2, запись 01h двумя байтами
+    SR2_BIT1_READ_35 = 5    # бит 1 SR2, чтение 35h, запись 01h двумя байтами
+    SR2_BIT1_WRITE_31 = 6   # бит 1 SR2, чтение 35h, запись 31h
+
+
+class Lines(Enum):
+    """Линии команды Quad SPI после кода команды"""
+    DATA = '1-1-4'          # адрес по одной линии, данные по четырем
+    ADDRESS_DATA = '1-4-4'  # адрес и данные по четырем линиям
+
+
+class QuadCommand(NamedTuple):
+    """Команда Quad SPI: код, линии и число промежуточных байт SPIFI (INTLEN)"""
+    opcode: int
+    lines: Lines
+    dummy_bytes: int = 0
+
+
+class FlashCapabilities(NamedTuple):
+    name: str
+    geometry: sfdp.FlashGeometry
+    quad_enable: QuadEnable
+    # None - микросхема не поддерживает команду, используется Single SPI
+    quad_read: Union[QuadCommand, None]
+    quad_program: Union[QuadCommand, None]
+
+
+class TableEntry(NamedTuple):
+    """Строка встроенной таблицы, None - значение из SFDP или по умолчанию"""
+    name: str
+    quad_enable: Union[QuadEnable, None] = None
+    quad_program: Union[QuadCommand, None] = None
+
+
+QUAD_PAGE_PROGRAM = QuadCommand(0x32, Lines.DATA)
+
+# W25Q64 и совместимые
+DEFAULT_CAPABILITIES = FlashCapabilities(
+    name='W25Q compatible',
+    geometry=sfdp.DEFAULT_GEOMETRY,
+    quad_enable=QuadEnable.SR2_BIT1_READ_35,
+    quad_read=QuadCommand(0x6B, Lines.DATA, 1),
+    quad_program=QUAD_PAGE_PROGRAM,
+)
+
+# значения для всех микросхем производителя по первому байту JEDEC ID
+VENDORS: Dict[int, TableEntry] = {
+    0xEF: TableEntry('Winbond', QuadEnable.SR2_BIT1_READ_35, QUAD_PAGE_PROGRAM),
+    0xC8: TableEntry('GigaDevice', QuadEnable.SR2_BIT1_READ_35, QUAD_PAGE_PROGRAM),
+    0xC2: TableEntry('Macronix', QuadEnable.SR1_BIT6, QuadCommand(0x38, Lines.ADDRESS_DATA)),
+    0x9D: TableEntry('ISSI', QuadEnable.SR1_BIT6, QUAD_PAGE_PROGRAM),
+}
+
+# отдельные микросхемы по полному JEDEC ID, значения важнее значений производителя
+PARTS: Dict[Tuple[int, int, int], TableEntry] = {
+    (0xEF, 0x40, 0x16): TableEntry('W25Q32'),
+    (0xEF, 0x40, 0x17): TableEntry('W25Q64'),
+    (0xEF, 0x40, 0x18): TableEntry('W25Q128'),
+    (0xEF, 0x70, 0x17): TableEntry('W25Q64JV-IM'),
+    (0xC8, 0x40, 0x17): TableEntry('GD25Q64'),
+    (0xC2, 0x20, 0x17): TableEntry('MX25L64'),
+    (0x9D, 0x60, 0x17): TableEntry('IS25LP064'),
+}
+
+# максимальное число промежуточных байт SPIFI (поле INTLEN)
+MAX_DUMMY_BYTES = 7
+
+
+def capacity_size(jedec_id: List[int]) -> Union[int, None]:
+    """Объем по третьему байту JEDEC ID (степень двойки), до 16 Мбайт"""
+    if 0x10 <= jedec_id[2] <= 0x18:
+        return 1 << jedec_id[2]
+    return None
+
+
+def quad_read_command(data: bytes) -> Union[QuadCommand, None]:
+    """
+    Команда чтения Quad SPI из BFPT: 1-1-4, иначе 1-4-4. Такты после адреса
+    передаются промежуточными байтами, поэтому их число должно быть кратно байту
+    """
+    fast_read = sfdp.fast_read_quad_output(data)
+    if fast_read is not None and fast_read.dummy_clocks % 8 == 0 \
+            and fast_read.dummy_clocks // 8 <= MAX_DUMMY_BYTES:
+        return QuadCommand(fast_read.opcode, Lines.DATA, fast_read.dummy_clocks // 8)
+
+    # промежуточные байты 1-4-4 передаются по четырем линиям, 2 такта на байт
+    fast_read = sfdp.fast_read_quad_io(data)
+    if fast_read is not None and fast_read.dummy_clocks % 2 == 0 \
+            and fast_read.dummy_clocks // 2 <= MAX_DUMMY_BYTES:
+        return QuadCommand(fast_read.opcode, Lines.ADDRESS_DATA, fast_read.dummy_clocks // 2)
+    return None
+
+
+def lookup(jedec_id: List[int], data: bytes = b'') -> FlashCapabilities:
+    """
+    Возможности микросхемы по JEDEC ID и SFDP.
+    @data: SFDP, начиная с адреса 0 (GenericFlash.read_sfdp), пустая строка -
+    SFDP не поддерживается
+    """
+    vendor = VENDORS.get(jedec_id[0])
+    part = PARTS.get((jedec_id[0], jedec_id[1], jedec_id[2]))
+    entries = [entry for entry in (part, vendor) if entry is not None]
+
+    def table(field: str):
+        return next((getattr(entry, field) for entry in entries if getattr(entry, field) is not None), None)
+
+    if part is not None:
+        name = part.name
+    elif vendor is not None:
+        name = f"{vendor.name} {bytes(jedec_id).hex()}"
+    else:
+        name = f"JEDEC ID {bytes(jedec_id).hex()}"
+
+    geometry = sfdp.parse_geometry(data)
+    if geometry is None:
+        geometry = DEFAULT_CAPABILITIES.geometry
+        # объем по JEDEC ID только для известных производителей
+        size = capacity_size(jedec_id)
+        if entries and size is not None:
+            geometry = geometry._replace(size=size)
+
+    quad_enable: Union[QuadEnable, None] = None
+    try:
+        requirement = sfdp.quad_enable_requirement(data)
+        if requirement is not None:
+            quad_enable = QuadEnable(requirement)
+    except ValueError:
+        pass  # зарезервированное значение QER
+    if quad_enable is None:
+        quad_enable = table('quad_enable')
+    if quad_enable is None:
+        quad_enable = DEFAULT_CAPABILITIES.quad_enable
+
+    # с SFDP команда чтения берется из BFPT, даже если Quad SPI не поддерживается
+    if sfdp.bfpt(data):
+        quad_read = quad_read_command(data)
+    else:
+        quad_read = DEFAULT_CAPABILITIES.quad_read
+
+    # команды программирования Quad SPI в BFPT нет
+    quad_program = table('quad_program')
+    if quad_program is None and quad_read is not None:
+        quad_program = DEFAULT_CAPABILITIES.quad_program
+
+    return FlashCapabilities(name, geometry, quad_enable, quad_read, quad_program)
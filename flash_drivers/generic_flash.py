@@ -3,11 +3,16 @@ import os
 import pathlib
 import sys
 import time
-from typing import Dict, List, Union
-from tclrpc import OpenOcdTclRpc
+from typing import Callable, Dict, Iterator, List, Set, Tuple, Union
+from tclrpc import OpenOcdTclRpc, TclException
 from mik32_debug_hal.spifi import SPIFI
 # import mik32_debug_hal.spifi as spifi
 import mik32_debug_hal.dma as dma
+import mik32_debug_hal.ram as ram
+import flash_drivers.sfdp as sfdp
+from flash_drivers.capabilities import DEFAULT_CAPABILITIES, FlashCapabilities, Lines, QuadCommand, QuadEnable
+import profiler
+import progress
 
 
 class GenericFlash():
@@ -37,10 +42,16 @@ class GenericFlash():
     READ_SREG1_COMMAND = 0x05
     READ_SREG2_COMMAND = 0x35
     WRITE_SREG_COMMAND = 0x01
+    # SR2 с битом QE 7 читается и записывается отдельными командами
+    READ_SREG2_BIT7_COMMAND = 0x3F
+    WRITE_SREG2_BIT7_COMMAND = 0x3E
+    WRITE_SREG2_COMMAND = 0x31
 
     SREG2_QUAD_ENABLE = 9
     SREG2_QUAD_ENABLE_S = (SREG2_QUAD_ENABLE-8)
     SREG2_QUAD_ENABLE_M = 1 << SREG2_QUAD_ENABLE_S
+    SREG1_QUAD_ENABLE_BIT6_M = 1 << 6
+    SREG2_QUAD_ENABLE_BIT7_M = 1 << 7
 
     PAGE_PROGRAM_COMMAND = 0x02
 
@@ -61,37 +72,62 @@ class GenericFlash():
 
     openocd: OpenOcdTclRpc
     spifi: SPIFI
+    capabilities: FlashCapabilities
 
-    def __init__(self, spifi: SPIFI):
+    # стирание планируется секторами по 4 Кбайт, более крупные блоки
+    # используются, если все их секторы стираются
+    SECTOR_SIZE = 4 * 1024
+
+    # буфер сектора и слово статуса драйвера записи в ОЗУ
+    DRIVER_BUFFER = 0x02002000
+    DRIVER_STATUS = 0x02003000
+
+    def __init__(self, spifi: SPIFI, capabilities: Union[FlashCapabilities, None] = None):
+        """
+        @capabilities: объем, команды стирания и Quad SPI флеш памяти, например
+        по SFDP (target_probe.probe_flash), по умолчанию - как у W25Q64
+        """
         self.spifi = spifi
         self.openocd = self.spifi.openocd
+        self.capabilities = capabilities if capabilities is not None else DEFAULT_CAPABILITIES
+        self.jedec_id: Union[List[int], None] = None
 
         # self.init()
 
+    @property
+    def geometry(self) -> sfdp.FlashGeometry:
+        return self.capabilities.geometry
+
     def write_enable(self):
         self.spifi.send_command(self.WRITE_ENABLE_COMMAND,
                                 self.spifi.Frameform.OPCODE_NOADDR, self.spifi.Fieldform.ALL_SERIAL)
 
-    def read_sreg(self, sreg: SREG_Num) -> int:
+    def read_status(self, command: int) -> int:
         return self.spifi.send_command(
-            self.READ_SREG1_COMMAND | sreg.value,
+            command,
             self.spifi.Frameform.OPCODE_NOADDR,
             self.spifi.Fieldform.ALL_SERIAL,
             byte_count=1
         )[0]
 
-    def write_sreg(self, sreg1: int, sreg2: int):
+    def read_sreg(self, sreg: SREG_Num) -> int:
+        return self.read_status(self.READ_SREG1_COMMAND | sreg.value)
+
+    def write_status(self, command: int, data: List[int]):
         self.write_enable()
         self.spifi.send_command(
-            self.WRITE_SREG_COMMAND,
+            command,
             self.spifi.Frameform.OPCODE_NOADDR,
             self.spifi.Fieldform.ALL_SERIAL,
-            byte_count=2,
+            byte_count=data.__len__(),
             direction=self.spifi.Direction.WRITE,
-            data=[sreg1, sreg2]
+            data=data
         )
         self.wait_busy()
 
+    def write_sreg(self, sreg1: int, sreg2: int):
+        self.write_status(self.WRITE_SREG_COMMAND, [sreg1, sreg2])
+
     def wait_busy(self):
         while 1:
             sreg1 = self.read_sreg(self.SREG_Num.SREG1)
@@ -114,22 +150,118 @@ class GenericFlash():
                                 self.spifi.Frameform.OPCODE_NOADDR, self.spifi.Fieldform.ALL_PARALLEL)
         time.sleep(self.RESET_DELAY)
 
+    def identify(self) -> List[int]:
+        """
+        Сброс микросхемы в режим SPI и чтение JEDEC ID. Выполняется один раз
+        для экземпляра, повторные вызовы возвращают прочитанный ID
+        """
+        if self.jedec_id is None:
+            # Сбрасываем микросхему в режиме QPI из всех состояний в нормальный SPI режим.
+            self.chip_reset_qpi()
+
+            # Сбрасываем микросхему в режиме SPI из всех состояний в нормальный SPI режим.
+            self.chip_reset()
+
+            self.jedec_id = self.spifi.send_command(self.JEDEC_ID_COMMAND,
+                                                    self.spifi.Frameform.OPCODE_NOADDR, self.spifi.Fieldform.ALL_SERIAL, 3)
+
+            print(
+                f"JEDEC ID = {self.jedec_id[0]:02x} {self.jedec_id[1]:02x} {self.jedec_id[2]:02x}")
+        return self.jedec_id
+
+    def read_sfdp(self, dma_instance: Union[dma.DMA, None] = None) -> bytes:
+        """
+        Чтение SFDP от адреса 0 до конца BFPT: заголовки и BFPT читаются
+        одной командой, если BFPT лежит дальше - второй.
+        @return: пустая строка, если микросхема не поддерживает SFDP
+        """
+        if dma_instance is None:
+            dma_instance = self.spifi.dma_config()
+
+        def read(address: int, byte_count: int) -> bytes:
+            return bytes(self.spifi.send_command(
+                sfdp.READ_SFDP_COMMAND, self.spifi.Frameform.OPCODE_3ADDR, self.spifi.Fieldform.ALL_SERIAL,
+                byte_count=byte_count, address=address, idata_length=1, dma=dma_instance))
+
+        data = read(0, sfdp.READ_SIZE)
+        header = sfdp.bfpt_header(data)
+        if header is None:
+            return b''
+
+        end = header.pointer + header.length
+        if end > data.__len__():
+            start = data.__len__()
+            data += read(start, (end - start + 3) & ~0x3)
+        return data[:end]
+
+    def erase_blocks(self, sectors: List[int]) -> List[Tuple[int, sfdp.EraseType]]:
+        """
+        План стирания секторов: блок стирается наибольшей командой,
+        если все его секторы входят в sectors, остальные секторы - наименьшей
+        командой не меньше сектора.
+        @return: пары адрес блока - команда стирания по возрастанию адреса
+        """
+        erase_types = [erase_type for erase_type in self.geometry.erase_types
+                       if erase_type.size >= self.SECTOR_SIZE]
+        if erase_types.__len__() == 0:
+            erase_types = [sfdp.EraseType(self.SECTOR_SIZE, self.SECTOR_ERASE_COMMAND)]
+
+        remaining = set(sectors)
+        blocks: List[Tuple[int, sfdp.EraseType]] = []
+        for index, erase_type in enumerate(sorted(erase_types, reverse=True)):
+            smallest = index == erase_types.__len__() - 1
+            for block in sorted(set(sector & ~(erase_type.size - 1) for sector in remaining)):
+                block_sectors = set(range(block, block + erase_type.size, self.SECTOR_SIZE))
+                if smallest or block_sectors <= remaining:
+                    blocks.append((block, erase_type))
+                    remaining -= block_sectors
+        return sorted(blocks)
+
+    def resume_sectors(self, sectors: List[int], skip_sectors: Set[int]) -> List[int]:
+        """
+        Секторы для продолжения записи: пропускаются записанные секторы, если
+        их не стирает наименьший блок стирания вместе с незаписанными
+        """
+        if sectors.__len__() == 0:
+            return sectors
+        remaining = [sector for sector in sectors if sector not in skip_sectors]
+        # наименьший блок стирания одинаков для всех секторов
+        _, erase_type = self.erase_blocks(sectors[:1])[0]
+        erase_size = erase_type.size
+        erased_blocks = set(sector & ~(erase_size - 1) for sector in remaining)
+        return [sector for sector in sectors
+                if sector not in skip_sectors or sector & ~(erase_size - 1) in erased_blocks]
+
     def chip_erase(self):
         print("Chip erase...", flush=True)
         self.spifi.send_command(self.CHIP_ERASE_COMMAND,
                                 self.spifi.Frameform.OPCODE_NOADDR, self.spifi.Fieldform.ALL_SERIAL)
 
-    def sector_erase(self, address: int):
-        print(f"Erase sector {address:#010x}...", flush=True)
-        self.spifi.send_command(self.SECTOR_ERASE_COMMAND,
+    def sector_erase(self, address: int, opcode: int = SECTOR_ERASE_COMMAND):
+        progress.detail(f"Erase sector {address:#010x}...")
+        self.spifi.send_command(opcode,
                                 self.spifi.Frameform.OPCODE_3ADDR, self.spifi.Fieldform.ALL_SERIAL, address=address)
 
+    def quad_fieldform(self, command: QuadCommand) -> SPIFI.Fieldform:
+        if command.lines == Lines.ADDRESS_DATA:
+            return self.spifi.Fieldform.OPCODE_SERIAL
+        return self.spifi.Fieldform.DATA_PARALLEL
+
+    def quad_supported(self, use_quad_spi: bool, command: Union[QuadCommand, None]) -> bool:
+        """Quad SPI запрошен и микросхема поддерживает команду command"""
+        if use_quad_spi and command is None:
+            print(f"WARNING: {self.capabilities.name} has no Quad SPI command, using Single SPI")
+            return False
+        return use_quad_spi
+
     def read_data(self, address: int, byte_count: int, bin_data: List[int], dma: Union[dma.DMA, None] = None, use_quad_spi=False) -> int:
         read_data: List[int] = []
 
-        if (use_quad_spi):
-            read_data = self.spifi.send_command(self.FAST_READ_QUAD_OUTPUT_COMMAND, self.spifi.Frameform.OPCODE_3ADDR,
-                                                self.spifi.Fieldform.DATA_PARALLEL, byte_count=byte_count, address=address, idata_length=1, dma=dma)
+        quad_read = self.capabilities.quad_read
+        if use_quad_spi and quad_read is not None:
+            read_data = self.spifi.send_command(quad_read.opcode, self.spifi.Frameform.OPCODE_3ADDR,
+                                                self.quad_fieldform(quad_read), byte_count=byte_count, address=address,
+                                                idata_length=quad_read.dummy_bytes, dma=dma)
         else:
             read_data = self.spifi.send_command(self.READ_DATA_COMMAND, self.spifi.Frameform.OPCODE_3ADDR,
                                                 self.spifi.Fieldform.ALL_SERIAL, byte_count=byte_count, address=address, dma=dma)
@@ -148,18 +280,20 @@ class GenericFlash():
             ByteAddress: int,
             data: List[int],
             byte_count: int,
-            progress: str = "",
-            dma: Union[dma.DMA, None] = None
+            percent: str = "",
+            dma: Union[dma.DMA, None] = None,
+            buffer_offset: Union[int, None] = None,
     ):
-        print(
-            f"Writing Flash page {ByteAddress:#010x}... {progress}", flush=True)
+        """@buffer_offset: данные страницы уже в буфере DMA, см. SPIFI.send_command"""
+        progress.detail(f"Writing Flash page {ByteAddress:#010x}... {percent}")
         if byte_count > 256:
             raise self.FlashError("Byte count more than 256")
 
         self.write_enable()
         self.spifi.send_command(self.PAGE_PROGRAM_COMMAND, self.spifi.Frameform.OPCODE_3ADDR,
                                 self.spifi.Fieldform.ALL_SERIAL, byte_count=byte_count, address=ByteAddress,
-                                idata=0, cache_limit=0, direction=self.spifi.Direction.WRITE, data=data, dma=dma)
+                                idata=0, cache_limit=0, direction=self.spifi.Direction.WRITE, data=data, dma=dma,
+                                buffer_offset=buffer_offset)
         self.wait_busy()
 
     class EraseType(Enum):
@@ -168,86 +302,223 @@ class GenericFlash():
 
     def erase(self, erase_type: EraseType = EraseType.CHIP_ERASE, sectors: List[int] = []):
         if erase_type == self.EraseType.CHIP_ERASE:
-            self.write_enable()
-            self.chip_erase()
-            self.wait_busy()
-        elif erase_type == self.EraseType.SECTOR_ERASE:
-            for sector in sectors:
+            with profiler.phase('spifi erase'):
                 self.write_enable()
-                self.sector_erase(sector)
+                self.chip_erase()
                 self.wait_busy()
+        elif erase_type == self.EraseType.SECTOR_ERASE:
+            blocks = self.erase_blocks(sectors)
+            task = progress.start('spifi erase', sum(block_type.size for _, block_type in blocks))
+            for block, block_type in blocks:
+                with profiler.phase('spifi erase', address=block):
+                    self.write_enable()
+                    self.sector_erase(block, block_type.opcode)
+                    self.wait_busy()
+                task.advance(block_type.size, block)
+            task.finish()
 
     def quad_page_program(
         self,
         ByteAddress: int,
         data: List[int],
         byte_count: int,
-        progress: str = "",
-        dma: Union[dma.DMA, None] = None
+        percent: str = "",
+        dma: Union[dma.DMA, None] = None,
+        buffer_offset: Union[int, None] = None,
     ):
-        print(f"Writing page {ByteAddress:#010x}... {progress}", flush=True)
+        """@buffer_offset: данные страницы уже в буфере DMA, см. SPIFI.send_command"""
+        progress.detail(f"Writing page {ByteAddress:#010x}... {percent}")
         if byte_count > 256:
             raise self.FlashError("Byte count more than 256")
 
+        quad_program = self.capabilities.quad_program
+        if quad_program is None:
+            raise self.FlashError(f"{self.capabilities.name} has no Quad SPI page program command")
+
         self.write_enable()
-        self.spifi.send_command(self.QUAD_PAGE_PROGRAM_COMMAND, self.spifi.Frameform.OPCODE_3ADDR,
-                                self.spifi.Fieldform.DATA_PARALLEL, byte_count=byte_count, address=ByteAddress,
-                                idata=0, cache_limit=0, direction=self.spifi.Direction.WRITE, data=data, dma=dma)
+        self.spifi.send_command(quad_program.opcode, self.spifi.Frameform.OPCODE_3ADDR,
+                                self.quad_fieldform(quad_program), byte_count=byte_count, address=ByteAddress,
+                                idata=0, cache_limit=0, idata_length=quad_program.dummy_bytes,
+                                direction=self.spifi.Direction.WRITE, data=data, dma=dma,
+                                buffer_offset=buffer_offset)
         self.wait_busy()
 
     def quad_enable(self):
-        if (self.check_quad_enable(self.openocd) != True):
+        """Установка бита QE способом, заданным для микросхемы (SFDP или таблица)"""
+        if self.check_quad_enable():
+            return
+
+        method = self.capabilities.quad_enable
+        if method == QuadEnable.SR1_BIT6:
+            self.write_status(self.WRITE_SREG_COMMAND,
+                              [self.read_sreg(self.SREG_Num.SREG1) | self.SREG1_QUAD_ENABLE_BIT6_M])
+        elif method == QuadEnable.SR2_BIT7:
+            self.write_status(self.WRITE_SREG2_BIT7_COMMAND,
+                              [self.read_status(self.READ_SREG2_BIT7_COMMAND) | self.SREG2_QUAD_ENABLE_BIT7_M])
+        elif method == QuadEnable.SR2_BIT1_WRITE_31:
+            self.write_status(self.WRITE_SREG2_COMMAND,
+                              [self.read_sreg(self.SREG_Num.SREG2) | self.SREG2_QUAD_ENABLE_M])
+        else:
             self.write_sreg(
                 self.read_sreg(self.SREG_Num.SREG1),
                 self.read_sreg(self.SREG_Num.SREG2) | self.SREG2_QUAD_ENABLE_M
             )
 
-    def check_quad_enable(self):
+    def check_quad_enable(self) -> bool:
+        method = self.capabilities.quad_enable
+        if method == QuadEnable.NONE:
+            return True
+        if method == QuadEnable.SR1_BIT6:
+            return (self.read_sreg(self.SREG_Num.SREG1) & self.SREG1_QUAD_ENABLE_BIT6_M) != 0
+        if method == QuadEnable.SR2_BIT7:
+            return (self.read_status(self.READ_SREG2_BIT7_COMMAND) & self.SREG2_QUAD_ENABLE_BIT7_M) != 0
         return (self.read_sreg(self.SREG_Num.SREG2) & self.SREG2_QUAD_ENABLE_M) != 0
 
-    def check_pages(self, pages: Dict[int, List[int]], use_quad_spi=False, use_chip_erase=False):
+    def init_memory(self, use_quad_spi=False):
+        """Режим отображения в память с командой чтения Quad SPI микросхемы или 0x03"""
+        quad_read = self.capabilities.quad_read
+        if use_quad_spi and quad_read is not None:
+            self.spifi.init_memory(quad_read.opcode, self.quad_fieldform(quad_read).value, quad_read.dummy_bytes)
+        else:
+            self.spifi.init_memory(self.READ_DATA_COMMAND)
+
+    def read_mapped_windows(self, address: int, byte_count: int, use_quad_spi=False) -> Iterator[Tuple[int, List[int]]]:
+        """
+        Чтение флеш памяти в режиме отображения в память большими окнами
+        вместо команды SPIFI на каждые 256 байт. Окна выдаются по мере чтения,
+        поэтому объем памяти не зависит от размера области.
+        @return: пары адрес окна - прочитанные байты
+        """
+        use_quad_spi = self.quad_supported(use_quad_spi, self.capabilities.quad_read)
+        if use_quad_spi:
+            self.quad_enable()
+        self.init_memory(use_quad_spi)
+
+        task = progress.start('spifi read', byte_count)
+        for window in range(address, address + byte_count, self.spifi.MEMORY_READ_WINDOW):
+            window_size = min(self.spifi.MEMORY_READ_WINDOW, address + byte_count - window)
+            with profiler.phase('spifi read', address=window):
+                data = self.spifi.read_memory_mapped(window, window_size)
+            task.advance(window_size, window)
+            yield window, data
+        task.finish()
+
+        if use_quad_spi:
+            self.spifi.init_memory()
+
+    def read_mapped(self, address: int, byte_count: int, use_quad_spi=False) -> List[int]:
+        data: List[int] = []
+        for window, window_data in self.read_mapped_windows(address, byte_count, use_quad_spi):
+            data.extend(window_data)
+        return data
+
+    def dump(self, address: int, byte_count: int, use_quad_spi=False) -> Iterator[Tuple[int, List[int]]]:
+        """Чтение флеш памяти окнами после сброса микросхемы в режим SPI"""
+        self.openocd.halt()
+        self.chip_reset_qpi()
+        self.chip_reset()
+        return self.read_mapped_windows(address, byte_count, use_quad_spi)
+
+    @staticmethod
+    def page_runs(pages: Dict[int, List[int]], limit: int) -> List[List[int]]:
+        """Группы подряд идущих страниц общим размером не больше limit байт"""
+        runs: List[List[int]] = []
+        for page_offset in sorted(pages):
+            if runs and runs[-1][-1] + 256 == page_offset and (runs[-1].__len__() + 1) * 256 <= limit:
+                runs[-1].append(page_offset)
+            else:
+                runs.append([page_offset])
+        return runs
+
+    def check_pages_mapped(self, pages: Dict[int, List[int]], use_quad_spi=False) -> int:
+        """
+        Проверка страниц чтением непрерывных участков в режиме отображения в память
+        """
+        runs = self.page_runs(pages, self.spifi.MEMORY_READ_WINDOW)
+
+        if use_quad_spi:
+            self.quad_enable()
+        self.init_memory(use_quad_spi)
+
         result = 0
+        task = progress.start('spifi verify', pages.__len__() * 256)
+        for run in runs:
+            with profiler.phase('spifi verify', address=run[0]):
+                read_data = self.spifi.read_memory_mapped(run[0], run.__len__() * 256)
+            for index, page_offset in enumerate(run):
+                page_bytes = pages[page_offset]
+                page_read = read_data[index * 256:(index + 1) * 256]
+                if page_read != page_bytes:
+                    i = next(i for i in range(256) if page_read[i] != page_bytes[i])
+                    print(f"DATA[{page_offset + i}] = {page_read[i]:#0x} expect {page_bytes[i]:#0x}", flush=True)
+                    result = 1
+                    break
+            if result:
+                task.finish(False)
+                break
+            task.advance(run.__len__() * 256, run[0])
 
-        self.openocd.halt()
-        # self.init()
+        if use_quad_spi:
+            self.spifi.init_memory()
 
-        # Сбрасываем микросхему в режиме QPI из всех состояний в нормальный SPI режим.
-        self.chip_reset_qpi()
+        if result == 0:
+            task.finish()
+            print("SPIFI pages checking completed", flush=True)
+        else:
+            print("Data error")
+        return result
 
-        # Сбрасываем микросхему в режиме SPI из всех состояний в нормальный SPI режим.
-        self.chip_reset()
+    def check_pages(self, pages: Dict[int, List[int]], use_quad_spi=False, use_chip_erase=False, memory_mapped=True):
+        """
+        Проверка страниц флеш памяти.
+        @memory_mapped: чтение в режиме отображения в память, иначе командами
+        SPIFI с передачей через DMA по 256 байт
+        """
+        result = 0
+
+        self.openocd.halt()
+        # self.init()
 
-        JEDEC_ID = self.spifi.send_command(self.JEDEC_ID_COMMAND,
-                                     self.spifi.Frameform.OPCODE_NOADDR, self.spifi.Fieldform.ALL_SERIAL, 3)
+        self.identify()
+        use_quad_spi = self.quad_supported(use_quad_spi, self.capabilities.quad_read)
 
-        print(
-            f"JEDEC ID = {JEDEC_ID[0]:02x} {JEDEC_ID[1]:02x} {JEDEC_ID[2]:02x}")
+        if memory_mapped:
+            print("Using Quad SPI" if use_quad_spi else "Using Single SPI")
+            return self.check_pages_mapped(pages, use_quad_spi)
 
         dma_instance = self.spifi.dma_config()
 
         if (use_quad_spi):
             print("Using Quad SPI")
-            self.quad_enable(self.openocd)
+            self.quad_enable()
         else:
             print("Using Single SPI")
         #    spifi_quad_disable(openocd)
 
-        pages_offsets = list(pages)
+        # страницы читаются участками до сектора за одну команду и одну цепочку передач DMA
+        runs = self.page_runs(pages, self.spifi.DMA_BUFFER_SIZE)
 
-        for index, page_offset in enumerate(pages_offsets):
-            print(
-                f"Check page {page_offset:#010x}... {(index*100)//pages_offsets.__len__()}%", flush=True)
-            page_bytes = pages[page_offset]
+        task = progress.start('spifi verify', pages.__len__() * 256)
+        for index, run in enumerate(runs):
+            progress.detail(
+                f"Check pages {run[0]:#010x}-{run[-1] + 255:#010x}... {(index*100)//runs.__len__()}%")
+            run_bytes: List[int] = []
+            for page_offset in run:
+                run_bytes.extend(pages[page_offset])
 
             result = self.read_data(
-                self.openocd, page_offset, 256, page_bytes, dma=dma_instance, use_quad_spi=use_quad_spi)
+                run[0], run_bytes.__len__(), run_bytes, dma=dma_instance, use_quad_spi=use_quad_spi)
 
             if result == 1:
+                task.finish(False)
                 print("Data error")
                 # if (use_quad_spi):
                 #    spifi_quad_disable(openocd)
                 return result
 
+            task.advance(run_bytes.__len__(), run[0])
+
+        task.finish()
         if result == 0:
             print("SPIFI pages checking completed", flush=True)
         return 0
@@ -258,32 +529,23 @@ class GenericFlash():
         self.openocd.halt()
         # self.init()
 
-        # Сбрасываем микросхему в режиме QPI из всех состояний в нормальный SPI режим.
-        self.chip_reset_qpi()
-
-        # Сбрасываем микросхему в режиме SPI из всех состояний в нормальный SPI режим.
-        self.chip_reset()
-
-        JEDEC_ID = self.spifi.send_command(self.JEDEC_ID_COMMAND,
-                                     self.spifi.Frameform.OPCODE_NOADDR, self.spifi.Fieldform.ALL_SERIAL, 3)
-
-        print(
-            f"JEDEC ID = {JEDEC_ID[0]:02x} {JEDEC_ID[1]:02x} {JEDEC_ID[2]:02x}")
+        self.identify()
+        use_quad_spi = self.quad_supported(use_quad_spi, self.capabilities.quad_program) \
+            and self.quad_supported(use_quad_spi, self.capabilities.quad_read)
 
         dma_instance = self.spifi.dma_config()
 
         if use_chip_erase:
-            self.erase(
-                self.openocd, self.EraseType.CHIP_ERASE)
+            self.erase(self.EraseType.CHIP_ERASE)
         else:
-            self.erase(self.openocd, self.EraseType.SECTOR_ERASE,
-                       self.get_segments_list(list(pages), 4*1024))
+            self.erase(self.EraseType.SECTOR_ERASE,
+                       self.get_segments_list(list(pages), self.SECTOR_SIZE))
 
-        print("Quad Enable", self.check_quad_enable(self.openocd))
+        print("Quad Enable", self.check_quad_enable())
 
         if (use_quad_spi):
             print("Using Quad SPI")
-            self.quad_enable(self.openocd)
+            self.quad_enable()
         else:
             print("Using Single SPI")
             # spifi_quad_disable(openocd)
@@ -293,23 +555,45 @@ class GenericFlash():
 
         pages_offsets = list(pages)
 
-        for index, page_offset in enumerate(pages_offsets):
-            page_bytes = pages[page_offset]
-
-            if (use_quad_spi):
-                self.quad_page_program(
-                    self.openocd, page_offset, page_bytes, 256, f"{(index*100)//pages_offsets.__len__()}%", dma=dma_instance)
-            else:
-                self.page_program(self.openocd, page_offset, page_bytes,
-                                  256, f"{(index*100)//pages_offsets.__len__()}%", dma=dma_instance)
-
-            result = self.read_data(
-                self.openocd, page_offset, 256, page_bytes, dma=dma_instance, use_quad_spi=use_quad_spi)
-
-            if result == 1:
-                print("Data error")
-                return result
-
+        # с DMA данные сектора записываются в буфер одним обращением и каждая страница
+        # программируется из буфера, сектор проверяется одной командой чтения
+        task = progress.start('spifi program', pages_offsets.__len__() * 256)
+        index = 0
+        for sector in self.get_segments_list(pages_offsets, self.SECTOR_SIZE):
+            sector_pages = {page_offset: pages[page_offset] for page_offset in pages_offsets
+                            if sector <= page_offset < sector + self.SECTOR_SIZE}
+            if dma_instance is not None:
+                with profiler.phase('spifi data upload', address=sector):
+                    self.spifi.write_dma_buffer(self.sector_data(pages, sector))
+
+            for page_offset in sector_pages:
+                page_bytes = pages[page_offset]
+                with profiler.phase('spifi program', address=page_offset):
+                    if (use_quad_spi):
+                        self.quad_page_program(
+                            page_offset, page_bytes, 256, f"{(index*100)//pages_offsets.__len__()}%",
+                            dma=dma_instance, buffer_offset=page_offset - sector)
+                    else:
+                        self.page_program(page_offset, page_bytes, 256, f"{(index*100)//pages_offsets.__len__()}%",
+                                          dma=dma_instance, buffer_offset=page_offset - sector)
+                index += 1
+
+            for run in self.page_runs(sector_pages, self.SECTOR_SIZE):
+                run_bytes: List[int] = []
+                for page_offset in run:
+                    run_bytes.extend(pages[page_offset])
+                with profiler.phase('spifi verify', address=run[0]):
+                    result = self.read_data(
+                        run[0], run_bytes.__len__(), run_bytes, dma=dma_instance, use_quad_spi=use_quad_spi)
+
+                if result == 1:
+                    task.finish(False)
+                    print("Data error")
+                    return result
+
+            task.advance(sector_pages.__len__() * 256, sector)
+
+        task.finish()
         if result == 0:
             # Прошивка страниц флеш памяти по SPIFI была завершена
             print(
@@ -319,11 +603,68 @@ class GenericFlash():
     def wait_halted(self, timeout_seconds: float = 2):
         self.openocd.run(f'wait_halt {int(timeout_seconds * 1000)}')
 
+    @staticmethod
+    def sector_data(pages: Dict[int, List[int]], sector: int) -> List[int]:
+        """Данные сектора для драйвера, страницы без данных заполняются нулями"""
+        bytes_list: List[int] = []
+        for page in range(16):
+            page = pages.get(page * 256 + sector)
+            if page is not None:
+                bytes_list.extend(page)
+            else:
+                bytes_list.extend([0]*256)
+        return bytes_list
+
+    def load_sector_driver(self, driver_path: Union[str, ram.DriverImage]):
+        self.openocd.halt()
+        self.openocd.run(f"wp {self.DRIVER_STATUS:#x} 4 w")
+
+        print("Uploading driver... ", end="", flush=True)
+        with profiler.phase('spifi driver load'):
+            ram.load_driver(self.openocd, driver_path)
+            print("OK!", flush=True)
+
+            self.openocd.resume(0x2000000)
+            self.wait_halted()
+
+    def write_sector(self, sector: int, bytes_list: List[int]) -> int:
+        """
+        Запись сектора драйвером: данные в буфер, запуск до записи слова статуса.
+        @return: статус драйвера, 0 - сектор записан и проверен
+        """
+        with profiler.phase('spifi data upload', address=sector):
+            if self.openocd.write_buffer(self.DRIVER_BUFFER, bytes_list):
+                print("An error occurred while writing data to the buffer area!")
+                return 1
+
+        # драйвер стирает, записывает и проверяет сектор за один запуск
+        with profiler.phase('spifi program', address=sector):
+            self.openocd.run(f"set_reg {{t6 {sector}}}")
+            self.openocd.resume()
+            self.wait_halted(10)    # ждем, когда watchpoint сработает
+            # watchpoint ловит до изменения слова
+            # делаем шаг, чтобы прочитать новое слово
+            self.openocd.run("step")
+
+            return self.openocd.read_memory(self.DRIVER_STATUS, 32, 1)[0]
+
     def write_pages_by_sectors(self, pages: Dict[int, List[int]],
-                               driver_path: str,
+                               driver_path: Union[str, ram.DriverImage],
                                use_quad_spi=False,
                                use_chip_erase=False,
+                               skip_sectors: Set[int] = set(),
+                               on_sector: Union[Callable[[int], None], None] = None,
+                               retries: int = 2,
                                ):
+        """
+        Запись страниц драйвером в ОЗУ по секторам. Драйвер стирает каждый
+        сектор командой 4 Кбайт и программирует страницы в режиме Single SPI.
+        @use_quad_spi: не используется драйвером
+        @skip_sectors: уже записанные секторы, блоки стирания с ними не стираются
+        @on_sector: вызывается после записи каждого сектора
+        @retries: число повторов записи сектора при ошибке драйвера
+        или истечении времени ожидания
+        """
         result = 0
 
         self.openocd.halt()
@@ -333,71 +674,48 @@ class GenericFlash():
         # self.init()
         # openocd.run("rwp")
 
-        # Сбрасываем микросхему в режиме QPI из всех состояний в нормальный SPI режим.
-        self.chip_reset_qpi()
-
-        # Сбрасываем микросхему в режиме SPI из всех состояний в нормальный SPI режим.
-        self.chip_reset()
-
-        JEDEC_ID = self.spifi.send_command(
-            0x9F, self.spifi.Frameform.OPCODE_NOADDR, self.spifi.Fieldform.ALL_SERIAL, 3)
-        print(
-            f"JEDEC_ID {JEDEC_ID[0]:02x} {JEDEC_ID[1]:02x} {JEDEC_ID[2]:02x}")
-
-        sectors_list = self.get_segments_list(list(pages), 4*1024)
-
-        self.openocd.halt()
-        pathname = os.path.dirname(sys.argv[0])
-
-        self.openocd.run("wp 0x2003000 4 w")
+        self.identify()
 
-        print("Uploading driver... ", end="", flush=True)
-        self.openocd.run(f"load_image {{{pathlib.Path(driver_path)}}}")
-        print("OK!", flush=True)
+        sectors_list = self.get_segments_list(list(pages), self.SECTOR_SIZE)
+        if skip_sectors:
+            sectors_list = self.resume_sectors(sectors_list, skip_sectors)
 
-        self.openocd.resume(0x2000000)
-        self.wait_halted()
+        self.load_sector_driver(driver_path)
 
         print("Writing Flash by sectors...", flush=True)
 
+        task = progress.start('spifi program', sectors_list.__len__() * 4 * 1024)
         for i, sector in enumerate(sectors_list):
-            ByteAddress = sector
-            progress = f"{(i*100)//len(sectors_list)}%"
-            print(f"  {ByteAddress:#010x} {progress:>4}", end="", flush=True)
-            bytes_list: List[int] = []
-            for page in range(16):
-                page = pages.get(page * 256 + sector)
-                if page is not None:
-                    bytes_list.extend(page)
-                else:
-                    bytes_list.extend([0]*256)
-
-            result = self.openocd.write_memory(0x02002000, 8, bytes_list)
-            if result:
-                print("ERROR!", flush=True)
-                print("An error occurred while writing data to the buffer area!")
-                print("Aborting...", flush=True)
-                return 1
-
-            self.openocd.run(f"set_reg {{t6 {sector}}}")
-            self.openocd.resume()
-            self.wait_halted(10)    # ждем, когда watchpoint сработает
-            # watchpoint ловит до изменения слова
-            # делаем шаг, чтобы прочитать новое слово
-            self.openocd.run("step")
-
-            result = self.openocd.read_memory(0x2003000, 32, 1)[0]
+            bytes_list = self.sector_data(pages, sector)
+
+            for attempt in range(retries + 1):
+                try:
+                    result = self.write_sector(sector, bytes_list)
+                except TclException as e:
+                    # драйвер не дошел до записи статуса, загружается заново
+                    print(f"Sector {sector:#010x}: {e.msg.strip()}", flush=True)
+                    result = 1
+                    if attempt < retries:
+                        self.openocd.run(f"rwp {self.DRIVER_STATUS:#010x}")
+                        self.load_sector_driver(driver_path)
+                if result == 0 or attempt == retries:
+                    break
+                # драйвер стирает сектор заново при каждом запуске
+                print(f"Sector {sector:#010x} FAIL! result = {result}, retrying", flush=True)
 
             if result == 0:
-                print(" OK!", flush=True)
+                progress.detail(f"  {sector:#010x} {(i*100)//len(sectors_list):>3}% OK!")
+                task.advance(4 * 1024, sector)
+                if on_sector is not None:
+                    on_sector(sector)
             else:
-                print(" FAIL!", flush=True)
-                print("result =", result)
+                task.finish(False)
+                print(f"Sector {sector:#010x} FAIL! result = {result}", flush=True)
                 break
         if result == 0:
-            print(f"  {sectors_list[-1]:#010x} 100% OK!", flush=True)
+            task.finish()
 
-        self.openocd.run("rwp 0x02003000")
+        self.openocd.run(f"rwp {self.DRIVER_STATUS:#010x}")
         self.spifi.init_memory()
 
         if result == 0:
@@ -0,0 +1,158 @@
+from typing import List, NamedTuple, Union
+
+
+# Разбор таблиц SFDP (JESD216): заголовок, заголовки параметров и основная
+# таблица параметров флеш памяти (Basic Flash Parameter Table, BFPT)
+
+READ_SFDP_COMMAND = 0x5A
+
+SIGNATURE = b'SFDP'
+HEADER_SIZE = 8
+PARAMETER_HEADER_SIZE = 8
+BFPT_ID = 0xFF00
+
+# объем чтения SFDP за одну команду: заголовки и BFPT обычно умещаются
+READ_SIZE = 256
+
+
+class EraseType(NamedTuple):
+    """Команда стирания блока: размер блока в байтах и код команды"""
+    size: int
+    opcode: int
+
+
+class FlashGeometry(NamedTuple):
+    """Объем, размер страницы программирования и команды стирания флеш памяти"""
+    size: int
+    page_size: int
+    erase_types: List[EraseType]
+
+
+# W25Q64 и совместимые: 8 Мбайт, страница 256 байт, стирание 4, 32 и 64 Кбайт
+DEFAULT_GEOMETRY = FlashGeometry(
+    size=8 * 1024 * 1024,
+    page_size=256,
+    erase_types=[EraseType(4 * 1024, 0x20), EraseType(32 * 1024, 0x52), EraseType(64 * 1024, 0xD8)],
+)
+
+
+class FastRead(NamedTuple):
+    """Команда быстрого чтения и число тактов режима и ожидания после адреса"""
+    opcode: int
+    dummy_clocks: int
+
+
+class ParameterHeader(NamedTuple):
+    id: int
+    major: int
+    minor: int
+    length: int  # длина таблицы в байтах
+    pointer: int
+
+
+def dword(data: bytes, offset: int) -> int:
+    return int.from_bytes(data[offset:offset + 4], 'little')
+
+
+def parameter_headers(data: bytes) -> List[ParameterHeader]:
+    """
+    Заголовки таблиц параметров. Пустой список, если данные не начинаются
+    с сигнатуры SFDP (флеш память не поддерживает SFDP)
+    """
+    if data[:4] != SIGNATURE or data.__len__() < HEADER_SIZE:
+        return []
+
+    headers: List[ParameterHeader] = []
+    count = data[6] + 1
+    for index in range(count):
+        offset = HEADER_SIZE + index * PARAMETER_HEADER_SIZE
+        header = data[offset:offset + PARAMETER_HEADER_SIZE]
+        if header.__len__() < PARAMETER_HEADER_SIZE:
+            break
+        headers.append(ParameterHeader(
+            id=header[0] | (header[7] << 8),
+            major=header[2],
+            minor=header[1],
+            length=header[3] * 4,
+            pointer=int.from_bytes(header[4:7], 'little'),
+        ))
+    return headers
+
+
+def bfpt_header(data: bytes) -> Union[ParameterHeader, None]:
+    """Заголовок BFPT: первая таблица параметров по стандарту"""
+    headers = parameter_headers(data)
+    if headers.__len__() == 0 or headers[0].id != BFPT_ID:
+        return None
+    return headers[0]
+
+
+def bfpt(data: bytes) -> bytes:
+    """Содержимое BFPT или пустая строка, если таблица не прочитана целиком"""
+    header = bfpt_header(data)
+    if header is None or data.__len__() < header.pointer + header.length:
+        return b''
+    return data[header.pointer:header.pointer + header.length]
+
+
+def parse_geometry(data: bytes) -> Union[FlashGeometry, None]:
+    """
+    Объем, страница и команды стирания из BFPT.
+    @data: SFDP, начиная с адреса 0, включая BFPT
+    @return: None, если SFDP не поддерживается или BFPT не прочитана
+    """
+    table = bfpt(data)
+    if table.__len__() < 9 * 4:
+        return None
+
+    # DWORD 2: объем в битах, при старшем бите - степень двойки
+    density = dword(table, 4)
+    if density & 0x80000000:
+        size = (1 << (density & 0x7FFFFFFF)) // 8
+    else:
+        size = (density + 1) // 8
+
+    # DWORD 8, 9: до четырех команд стирания, размер задается степенью двойки
+    erase_types: List[EraseType] = []
+    for offset in (7 * 4, 7 * 4 + 2, 8 * 4, 8 * 4 + 2):
+        size_exponent, opcode = table[offset], table[offset + 1]
+        if size_exponent != 0:
+            erase_types.append(EraseType(1 << size_exponent, opcode))
+
+    # DWORD 11 (JESD216A): размер страницы программирования
+    page_size = 256
+    if table.__len__() >= 11 * 4:
+        page_size = 1 << ((dword(table, 10 * 4) >> 4) & 0xF)
+
+    return FlashGeometry(size, page_size, sorted(erase_types))
+
+
+def fast_read_quad_output(data: bytes) -> Union[FastRead, None]:
+    """Команда чтения 1-1-4 (адрес по одной линии, данные по четырем) из BFPT"""
+    table = bfpt(data)
+    # DWORD 1, бит 22: чтение 1-1-4 поддерживается, DWORD 3 [31:16]: команда и такты
+    if table.__len__() < 3 * 4 or not dword(table, 0) & (1 << 22):
+        return None
+    fast_read = dword(table, 2 * 4) >> 16
+    return FastRead(fast_read >> 8, (fast_read & 0x1F) + ((fast_read >> 5) & 0x7))
+
+
+def fast_read_quad_io(data: bytes) -> Union[FastRead, None]:
+    """Команда чтения 1-4-4 (адрес и данные по четырем линиям) из BFPT"""
+    table = bfpt(data)
+    # DWORD 1, бит 21: чтение 1-4-4 поддерживается, DWORD 3 [15:0]: команда и такты
+    if table.__len__() < 3 * 4 or not dword(table, 0) & (1 << 21):
+        return None
+    fast_read = dword(table, 2 * 4) & 0xFFFF
+    return FastRead(fast_read >> 8, (fast_read & 0x1F) + ((fast_read >> 5) & 0x7))
+
+
+def quad_enable_requirement(data: bytes) -> Union[int, None]:
+    """
+    Способ установки бита QE, поле QER DWORD 15 (JESD216A).
+    @return: None, если BFPT короче 15 DWORD
+    """
+    table = bfpt(data)
+    if table.__len__() < 15 * 4:
+        return None
+    return (dword(table, 14 * 4) >> 20) & 0x7
@@ -0,0 +1,306 @@
+import socket
+import struct
+import time
+from enum import Enum
+from logging import getLogger
+from typing import List, Union
+
+from tclrpc import OpenOcdTclRpc, RpcStats
+from transfer import TransferMode
+
+logger = getLogger(__name__)
+
+
+class GdbRspError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __repr__(self):
+        return 'GdbRspError %r' % (self.msg)
+
+    def __str__(self):
+        return f"ERROR: GDB RSP: {self.msg}"
+
+
+def rsp_checksum(payload: bytes) -> int:
+    return sum(payload) & 0xFF
+
+
+def rsp_escape(data: bytes) -> bytes:
+    """Escape binary data for X packets: '}', '#', '$' and '*' are sent as
+    '}' followed by the byte xor 0x20"""
+    return (data
+            .replace(b'}', b'}\x5d')
+            .replace(b'#', b'}\x03')
+            .replace(b'$', b'}\x04')
+            .replace(b'*', b'}\x0a'))
+
+
+def rsp_unpack_rle(data: bytes) -> bytes:
+    """Expand run-length encoded reply: 'X*n' repeats X (ord(n) - 29) more times"""
+    if b'*' not in data:
+        return data
+
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        if data[i] == 0x2A and out:
+            out += bytes([out[-1]]) * (data[i + 1] - 29)
+            i += 2
+        else:
+            out.append(data[i])
+            i += 1
+    return bytes(out)
+
+
+class WatchpointKind(Enum):
+    WRITE = 2
+    READ = 3
+    ACCESS = 4
+
+
+class GdbRspClient:
+    """
+    Клиент протокола GDB Remote Serial Protocol для GDB сервера OpenOCD.
+    Поддерживает чтение и запись памяти, запись регистров, продолжение
+    выполнения, остановку и точки наблюдения
+    """
+
+    DEFAULT_PORT = 3333
+    BUFFER_SIZE = 65536
+    DEFAULT_PACKET_SIZE = 0x3FFF
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.sock: Union[socket.socket, None] = None
+        self.packet_size = self.DEFAULT_PACKET_SIZE
+        self.no_ack = False
+        self.binary_write = True
+        self.stats = RpcStats()
+        self._buffer = bytes()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def connect(self, timeout: float = 5.0):
+        start_time = time.perf_counter()
+        while True:
+            try:
+                self.sock = socket.create_connection((self.host, self.port), timeout=timeout)
+                break
+            except OSError:
+                if time.perf_counter() - start_time > timeout:
+                    raise
+                time.sleep(0.01)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        features = self.command(b'qSupported:swbreak+;hwbreak+').decode('ascii')
+        for feature in features.split(';'):
+            if feature.startswith('PacketSize='):
+                self.packet_size = int(feature[len('PacketSize='):], base=16)
+        if 'QStartNoAckMode+' in features:
+            if self.command(b'QStartNoAckMode') == b'OK':
+                self.no_ack = True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _read(self) -> bytes:
+        chunk = self.sock.recv(self.BUFFER_SIZE)
+        if not chunk:
+            raise GdbRspError('Connection closed by GDB server')
+        self.stats.bytes_received += len(chunk)
+        return chunk
+
+    def send_packet(self, payload: bytes):
+        frame = b'$' + payload + b'#' + b'%02x' % rsp_checksum(payload)
+        logger.debug('gdb send: %r', frame[:64])
+        self.stats.commands += 1
+        while True:
+            self.sock.sendall(frame)
+            self.stats.bytes_sent += len(frame)
+            if self.no_ack:
+                return
+            ack = self._read_ack()
+            if ack == b'+':
+                return
+
+    def _read_ack(self) -> bytes:
+        while not self._buffer:
+            self._buffer = self._read()
+        ack, self._buffer = self._buffer[:1], self._buffer[1:]
+        if ack not in (b'+', b'-'):
+            raise GdbRspError(f'Expected acknowledgment, got {ack!r}')
+        return ack
+
+    def recv_packet(self) -> bytes:
+        """Read one packet, skip acknowledgments and console output ('O') packets"""
+        while True:
+            start = self._buffer.find(b'$')
+            end = self._buffer.find(b'#', start + 1) if start >= 0 else -1
+            if start < 0 or end < 0 or len(self._buffer) < end + 3:
+                self._buffer += self._read()
+                continue
+
+            payload = self._buffer[start + 1:end]
+            checksum = int(self._buffer[end + 1:end + 3], base=16)
+            self._buffer = self._buffer[end + 3:]
+
+            if rsp_checksum(payload) != checksum:
+                if not self.no_ack:
+                    self.sock.sendall(b'-')
+                    continue
+                raise GdbRspError('Packet checksum mismatch')
+            if not self.no_ack:
+                self.sock.sendall(b'+')
+
+            payload = rsp_unpack_rle(payload)
+            logger.debug('gdb recv: %r', payload[:64])
+            if payload.startswith(b'O') and payload != b'OK':
+                continue
+            return payload
+
+    def command(self, payload: bytes) -> bytes:
+        self.send_packet(payload)
+        return self.recv_packet()
+
+    def _check_reply(self, reply: bytes, request: str):
+        if reply.startswith(b'E') and len(reply) == 3:
+            raise GdbRspError(f'{request} failed with {reply.decode("ascii")}')
+
+    def read_memory(self, address: int, length: int) -> bytes:
+        """Read memory with 'm' packets, each reply byte takes two hex digits"""
+        chunk_size = (self.packet_size - 8) // 2
+        data = bytearray()
+        while length > 0:
+            size = min(chunk_size, length)
+            reply = self.command(b'm%x,%x' % (address, size))
+            self._check_reply(reply, f'Read {size} bytes at {address:#010x}')
+            data += bytes.fromhex(reply.decode('ascii'))
+            address += size
+            length -= size
+        return bytes(data)
+
+    def write_memory(self, address: int, data: bytes):
+        """Write memory with binary 'X' packets, fall back to hex 'M' packets
+        if the server does not support binary writes"""
+        # экранирование может увеличить размер данных вдвое
+        chunk_size = (self.packet_size - 32) // 2
+        offset = 0
+        while offset < len(data):
+            chunk = data[offset:offset + chunk_size]
+            if self.binary_write:
+                reply = self.command(b'X%x,%x:' % (address + offset, len(chunk)) + rsp_escape(chunk))
+                if reply == b'':
+                    self.binary_write = False
+                    continue
+            else:
+                reply = self.command(b'M%x,%x:' % (address + offset, len(chunk)) + chunk.hex().encode('ascii'))
+            self._check_reply(reply, f'Write {len(chunk)} bytes at {address + offset:#010x}')
+            offset += len(chunk)
+
+    def set_register(self, number: int, value: int, size: int = 4):
+        reply = self.command(b'P%x=' % number + value.to_bytes(size, 'little').hex().encode('ascii'))
+        self._check_reply(reply, f'Set register {number}')
+
+    def cont(self, address: Union[int, None] = None):
+        """Continue execution, the stop reply is read by wait_stop"""
+        if address is None:
+            self.send_packet(b'c')
+        else:
+            self.send_packet(b'c%x' % address)
+
+    def wait_stop(self, timeout: float = 2.0) -> bytes:
+        self.sock.settimeout(timeout)
+        try:
+            reply = self.recv_packet()
+        except socket.timeout:
+            raise GdbRspError(f'Target did not stop in {timeout} seconds')
+        finally:
+            self.sock.settimeout(None)
+        if not (reply.startswith(b'T') or reply.startswith(b'S')):
+            raise GdbRspError(f'Unexpected stop reply {reply!r}')
+        return reply
+
+    def halt(self, timeout: float = 2.0) -> bytes:
+        self.sock.sendall(b'\x03')
+        return self.wait_stop(timeout)
+
+    def insert_watchpoint(self, address: int, length: int = 4, kind: WatchpointKind = WatchpointKind.WRITE):
+        reply = self.command(b'Z%d,%x,%x' % (kind.value, address, length))
+        self._check_reply(reply, f'Insert watchpoint at {address:#010x}')
+        if reply != b'OK':
+            raise GdbRspError(f'Watchpoints are not supported: {reply!r}')
+
+    def remove_watchpoint(self, address: int, length: int = 4, kind: WatchpointKind = WatchpointKind.WRITE):
+        reply = self.command(b'z%d,%x,%x' % (kind.value, address, length))
+        self._check_reply(reply, f'Remove watchpoint at {address:#010x}')
+
+
+_struct_formats = {
+    8: 'B',
+    16: 'H',
+    32: 'I',
+    64: 'Q',
+}
+
+
+class OpenOcdGdbRpc(OpenOcdTclRpc):
+    """
+    Транспорт, передающий объемные данные через GDB сервер OpenOCD
+    в двоичном виде, а команды управления - через Tcl сервер.
+
+    Обращения короче BULK_THRESHOLD байт выполняются через Tcl, чтобы
+    сохранить ширину доступа к регистрам периферии
+    """
+
+    BULK_THRESHOLD = 64
+
+    __slots__ = (
+        'gdb',
+    )
+
+    def __init__(self, host='127.0.0.1', port=OpenOcdTclRpc.DEFAULT_PORT,
+                 gdb_port=GdbRspClient.DEFAULT_PORT, transfer_mode=TransferMode.AUTO):
+        super().__init__(host, port, transfer_mode)
+        self.gdb = GdbRspClient(host, gdb_port)
+        # общие счетчики обращений через Tcl и GDB
+        self.gdb.stats = self.stats
+
+    def __enter__(self):
+        super().__enter__()
+        self.gdb.connect()
+        return self
+
+    def __exit__(self, *args):
+        self.gdb.close()
+        super().__exit__(*args)
+
+    def write_memory(self, address: int, width: int, data: List[int]):
+        if len(data) * width // 8 < self.BULK_THRESHOLD:
+            return super().write_memory(address, width, data)
+
+        self.gdb.write_memory(address, struct.pack(f'<{len(data)}{_struct_formats[width]}', *data))
+        return ""
+
+    def read_memory(self, address: int, width: int, count: int):
+        if count * width // 8 < self.BULK_THRESHOLD:
+            return super().read_memory(address, width, count)
+
+        data = self.gdb.read_memory(address, count * width // 8)
+        return list(struct.unpack(f'<{count}{_struct_formats[width]}', data))
+
+    def write_buffer(self, address: int, data: List[int]):
+        if len(data) < self.BULK_THRESHOLD:
+            return super().write_buffer(address, data)
+
+        self.stats.payload_bytes += len(data)
+        self.gdb.write_memory(address, bytes(data))
+        return ""
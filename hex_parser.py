@@ -61,10 +61,11 @@ supported_text_formats = [".hex"]
 class FirmwareFile:
     file_name: str
     file_extension: str
-    segments: List[Segment] = []
+    segments: List[Segment]
 
     def __init__(self, path: str, sections: List[MemorySection]):
         self.file_name, self.file_extension = os.path.splitext(path)
+        self.segments = []
 
         if self.file_extension in supported_text_formats:
             with open(path) as f:
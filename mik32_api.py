@@ -0,0 +1,172 @@
+import contextlib
+import io
+import time
+from typing import List, NamedTuple, Union
+
+from hex_parser import MemoryType, Segment
+from parsers import ParserError
+from tclrpc import OpenOcdTclRpc, RpcStats
+from openocd_process import OpenOCDError
+from mik32_debug_hal.gpio import MIK32_Version
+from mik32_debug_hal.power_manager import ClockMode
+from mik32_upload import BootMode, DriverImages, Pages, PreparedFirmware, RegionResult, default_driver_images, \
+    form_pages, memory_page_size, mik32_sections, openocd_interface_path, read_driver_images, run_prepared, \
+    write_firmware
+import adapter_clock
+import target_probe
+
+
+# Программный интерфейс записи прошивки из памяти компьютера: образ передается
+# двоичными данными, списком сегментов или сформированными страницами, без
+# временных файлов. Результат возвращается объектом UploadResult, вывод
+# скрипта по умолчанию не печатается, а сохраняется в UploadResult.log.
+# Вывод перехватывается contextlib.redirect_stdout для всего процесса, поэтому
+# upload с quiet=True нельзя вызывать из нескольких потоков одновременно:
+# для параллельной записи плат используется quiet=False.
+#
+#     segments = read_firmware('app.hex') + [Segment(0x01001F00, serial, mik32_sections)]
+#     result = upload(segments, is_run_openocd=True)
+#     if not result.ok:
+#         print(result.errors)
+
+
+# образ в памяти: двоичные данные (адрес задается отдельно), сегменты,
+# страницы EEPROM и SPIFI или подготовленная прошивка
+Image = Union[bytes, bytearray, List[Segment], Pages, PreparedFirmware]
+
+
+class UploadResult(NamedTuple):
+    """
+    Результат записи: результаты по областям памяти, ошибки, общее время
+    и число обращений к OpenOCD, вывод скрипта
+    """
+    ok: bool
+    regions: List[RegionResult]
+    errors: List[str]
+    elapsed: float
+    rpc_count: int
+    log: str
+
+
+def page_bytes(pages: Pages) -> Pages:
+    """Объем данных страниц, если он не задан при формировании страниц"""
+    return pages._replace(
+        bytes_eeprom=pages.bytes_eeprom or pages.pages_eeprom.__len__() * memory_page_size[MemoryType.EEPROM],
+        bytes_spifi=pages.bytes_spifi or pages.pages_spifi.__len__() * memory_page_size[MemoryType.SPIFI],
+    )
+
+
+def prepare_image(
+    image: Image,
+    address: int = 0,
+    boot_mode=BootMode.UNDEFINED,
+    drivers: Union[DriverImages, None] = None,
+) -> PreparedFirmware:
+    """
+    Подготовка образа из памяти к записи.
+    @address: адрес двоичных данных, для других образов не используется
+    @drivers: драйверы EEPROM и SPIFI, None - прочитать из файлов драйверов
+    @return: подготовленная прошивка
+    @raise ParserError: данные не помещаются в память МК
+    """
+    if isinstance(image, PreparedFirmware):
+        return image
+    if drivers is None:
+        drivers = read_driver_images()
+
+    if isinstance(image, Pages):
+        return PreparedFirmware([], page_bytes(image), drivers)
+
+    if isinstance(image, (bytes, bytearray)):
+        segments = [Segment(address, list(image), mik32_sections)]
+    else:
+        segments = image
+    return PreparedFirmware(segments, form_pages(segments, boot_mode), drivers)
+
+
+def upload(
+    image: Image,
+    address: int = 0,
+    boot_mode=BootMode.UNDEFINED,
+    use_quad_spi=False,
+    mik_version=MIK32_Version.AUTO,
+    use_driver=True,
+    drivers: Union[DriverImages, None] = None,
+    clock_mode=ClockMode.KEEP,
+    openocd_interface=openocd_interface_path,
+    adapter_serial: Union[str, None] = None,
+    target_cache_path: Union[str, None] = target_probe.default_cache_path,
+    quiet=True,
+    **session_args
+) -> UploadResult:
+    """
+    Запись образа из памяти в MIK32, при необходимости с запуском OpenOCD.
+    Ошибки не завершают процесс, а возвращаются в UploadResult.errors.
+    @image: образ, см. Image
+    @address: адрес двоичных данных
+    @drivers: драйверы EEPROM и SPIFI, прочитанные заранее для серии плат
+    @target_cache_path: файл сохраненных вариантов МК и параметров флеш памяти,
+    None - не сохранять
+    @quiet: не печатать вывод, а сохранить его в UploadResult.log. Перехват вывода
+    действует на весь процесс, с quiet=True функция не потокобезопасна
+    @session_args: аргументы run_prepared (порты, запуск OpenOCD, post_action)
+    @return: результат записи
+    """
+    start_time = time.perf_counter()
+    regions: List[RegionResult] = []
+    errors: List[str] = []
+    sessions: List[RpcStats] = []
+    result = 1
+
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log) if quiet else contextlib.nullcontext():
+        try:
+            firmware = prepare_image(image, address, boot_mode,
+                                     drivers if use_driver else default_driver_images)
+        except ParserError as e:
+            print(e)
+            errors.append(str(e.value))
+        else:
+            board = adapter_clock.cache_key(openocd_interface, adapter_serial)
+
+            def action(openocd: OpenOcdTclRpc, firmware: PreparedFirmware) -> int:
+                sessions.append(openocd.stats)
+                return write_firmware(
+                    openocd,
+                    firmware.segments,
+                    firmware.pages,
+                    use_quad_spi=use_quad_spi,
+                    mik_version=mik_version,
+                    use_driver=use_driver,
+                    drivers=firmware.drivers,
+                    clock_mode=clock_mode,
+                    board=board,
+                    target_cache_path=target_cache_path,
+                    regions=regions,
+                )
+
+            try:
+                result = run_prepared(
+                    lambda: firmware,
+                    action,
+                    openocd_interface=openocd_interface,
+                    adapter_serial=adapter_serial,
+                    errors=errors,
+                    **session_args
+                )
+            except (OpenOCDError, OSError) as e:
+                print(e)
+                errors.append(str(e))
+
+    errors.extend(region.error for region in regions if region.error is not None)
+    if result != 0 and errors.__len__() == 0:
+        errors.append("Upload failed")
+
+    return UploadResult(
+        ok=result == 0 and errors.__len__() == 0,
+        regions=regions,
+        errors=errors,
+        elapsed=time.perf_counter() - start_time,
+        rpc_count=sum(stats.commands for stats in sessions),
+        log=log.getvalue(),
+    )
@@ -1,154 +1,293 @@
 import argparse
 import logging
-import os
-import subprocess
 import sys
 import time
-from typing import List, Union
+from typing import Dict, List, NamedTuple, Tuple, Union
 
-from mik32_debug_hal.power_manager import pm_init
-from mik32_upload import BootMode, Pages, form_pages, openocd_exec_path, openocd_scripts_path, openocd_interface_path, openocd_target_path, adapter_default_speed, run_openocd, default_post_action, default_log_path, default_openocd_host, mik32_sections, OpenOCDError, adapter_speed_not_supported, memory_page_size
+from mik32_upload import BootMode, Firmware, Pages, PreparedFirmware, prepare_firmware, parse_image, run_prepared, \
+    openocd_exec_path, openocd_scripts_path, openocd_interface_path, openocd_target_path, adapter_default_speed, default_post_action, \
+    default_log_path, default_openocd_host, mik32_sections
+import mik32_debug_hal.power_manager as power_manager
+import mik32_debug_hal.crc as crc
 from mik32_debug_hal.gpio import MIK32_Version, gpio_init, gpio_deinit
-import mik32_debug_hal.ram as ram
-from hex_parser import FirmwareFile, MemoryType, Segment
-from tclrpc import OpenOcdTclRpc, TclException
-from mik32_debug_hal.eeprom import EEPROM
+from hex_parser import MemoryType, Segment
+from tclrpc import OpenOcdTclRpc
 from mik32_debug_hal.spifi import SPIFI
 from flash_drivers.generic_flash import GenericFlash
+import adapter_clock
+import profiler
+import progress
+import target_probe
+from utils import words2bytes
 
 
-def upload_file(
-        filename: str,
-        host: str = '127.0.0.1',
-        port: int = OpenOcdTclRpc.DEFAULT_PORT,
-        is_run_openocd=False,
-        use_quad_spi=False,
-        openocd_exec=openocd_exec_path,
-        openocd_scripts=openocd_scripts_path,
-        openocd_interface=openocd_interface_path,
-        openocd_target=openocd_target_path,
-        adapter_speed=adapter_default_speed,
-        is_open_console=False,
-        boot_mode=BootMode.UNDEFINED,
-        log_path=default_log_path,
-        post_action=default_post_action,
-        mik_version=MIK32_Version.MIK32V2
-) -> int:
+# Проверка памяти MIK32 по файлу прошивки за один сеанс. CRC-32 страниц EEPROM
+# и участков SPIFI в пределах сектора считаются программой в ОЗУ МК
+# (mik32_debug_hal/crc.py) и сравниваются с CRC прошивки, данные читаются
+# только для несовпавших участков. ОЗУ читается целиком до записи программы.
+
+# участок проверки: адрес на шине и ожидаемые данные
+Unit = Tuple[int, List[int]]
+
+# максимальный объем одного чтения, как у окна SPIFI
+READ_SIZE = SPIFI.MEMORY_READ_WINDOW
+
+
+class Mismatch(NamedTuple):
+    """Несовпавший участок: адрес на шине, размер, число и первое отличие"""
+    address: int
+    size: int
+    differences: int
+    first: int
+    expected: int
+    actual: int
+
+
+class RegionReport(NamedTuple):
+    """Результат проверки области памяти"""
+    memory: MemoryType
+    units: int
+    mismatches: List[Mismatch]
+    elapsed: float
+
+
+def section_offset(memory_type: MemoryType) -> int:
+    return next(section.offset for section in mik32_sections if section.type == memory_type)
+
+
+def read_bytes(openocd: OpenOcdTclRpc, address: int, byte_count: int) -> List[int]:
+    """Чтение словами по READ_SIZE байт, адрес выровнен на слово"""
+    data: List[int] = []
+    for window in range(address, address + byte_count, READ_SIZE):
+        word_count = (min(READ_SIZE, address + byte_count - window) + 3) // 4
+        data.extend(words2bytes(openocd.read_memory(window, 32, word_count)))
+    return data[:byte_count]
+
+
+def compare(address: int, expected: List[int], actual: List[int]) -> Union[Mismatch, None]:
+    differences = [i for i in range(expected.__len__()) if i >= actual.__len__() or expected[i] != actual[i]]
+    if differences.__len__() == 0:
+        return None
+    first = differences[0]
+    return Mismatch(address, expected.__len__(), differences.__len__(), address + first, expected[first],
+                    actual[first] if first < actual.__len__() else -1)
+
+
+def eeprom_units(pages: Dict[int, List[int]]) -> List[Unit]:
+    """Страница EEPROM на участок"""
+    base = section_offset(MemoryType.EEPROM)
+    return [(base + page_offset, pages[page_offset]) for page_offset in sorted(pages)]
+
+
+def spifi_units(pages: Dict[int, List[int]]) -> List[Unit]:
+    """Подряд идущие страницы SPIFI общим размером не больше сектора"""
+    base = section_offset(MemoryType.SPIFI)
+    units: List[Unit] = []
+    for run in GenericFlash.page_runs(pages, GenericFlash.SECTOR_SIZE):
+        data: List[int] = []
+        for page_offset in run:
+            data.extend(pages[page_offset])
+        units.append((base + run[0], data))
+    return units
+
+
+def ram_units(segments: List[Segment]) -> List[Unit]:
+    return [(segment.offset, segment.data) for segment in segments]
+
+
+def check_units(
+        openocd: OpenOcdTclRpc,
+        memory: MemoryType,
+        units: List[Unit],
+        target_crc: Union[crc.TargetCrc, None] = None,
+) -> RegionReport:
     """
-    Write ihex or binary file into MIK32 EEPROM or external flash memory
-    @filename: full path to the file with hex or bin file format
-    @return: return 0 if successful, 1 if failed
+    Проверка участков области памяти. С target_crc читаются только участки
+    с несовпавшей CRC, иначе все участки
     """
+    start_time = time.perf_counter()
+    phase = f"{memory.name.lower()} verify"
+    task = progress.start(phase, sum(data.__len__() for _, data in units))
 
-    print(f"Using {mik_version.value}")
+    suspects = units
+    if target_crc is not None:
+        with profiler.phase(f"{phase} crc"):
+            crcs = target_crc.crc([(address, data.__len__()) for address, data in units])
+        suspects = [unit for unit, value in zip(units, crcs) if value != crc.host_crc(unit[1])]
+        task.advance(sum(data.__len__() for _, data in units) - sum(data.__len__() for _, data in suspects))
 
-    result = 0
+    mismatches: List[Mismatch] = []
+    for address, data in suspects:
+        with profiler.phase(phase, address=address):
+            mismatch = compare(address, data, read_bytes(openocd, address, data.__len__()))
+        if mismatch is not None:
+            mismatches.append(mismatch)
+        task.advance(data.__len__(), address)
+    task.finish(mismatches.__len__() == 0)
 
-    if not os.path.exists(filename):
-        print(f"ERROR: File {filename} does not exist")
-        exit(1)
+    return RegionReport(memory, units.__len__(), mismatches, time.perf_counter() - start_time)
 
-    file = FirmwareFile(filename, mik32_sections)
 
-    segments: List[Segment] = file.get_segments()
-    pages: Pages = form_pages(segments, boot_mode)
+def check_firmware(
+        openocd: OpenOcdTclRpc,
+        segments: List[Segment],
+        pages: Pages,
+        use_quad_spi=False,
+        mik_version=MIK32_Version.AUTO,
+        use_crc=True,
+        board: Union[str, None] = None,
+        target_cache_path: Union[str, None] = target_probe.default_cache_path,
+) -> Union[List[RegionReport], None]:
+    """
+    Проверка ОЗУ, EEPROM и флеш памяти SPIFI через установленное соединение с OpenOCD.
+    @use_crc: подсчет CRC на стороне МК, иначе чтение всех данных
+    @board: ключ платы для сохранения варианта МК и параметров флеш памяти
+    (adapter_clock.cache_key), None - не сохранять
+    @return: результаты проверки областей памяти, которые есть в прошивке,
+    None - если проверка не выполнена
+    """
+    reports: List[RegionReport] = []
+
+    segments_ram = [segment for segment in segments
+                    if segment.memory is not None and segment.memory.type == MemoryType.RAM]
+    if segments_ram.__len__() > 0:
+        reports.append(check_units(openocd, MemoryType.RAM, ram_units(segments_ram)))
 
-    proc: Union[subprocess.Popen, None] = None
-    if is_run_openocd:
-        try:
-            logging.debug("OpenOCD try start!")
+    target_crc: Union[crc.TargetCrc, None] = None
+    if use_crc and (pages.pages_eeprom.__len__() > 0 or pages.pages_spifi.__len__() > 0):
+        crc_base = crc.find_area(segments_ram)
+        if crc_base is not None:
+            target_crc = crc.TargetCrc(openocd, crc_base)
+        else:
+            print("WARNING: No free RAM for the CRC program, reading all data back")
 
-            proc = run_openocd(openocd_exec, openocd_scripts,
-                               openocd_interface, openocd_target, is_open_console)
+    with profiler.phase('pm_init'):
+        if power_manager.pm_init(openocd).result != 0:
+            return None
 
-            logging.debug("OpenOCD started!")
+    if pages.pages_eeprom.__len__() > 0:
+        reports.append(check_units(openocd, MemoryType.EEPROM, eeprom_units(pages.pages_eeprom), target_crc))
 
-        except OSError as e:
-            raise OpenOCDError(e)
-    try:
-        with OpenOcdTclRpc(host, port) as openocd:
-            if (all(openocd_interface.find(i) == -1 for i in adapter_speed_not_supported)):
-                openocd.run(f"adapter speed {adapter_speed}")
-            openocd.run(f"log_output \"{log_path}\"")
-            openocd.run(f"debug_level 1")
+    if pages.pages_spifi.__len__() > 0:
+        with profiler.phase('target probe'):
+            mik_version = target_probe.resolve_version(openocd, mik_version, board, target_cache_path)
+        with profiler.phase('gpio_init'):
+            port2_value = gpio_init(openocd, mik_version)
+        flash = GenericFlash(SPIFI(openocd))
+        with profiler.phase('target probe'):
+            target_probe.probe_flash(flash, board, target_cache_path)
 
-            logging.debug("OpenOCD configured!")
+        use_quad_spi = flash.quad_supported(use_quad_spi, flash.capabilities.quad_read)
+        if use_quad_spi:
+            flash.quad_enable()
+        flash.init_memory(use_quad_spi)
 
-            pm_init(openocd)
+        reports.append(check_units(openocd, MemoryType.SPIFI, spifi_units(pages.pages_spifi), target_crc))
 
-            logging.debug("PM configured!")
+        if use_quad_spi:
+            flash.init_memory()
+        with profiler.phase('gpio_deinit'):
+            gpio_deinit(openocd, mik_version, port2_value)
 
-            if (pages.pages_eeprom.__len__() > 0):
-                eeprom = EEPROM(openocd)
+    return reports
 
-                start_time = time.perf_counter()
 
-                result |= eeprom.check_pages(
-                    pages.pages_eeprom, openocd)
+def print_reports(reports: List[RegionReport]):
+    """Карта несовпадений по областям памяти"""
+    for report in reports:
+        status = "OK" if report.mismatches.__len__() == 0 else f"{report.mismatches.__len__()} mismatched"
+        print(f"{report.memory.name}: {report.units} regions checked in {report.elapsed:.2f} seconds, {status}")
+        for mismatch in report.mismatches:
+            print(f"  {mismatch.address:#010x}..{mismatch.address + mismatch.size - 1:#010x}: "
+                  f"{mismatch.differences} bytes differ, first at {mismatch.first:#010x} "
+                  f"read {mismatch.actual:#04x} expect {mismatch.expected:#04x}")
 
-                write_time = time.perf_counter() - start_time
-                write_size = pages.pages_eeprom.__len__(
-                ) * memory_page_size[MemoryType.EEPROM]
-                print(
-                    f"Check {write_size} bytes in {write_time:.2f} seconds (effective {(write_size/(write_time*1024)):.1f} kbyte/s)")
-            if (pages.pages_spifi.__len__() > 0):
-                gpio_init(openocd, mik_version)
-                spifi = SPIFI(openocd)
-                flash = GenericFlash(spifi)
-                start_time = time.perf_counter()
 
-                result |= flash.check_pages(
-                    pages.pages_spifi, use_quad_spi=use_quad_spi)
+def check_file(
+        filename: Firmware,
+        host: str = '127.0.0.1',
+        port: int = OpenOcdTclRpc.DEFAULT_PORT,
+        is_run_openocd=False,
+        use_quad_spi=False,
+        openocd_exec=openocd_exec_path,
+        openocd_scripts=openocd_scripts_path,
+        openocd_interface=openocd_interface_path,
+        openocd_target=openocd_target_path,
+        adapter_speed=adapter_default_speed,
+        is_open_console=False,
+        boot_mode=BootMode.UNDEFINED,
+        log_path=default_log_path,
+        post_action=default_post_action,
+        mik_version=MIK32_Version.AUTO,
+        use_crc=True,
+        adapter_serial: Union[str, None] = None,
+) -> int:
+    """
+    Проверка памяти MIK32 по файлу прошивки в формате Intel HEX или бинарном
+    @filename: полный путь до файла прошивки или список образов (FirmwareImage)
+    @return: возвращает 0, если память совпадает с прошивкой, 1 - иначе
+    """
+
+    if mik_version != MIK32_Version.AUTO:
+        print(f"Using {mik_version.value}")
 
-                write_time = time.perf_counter() - start_time
-                write_size = pages.pages_spifi.__len__(
-                ) * memory_page_size[MemoryType.SPIFI]
-                print(
-                    f"Check {write_size} bytes in {write_time:.2f} seconds (effective {(write_size/(write_time*1024)):.1f} kbyte/s)")
-                gpio_deinit(openocd, mik_version)
+    board = adapter_clock.cache_key(openocd_interface, adapter_serial)
+    start_time = time.perf_counter()
 
-            segments_ram = list(filter(
-                lambda segment: (segment.memory is not None) and (segment.memory.type == MemoryType.RAM), segments))
-            if (segments_ram.__len__() > 0):
-                ram.check_segments(segments_ram, openocd)
-                result |= 0
+    def check(openocd: OpenOcdTclRpc, firmware: PreparedFirmware) -> int:
+        reports = check_firmware(openocd, firmware.segments, firmware.pages, use_quad_spi,
+                                 mik_version, use_crc, board)
+        if reports is None:
+            return 1
+        print_reports(reports)
+        return 0 if all(report.mismatches.__len__() == 0 for report in reports) else 1
 
-            openocd.run(post_action)
-    except ConnectionRefusedError:
-        print("ERROR: The connection to OpenOCD is not established. Check the settings and connection of the debugger")
-    except TclException as e:
-        print(f"ERROR: TclException {e.code} \n {e.msg}")
-    finally:
-        if proc is not None:
-            proc.kill()
+    result = run_prepared(
+        lambda: prepare_firmware(filename, boot_mode, use_driver=False),
+        check,
+        host=host,
+        port=port,
+        is_run_openocd=is_run_openocd,
+        openocd_exec=openocd_exec,
+        openocd_scripts=openocd_scripts,
+        openocd_interface=openocd_interface,
+        openocd_target=openocd_target,
+        adapter_speed=adapter_speed,
+        is_open_console=is_open_console,
+        log_path=log_path,
+        post_action=post_action,
+        adapter_serial=adapter_serial,
+    )
 
+    print(f"Check {'passed' if result == 0 else 'failed'} in {time.perf_counter() - start_time:.2f} seconds")
     return result
 
 
 def createParser():
     parser = argparse.ArgumentParser(
-        prog='mik32_upload.py',
-        description='''Скрипт предназначен для записи программы в ОЗУ, EEPROM и внешнюю flash память, 
-        подключенную по интерфейсу SPIFI'''
+        prog='mik32_check.py',
+        description='''Скрипт предназначен для проверки программы в ОЗУ, EEPROM и внешней flash памяти, 
+        подключенной по интерфейсу SPIFI. Возвращает ненулевой код, если память не совпадает с прошивкой'''
     )
     parser.add_argument(
         'filepath',
-        nargs='?',
-        help='Путь к файлу прошивки'
+        nargs='*',
+        type=parse_image,
+        help='Пути к файлам прошивки, как у mik32_upload.py: несколько образов и суффикс @АДРЕС'
     )
     parser.add_argument(
         '--run-openocd',
         dest='run_openocd',
         action='store_true',
         default=False,
-        help='Запуск openocd при прошивке МК'
+        help='Запуск openocd при проверке МК'
     )
     parser.add_argument(
         '--use-quad-spi',
         dest='use_quad_spi',
         action='store_true',
         default=False,
-        help='Использование режима QuadSPI при программировании внешней флеш памяти'
+        help='Использование режима QuadSPI при чтении внешней флеш памяти'
     )
     parser.add_argument(
         '--openocd-host',
@@ -229,7 +368,7 @@ def createParser():
         '--post-action',
         dest='post_action',
         default=default_post_action,
-        help=f"Команды OpenOCD, запускаемые после прошивки. По умолчанию: {default_post_action}"
+        help=f"Команды OpenOCD, запускаемые после проверки. По умолчанию: {default_post_action}"
     )
     parser.add_argument(
         '--no-color',
@@ -244,9 +383,23 @@ def createParser():
         dest='mcu_type',
         type=MIK32_Version,
         choices=list(MIK32_Version),
-        default=MIK32_Version.MIK32V2,
-        help="Выбор микроконтроллера. "
-        f"По умолчанию: {MIK32_Version.MIK32V2}"
+        default=MIK32_Version.AUTO,
+        help="Выбор микроконтроллера. auto - вариант, сохраненный для платы при запуске "
+        "с явно заданным вариантом, иначе MIK32V2. "
+        f"По умолчанию: {MIK32_Version.AUTO}"
+    )
+    parser.add_argument(
+        '--no-crc',
+        dest='use_crc',
+        action='store_false',
+        default=True,
+        help="Чтение всех данных без подсчета CRC на стороне МК"
+    )
+    parser.add_argument(
+        '--adapter-serial',
+        dest='adapter_serial',
+        default=None,
+        help="Серийный номер отладчика, если к компьютеру подключено несколько"
     )
     return parser
 
@@ -258,7 +411,7 @@ if __name__ == '__main__':
     namespace = parser.parse_args()
 
     if namespace.filepath:
-        upload_file(
+        result = check_file(
             namespace.filepath,
             host=namespace.openocd_host,
             port=namespace.openocd_port,
@@ -273,7 +426,10 @@ if __name__ == '__main__':
             boot_mode=namespace.boot_mode,
             log_path=namespace.log_path,
             post_action=namespace.post_action,
-            mik_version=namespace.mcu_type
+            mik_version=namespace.mcu_type,
+            use_crc=namespace.use_crc,
+            adapter_serial=namespace.adapter_serial,
         )
+        sys.exit(result)
     else:
         print("Nothing to check")
@@ -0,0 +1,153 @@
+from typing import List, Tuple, Union
+import zlib
+
+from hex_parser import Segment
+from tclrpc import OpenOcdTclRpc
+from utils import words2bytes
+from mik32_debug_hal.dma import DMA
+from mik32_debug_hal.spifi import SPIFI
+
+
+# Подсчет CRC-32 участков памяти на стороне МК: в ОЗУ записывается короткая
+# программа RV32I с таблицей CRC, список участков (адрес, длина) и результаты
+# передаются через ОЗУ. Вместо чтения всех данных по JTAG читается одно слово
+# на участок. CRC совпадает с zlib.crc32.
+
+RAM_START = 0x02000000
+RAM_SIZE = 16 * 1024
+
+# области ОЗУ (адрес, размер), которые изменяются между запусками программы:
+# окна буфера DMA команд SPIFI и дескрипторы цепочек DMA (чтение SFDP, установка QE
+# при проверке флеш памяти). Драйверы записи не загружаются, пока программа CRC в ОЗУ
+RESERVED_AREAS: List[Tuple[int, int]] = list(SPIFI.DMA_WINDOWS) + \
+    [(DMA.DESCRIPTORS_ADDRESS, DMA.MAX_CHAIN * 16)]
+
+# участков за один запуск программы
+MAX_REGIONS = 128
+
+# программа, таблица CRC и список участков подряд
+CODE_SIZE = 0x100
+TABLE_OFFSET = CODE_SIZE
+REGIONS_OFFSET = TABLE_OFFSET + 256 * 4
+AREA_SIZE = REGIONS_OFFSET + MAX_REGIONS * 8
+
+_A0, _A1, _A2 = 10, 11, 12
+_T0, _T1, _T2, _T3, _T4 = 5, 6, 7, 28, 29
+
+
+def _r_type(funct3: int, rd: int, rs1: int, rs2: int) -> int:
+    return (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | 0x33
+
+
+def _i_type(opcode: int, funct3: int, rd: int, rs1: int, imm: int) -> int:
+    return ((imm & 0xFFF) << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+
+def _s_type(funct3: int, rs1: int, rs2: int, imm: int) -> int:
+    return (((imm >> 5) & 0x7F) << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | ((imm & 0x1F) << 7) | 0x23
+
+
+def _b_type(funct3: int, rs1: int, rs2: int, offset: int) -> int:
+    return (((offset >> 12) & 1) << 31) | (((offset >> 5) & 0x3F) << 25) | (rs2 << 20) | (rs1 << 15) | \
+        (funct3 << 12) | (((offset >> 1) & 0xF) << 8) | (((offset >> 11) & 1) << 7) | 0x63
+
+
+def _jal(rd: int, offset: int) -> int:
+    return (((offset >> 20) & 1) << 31) | (((offset >> 1) & 0x3FF) << 21) | (((offset >> 11) & 1) << 20) | \
+        (((offset >> 12) & 0xFF) << 12) | (rd << 7) | 0x6F
+
+
+def _addi(rd: int, rs1: int, imm: int) -> int:
+    return _i_type(0x13, 0, rd, rs1, imm)
+
+
+# a0 - список участков, a1 - число участков, a2 - таблица CRC.
+# Длина участка заменяется его CRC, в конце - ebreak
+CODE: List[int] = [
+    _b_type(0, _A1, 0, 21 * 4),             # 0  loop_entry: beqz a1, done
+    _i_type(0x03, 2, _T0, _A0, 0),          # 1  lw t0, 0(a0)
+    _i_type(0x03, 2, _T1, _A0, 4),          # 2  lw t1, 4(a0)
+    _addi(_T2, 0, -1),                      # 3  li t2, 0xFFFFFFFF
+    _b_type(0, _T1, 0, 12 * 4),             # 4  loop_byte: beqz t1, entry_done
+    _i_type(0x03, 4, _T4, _T0, 0),          # 5  lbu t4, 0(t0)
+    _r_type(4, _T4, _T4, _T2),              # 6  xor t4, t4, t2
+    _i_type(0x13, 7, _T4, _T4, 0xFF),       # 7  andi t4, t4, 0xff
+    _i_type(0x13, 1, _T4, _T4, 2),          # 8  slli t4, t4, 2
+    _r_type(0, _T4, _T4, _A2),              # 9  add t4, t4, a2
+    _i_type(0x03, 2, _T4, _T4, 0),          # 10 lw t4, 0(t4)
+    _i_type(0x13, 5, _T2, _T2, 8),          # 11 srli t2, t2, 8
+    _r_type(4, _T2, _T2, _T4),              # 12 xor t2, t2, t4
+    _addi(_T0, _T0, 1),                     # 13 addi t0, t0, 1
+    _addi(_T1, _T1, -1),                    # 14 addi t1, t1, -1
+    _jal(0, -11 * 4),                       # 15 j loop_byte
+    _i_type(0x13, 4, _T2, _T2, -1),         # 16 entry_done: not t2
+    _s_type(2, _A0, _T2, 4),                # 17 sw t2, 4(a0)
+    _addi(_A0, _A0, 8),                     # 18 addi a0, a0, 8
+    _addi(_A1, _A1, -1),                    # 19 addi a1, a1, -1
+    _jal(0, -20 * 4),                       # 20 j loop_entry
+    0x00100073,                             # 21 done: ebreak
+]
+
+
+def _crc_table() -> List[int]:
+    table: List[int] = []
+    for index in range(256):
+        value = index
+        for _ in range(8):
+            value = (value >> 1) ^ 0xEDB88320 if value & 1 else value >> 1
+        table.append(value)
+    return table
+
+
+def host_crc(data: List[int]) -> int:
+    return zlib.crc32(bytes(data))
+
+
+def find_area(segments: List[Segment], size: int = AREA_SIZE) -> Union[int, None]:
+    """
+    Адрес области ОЗУ размером size, не пересекающейся с сегментами segments,
+    чтобы не испортить проверяемое содержимое ОЗУ, и с RESERVED_AREAS
+    @return: None, если свободной области нет
+    """
+    areas = [(segment.offset, segment.data.__len__()) for segment in segments] + RESERVED_AREAS
+    for base in range(RAM_START, RAM_START + RAM_SIZE - size + 1, CODE_SIZE):
+        if all(start + length <= base or base + size <= start for start, length in areas):
+            return base
+    return None
+
+
+class TargetCrc:
+    """Подсчет CRC-32 участков памяти программой в ОЗУ по адресу base"""
+
+    def __init__(self, openocd: OpenOcdTclRpc, base: int = RAM_START):
+        self.openocd = openocd
+        self.base = base
+        self.loaded = False
+
+    def load(self):
+        """Запись программы и таблицы CRC одной командой, прерывания отключаются"""
+        self.openocd.halt()
+        self.openocd.run("riscv.cpu set_reg {mstatus 0 mie 0}")
+        self.openocd.write_buffer(self.base, words2bytes(CODE + [0] * (CODE_SIZE // 4 - CODE.__len__()) + _crc_table()))
+        self.loaded = True
+
+    def crc(self, regions: List[Tuple[int, int]], timeout_seconds: float = 10) -> List[int]:
+        """
+        CRC-32 участков (адрес на шине, длина в байтах), до MAX_REGIONS за запуск.
+        Флеш память SPIFI должна быть в режиме отображения в память
+        """
+        if not self.loaded:
+            self.load()
+
+        result: List[int] = []
+        for start in range(0, regions.__len__(), MAX_REGIONS):
+            batch = regions[start:start + MAX_REGIONS]
+            regions_address = self.base + REGIONS_OFFSET
+            self.openocd.write_memory(regions_address, 32, [word for region in batch for word in region])
+            self.openocd.run(f"set_reg {{a0 {regions_address:#x} a1 {batch.__len__()} "
+                             f"a2 {self.base + TABLE_OFFSET:#x}}}")
+            self.openocd.resume(self.base)
+            self.openocd.run(f"wait_halt {int(timeout_seconds * 1000)}")
+            words = self.openocd.read_memory(regions_address, 32, batch.__len__() * 2)
+            result.extend(words[1::2])
+        return result
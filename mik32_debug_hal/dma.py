@@ -1,11 +1,12 @@
 from enum import Enum
-from typing import Dict, List
-import time
+from typing import Dict, List, NamedTuple
 from tclrpc import TclException
 from tclrpc import OpenOcdTclRpc
 from dataclasses import dataclass
 import mik32_debug_hal.registers.memory_map as mem_map
 import mik32_debug_hal.registers.bitfields.dma as dma_fields
+from mik32_debug_hal.registers.description import tcl_source
+import mik32_debug_hal.registers.peripherals as peripherals
 
 
 class DmaError(Exception):
@@ -49,7 +50,7 @@ class ChannelIncrement(Enum):
 class ChannelSize(Enum):
     BYTE = 0
     HALFWORD = 1
-    WORD = 1
+    WORD = 2
 
 
 class ChannelAck(Enum):
@@ -71,11 +72,48 @@ class ChannelRequest(Enum):
     TIMER32_0_REQUEST = 10
 
 
+# наибольшая длина передачи в байтах, в поле LEN канала записывается длина минус 1
+CHANNEL_MAX_LENGTH = 2**32
+
+
+class Transfer(NamedTuple):
+    """Одна передача цепочки: адреса и длина в байтах"""
+    source: int
+    destination: int
+    byte_count: int
+
+
+# Процедуры Tcl, выполняемые на стороне OpenOCD: ожидание завершения передачи
+# и запуск цепочки передач по дескрипторам в ОЗУ без обмена с компьютером
+# между передачами. Дескриптор - 4 слова в порядке регистров канала:
+# DESTINATION, SOURCE, LEN, CONFIG. С wait_first сначала ожидается передача,
+# запущенная до вызова. Адреса регистров задаются описанием peripherals.DMA
+TCL_PROCS = tcl_source([peripherals.DMA]) + """
+proc mik32_dma_wait {mask timeout_ms} {
+    set end [expr {[clock milliseconds] + $timeout_ms}]
+    while {([lindex [read_memory $::DMA_REGS_STATUS 32 1] 0] & $mask) == 0} {
+        if {[clock milliseconds] > $end} {
+            error "DMA timeout"
+        }
+    }
+}
+proc mik32_dma_chain {channel descriptors count wait_first timeout_ms} {
+    set registers [expr {$::DMA_REGS_CH0_DESTINATION + $channel * $::DMA_CHANNEL_SIZEOF}]
+    set mask [expr {1 << ($channel + $::DMA_STATUS_READY_S)}]
+    if {$wait_first} {
+        mik32_dma_wait $mask $timeout_ms
+    }
+    for {set i 0} {$i < $count} {incr i} {
+        write_memory $registers 32 [read_memory [expr {$descriptors + $i * 16}] 32 4]
+        mik32_dma_wait $mask $timeout_ms
+    }
+}
+"""
+
+
 class DMA_Channel:
     openocd: OpenOcdTclRpc
 
-    write_buffer: int = 0
-
     channel: ChannelIndex
     priority: ChannelPriority
 
@@ -97,61 +135,88 @@ class DMA_Channel:
         self.openocd = openocd
 
     def set_source(self, source: int):
-        self.openocd.write_word(mem_map.DMA_CHANNEL_SOURCE(1), source)
+        self.openocd.write_word(mem_map.DMA_CHANNEL_SOURCE(self.channel.value), source)
 
     def set_destination(self, source: int):
-        self.openocd.write_word(mem_map.DMA_CHANNEL_DESTINATION(1), source)
+        self.openocd.write_word(mem_map.DMA_CHANNEL_DESTINATION(self.channel.value), source)
 
     def set_length(self, source: int):
-        self.openocd.write_word(mem_map.DMA_CHANNEL_LEN(1), source)
+        self.openocd.write_word(mem_map.DMA_CHANNEL_LEN(self.channel.value), source)
 
     def set_config(self, source: int):
-        self.openocd.write_word(mem_map.DMA_CHANNEL_CONFIG(1), source)
+        self.openocd.write_word(mem_map.DMA_CHANNEL_CONFIG(self.channel.value), source)
+
+    def config(self) -> int:
+        """Слово настройки канала с разрешением передачи"""
+        return peripherals.DMA_CHANNEL_CONFIG.encode(
+            ENABLE=1,
+            PRIOR=self.priority.value,
+            READ_MODE=self.read_mode.value,
+            READ_INCREMENT=self.read_increment.value,
+            READ_SIZE=self.read_size.value,
+            READ_BURST_SIZE=self.read_burst_size,
+            READ_REQ=self.read_request.value,
+            ACK_READ=self.read_ack.value,
+            WRITE_MODE=self.write_mode.value,
+            WRITE_INCREMENT=self.write_increment.value,
+            WRITE_SIZE=self.write_size.value,
+            WRITE_BURST_SIZE=self.write_burst_size,
+            WRITE_REQ=self.write_request.value,
+            ACK_WRITE=self.write_ack.value,
+        )
+
+    def descriptor(self, transfer: Transfer) -> List[int]:
+        """Значения регистров канала для передачи, начиная с DESTINATION"""
+        if not (0 < transfer.byte_count <= CHANNEL_MAX_LENGTH):
+            raise DmaError(f"Wrong DMA transfer length {transfer.byte_count}")
+        return [transfer.destination, transfer.source, transfer.byte_count - 1, self.config()]
 
     def start(
             self,
             source_address: int,
             destination_address: int,
-            length: int,
+            byte_count: int,
     ):
-        self.write_buffer |= (dma_fields.CFG_CH_ENABLE_M
-                              | (self.priority.value << dma_fields.CFG_CH_PRIOR_S)
-                              | (self.read_mode.value << dma_fields.CFG_CH_READ_MODE_S)
-                              | (self.read_increment.value << dma_fields.CFG_CH_READ_INCREMENT_S)
-                              | (self.read_size.value << dma_fields.CFG_CH_READ_SIZE_S)
-                              | (self.read_burst_size << dma_fields.CFG_CH_READ_BURST_SIZE_S)
-                              | (self.read_request.value << dma_fields.CFG_CH_READ_REQ_S)
-                              | (self.read_ack.value << dma_fields.CFG_CH_ACK_READ_S)
-                              | (self.write_mode.value << dma_fields.CFG_CH_WRITE_MODE_S)
-                              | (self.write_increment.value << dma_fields.CFG_CH_WRITE_INCREMENT_S)
-                              | (self.write_size.value << dma_fields.CFG_CH_WRITE_SIZE_S)
-                              | (self.write_burst_size << dma_fields.CFG_CH_WRITE_BURST_SIZE_S)
-                              | (self.write_request.value << dma_fields.CFG_CH_WRITE_REQ_S)
-                              | (self.write_ack.value << dma_fields.CFG_CH_ACK_WRITE_S))
-
-        self.openocd.write_memory(mem_map.DMA_CHANNEL_DESTINATION(
-            1), 32, [destination_address, source_address, length, self.write_buffer])
+        """Запуск передачи byte_count байт"""
+        self.openocd.write_memory(mem_map.DMA_CHANNEL_DESTINATION(self.channel.value), 32,
+                                  self.descriptor(Transfer(source_address, destination_address, byte_count)))
 
 
 class DMA:
+    """
+    Регистр CONTROL только для записи: при чтении по его адресу возвращается
+    состояние каналов, поэтому его значение не кэшируется, а собирается
+    из current_value при каждой записи
+    """
+
     openocd: OpenOcdTclRpc
 
     current_value: CurrentValue = CurrentValue.ENABLE
-    write_buffer: int = 0
 
-    channels: List[DMA_Channel] = []
+    channels: List[DMA_Channel]
+
+    # дескрипторы цепочки передач в ОЗУ по умолчанию: между концом кода драйверов
+    # (0x02000E20) и буфером DMA команд SPIFI, до MAX_CHAIN дескрипторов
+    DESCRIPTORS_ADDRESS = 0x02000F80
+    MAX_CHAIN = 8
 
     def __init__(self, openocd: OpenOcdTclRpc):
         self.openocd = openocd
-        self.channels.append(DMA_Channel(self.openocd))
-        self.channels.append(DMA_Channel(self.openocd))
-        self.channels.append(DMA_Channel(self.openocd))
-        self.channels.append(DMA_Channel(self.openocd))
+        # каналы создаются для каждого экземпляра, так как привязаны к соединению
+        self.channels = [DMA_Channel(self.openocd) for _ in range(dma_fields.CHANNEL_COUNT)]
+        for index, channel in enumerate(self.channels):
+            channel.channel = ChannelIndex(index)
+        self.procs_defined = False
+
+    def define_procs(self):
+        """Определение процедур TCL_PROCS в OpenOCD, один раз для экземпляра"""
+        if not self.procs_defined:
+            self.openocd.run(TCL_PROCS)
+            self.procs_defined = True
 
     def init(self):
         self.current_value = CurrentValue.ENABLE
 
-        self.write_buffer = 0
         self.openocd.write_memory(0x40000, 32, [0] * 16)
         self.clear_irq()
         self.set_current_value(self.current_value)
@@ -170,44 +235,63 @@ class DMA:
         self.clear_global_irq()
         self.clear_error_irq()
 
+    def control(self, clear_irq: int = 0) -> int:
+        """Значение CONTROL с текущим current_value и битами сброса прерываний clear_irq"""
+        return peripherals.DMA.CONTROL.encode(CURRENT_VALUE=self.current_value.value) | clear_irq
+
     def clear_local_irq(self):
-        self.write_buffer &= ~(dma_fields.CONTROL_CLEAR_LOCAL_IRQ_M |
-                               dma_fields.CONTROL_CLEAR_GLOBAL_IRQ_M | dma_fields.CONTROL_CLEAR_ERROR_IRQ_M)
-        self.write_buffer |= dma_fields.CONTROL_CLEAR_LOCAL_IRQ_M
-        self.set_control(self.write_buffer)
-        self.write_buffer &= ~(dma_fields.CONTROL_CLEAR_LOCAL_IRQ_M |
-                               dma_fields.CONTROL_CLEAR_GLOBAL_IRQ_M | dma_fields.CONTROL_CLEAR_ERROR_IRQ_M)
+        self.set_control(self.control(dma_fields.CONTROL_CLEAR_LOCAL_IRQ_M))
 
     def clear_global_irq(self):
-        self.write_buffer &= ~(dma_fields.CONTROL_CLEAR_LOCAL_IRQ_M |
-                               dma_fields.CONTROL_CLEAR_GLOBAL_IRQ_M | dma_fields.CONTROL_CLEAR_ERROR_IRQ_M)
-        self.write_buffer |= dma_fields.CONTROL_CLEAR_GLOBAL_IRQ_M
-        self.set_control(self.write_buffer)
-        self.write_buffer &= ~(dma_fields.CONTROL_CLEAR_LOCAL_IRQ_M |
-                               dma_fields.CONTROL_CLEAR_GLOBAL_IRQ_M | dma_fields.CONTROL_CLEAR_ERROR_IRQ_M)
+        self.set_control(self.control(dma_fields.CONTROL_CLEAR_GLOBAL_IRQ_M))
 
     def clear_error_irq(self):
-        self.write_buffer &= ~(dma_fields.CONTROL_CLEAR_LOCAL_IRQ_M |
-                               dma_fields.CONTROL_CLEAR_GLOBAL_IRQ_M | dma_fields.CONTROL_CLEAR_ERROR_IRQ_M)
-        self.write_buffer |= dma_fields.CONTROL_CLEAR_ERROR_IRQ_M
-        self.set_control(self.write_buffer)
-        self.write_buffer &= ~(dma_fields.CONTROL_CLEAR_LOCAL_IRQ_M |
-                               dma_fields.CONTROL_CLEAR_GLOBAL_IRQ_M | dma_fields.CONTROL_CLEAR_ERROR_IRQ_M)
+        self.set_control(self.control(dma_fields.CONTROL_CLEAR_ERROR_IRQ_M))
 
     def set_current_value(self, current_value: CurrentValue):
         self.current_value = current_value
-        self.write_buffer &= ~(dma_fields.CONTROL_CURRENT_VALUE_M)
-        self.write_buffer |= current_value.value << dma_fields.CONTROL_CURRENT_VALUE_S
-        self.set_control(self.write_buffer)
+        self.set_control(self.control())
 
     def dma_wait(self, channel: DMA_Channel, timeout: float):
-        channel_index = channel.channel.value
-        mask = (1 << channel_index) << dma_fields.STATUS_READY_S
-
-        begin = time.perf_counter()
+        """Ожидание завершения передачи на стороне OpenOCD за одно обращение"""
+        mask = (1 << channel.channel.value) << dma_fields.STATUS_READY_S
 
-        while (begin - time.perf_counter()) < timeout:
-            if self.get_control() & mask != 0:
-                return
+        self.define_procs()
+        try:
+            self.openocd.run(f"mik32_dma_wait {mask:#x} {max(int(timeout * 1000), 1)}")
+        except TclException as e:
+            raise DmaError(f"DMA channel {channel.channel.value} timeout: {e.msg}")
 
-        raise DmaError
+    def run_chain(
+            self,
+            channel: DMA_Channel,
+            transfers: List[Transfer],
+            descriptors_address: int = DESCRIPTORS_ADDRESS,
+            timeout: float = 1.0,
+            started=False,
+    ):
+        """
+        Выполнение передач друг за другом по дескрипторам, записанным в ОЗУ
+        по адресу descriptors_address. Каналы MIK32 не читают дескрипторы
+        сами, поэтому цепочку запускает процедура mik32_dma_chain в OpenOCD
+        за одно обращение.
+        @timeout: время ожидания каждой передачи в секундах
+        @started: первая передача уже запущена DMA_Channel.start, например
+        до команды периферии, которая выдает запросы каналу
+        """
+        pending = transfers[1:] if started else transfers
+        if pending.__len__() > self.MAX_CHAIN:
+            raise DmaError(f"DMA chain of {pending.__len__()} transfers is longer than {self.MAX_CHAIN}")
+
+        descriptors: List[int] = []
+        for transfer in pending:
+            descriptors.extend(channel.descriptor(transfer))
+
+        self.define_procs()
+        if descriptors:
+            self.openocd.write_memory(descriptors_address, 32, descriptors)
+        try:
+            self.openocd.run(f"mik32_dma_chain {channel.channel.value} {descriptors_address:#x} "
+                             f"{pending.__len__()} {int(started)} {max(int(timeout * 1000), 1)}")
+        except TclException as e:
+            raise DmaError(f"DMA channel {channel.channel.value} chain failed: {e.msg}")
@@ -2,13 +2,17 @@ from enum import Enum
 import os
 import pathlib
 import sys
-from typing import Dict, List
+from typing import Dict, List, Union
 import time
 from tclrpc import OpenOcdTclRpc, TclException
 from utils import bytes2words
+import mik32_debug_hal.ram as ram
+import profiler
+import progress
 
-import mik32_debug_hal.registers.memory_map as mem_map
 import mik32_debug_hal.registers.bitfields.eeprom as eeprom_fields
+from mik32_debug_hal.registers.description import WritePlan, tcl_source
+import mik32_debug_hal.registers.peripherals as peripherals
 
 
 def combine_pages(pages: Dict[int, List[int]]) -> List[int]:
@@ -30,14 +34,47 @@ def combine_pages(pages: Dict[int, List[int]]) -> List[int]:
     return bytes_list
 
 
+# наибольшее число страниц, которое можно передать драйверу
+DRIVER_MAX_PAGE_COUNT = 64 - 1
+
+# Процедуры Tcl, выполняемые на стороне OpenOCD: запись буфера страницы через
+# EEDAT с запуском операции и чтение слов через EEDAT за одно обращение.
+# Адрес EEDAT увеличивается контроллером после каждого обращения.
+# Адреса регистров задаются описанием peripherals.EEPROM
+TCL_PROCS = tcl_source([peripherals.EEPROM]) + """
+proc mik32_eeprom_execute {address buffer_control words start_control} {
+    write_memory $::EEPROM_REGS_EEA 32 [list $address $buffer_control]
+    foreach word $words {
+        write_memory $::EEPROM_REGS_EEDAT 32 [list $word]
+    }
+    write_memory $::EEPROM_REGS_EECON 32 [list $start_control]
+}
+proc mik32_eeprom_read {address count} {
+    write_memory $::EEPROM_REGS_EEA 32 [list $address]
+    set words {}
+    for {set i 0} {$i < $count} {incr i} {
+        lappend words [lindex [read_memory $::EEPROM_REGS_EEDAT 32 1] 0]
+    }
+    return $words
+}
+"""
+
+
 class EEPROM():
     openocd: OpenOcdTclRpc
 
     def __init__(self, openocd: OpenOcdTclRpc):
         self.openocd = openocd
+        self.procs_defined = False
 
         self.eeprom_sysinit()
 
+    def define_procs(self):
+        """Определение процедур TCL_PROCS в OpenOCD, один раз для экземпляра"""
+        if not self.procs_defined:
+            self.openocd.run(TCL_PROCS)
+            self.procs_defined = True
+
     def eeprom_sysinit(self):
         print("MCU clock init...", flush=True)
 
@@ -53,26 +90,35 @@ class EEPROM():
         GLOBAL = eeprom_fields.BEH_GLOB
 
     def eeprom_execute_operation(self, op: EEPROM_Operation, affected_pages: EEPROM_AffectedPages, offset: int, buffer: List[int]):
-        # buffer write enable and select affected pages
-        self.openocd.write_memory(mem_map.EEPROM_REGS_EEA, 32, [offset, (1 << eeprom_fields.EECON_BWE_S)
-                                                                | (affected_pages.value << eeprom_fields.EECON_WRBEH_S)])
-
         if buffer.__len__() > 32:
             return
-        for word in buffer:
-            self.openocd.write_word(mem_map.EEPROM_REGS_EEDAT, word)
+        # buffer write enable and select affected pages
+        buffer_control = peripherals.EEPROM.EECON.encode(BWE=1, WRBEH=affected_pages.value)
         # start operation
-        self.openocd.write_word(mem_map.EEPROM_REGS_EECON, (
-            (1 << eeprom_fields.EECON_EX_S) | (1 << eeprom_fields.EECON_BWE_S) |
-            (op.value << eeprom_fields.EECON_OP_S) | (
-                affected_pages.value << eeprom_fields.EECON_WRBEH_S)
-        ))
+        start_control = peripherals.EEPROM.EECON.encode(
+            EX=1, BWE=1, OP=op.value, WRBEH=affected_pages.value)
+
+        # запись буфера и запуск операции за одно обращение к OpenOCD
+        self.define_procs()
+        words = ' '.join(f"{word:#x}" for word in buffer)
+        self.openocd.run(
+            f"mik32_eeprom_execute {offset:#x} {buffer_control:#x} {{{words}}} {start_control:#x}")
+
+    def eeprom_read_words_apb(self, offset: int, count: int) -> List[int]:
+        """Чтение count слов через регистр EEDAT, начиная с offset, за одно обращение к OpenOCD"""
+        if count == 0:
+            return []
+        self.define_procs()
+        data = self.openocd.run(f"mik32_eeprom_read {offset:#x} {count}").split()
+        return [int(word, base=16) for word in data]
 
     def eeprom_configure_cycles(self, LD=1, R_1=2, R_2=1, CYCEP1=66667, CYCEP2=500):
-        self.openocd.write_word(mem_map.EEPROM_REGS_NCYCRL, LD << eeprom_fields.NCYCRL_N_LD_S |
-                                R_1 << eeprom_fields.NCYCRL_N_R_1_S | R_2 << eeprom_fields.NCYCRL_N_R_2_S)
-        self.openocd.write_word(mem_map.EEPROM_REGS_NCYCEP1, CYCEP1)
-        self.openocd.write_word(mem_map.EEPROM_REGS_NCYCEP2, CYCEP2)
+        # NCYCRL, NCYCEP1 и NCYCEP2 записываются одной командой
+        plan = WritePlan()
+        plan.write(peripherals.EEPROM.NCYCRL, peripherals.EEPROM.NCYCRL.encode(N_LD=LD, N_R_1=R_1, N_R_2=R_2))
+        plan.write(peripherals.EEPROM.NCYCEP1, CYCEP1)
+        plan.write(peripherals.EEPROM.NCYCEP2, CYCEP2)
+        plan.execute(self.openocd)
 
     def eeprom_global_erase(self):
         print("EEPROM global erase...", flush=True)
@@ -84,12 +130,11 @@ class EEPROM():
         print("EEPROM global erase check through APB...", flush=True)
         print("  Read Data at ...", flush=True)
         ex_value = 0x00000000
-        self.openocd.write_word(mem_map.EEPROM_REGS_EEA, 0x00000000)
+        values = self.eeprom_read_words_apb(0x00000000, 64 * 32)
         for i in range(0, 64):
             print(f"    Row={i+1}/64")
             for j in range(0, 32):
-                value = self.openocd.read_memory(
-                    mem_map.EEPROM_REGS_EEDAT, 32, 1)[0]
+                value = values[i * 32 + j]
                 if ex_value != value:
                     print(
                         f"Unexpect value at Row {i}, Word {j}, expect {ex_value:#0x}, {value:#0x}", flush=True)
@@ -107,14 +152,16 @@ class EEPROM():
     def eeprom_check_data_apb(self, words: List[int], offset: int, print_progress=True) -> int:
         if print_progress:
             print("EEPROM check through APB...", flush=True)
-        # address load
-        self.openocd.write_word(mem_map.EEPROM_REGS_EEA, offset)
+        values = self.eeprom_read_words_apb(offset, len(words))
+        if len(words) != len(values):
+            print("ERROR: Wrong number of words in EEDAT read output!")
+            return 1
         word_num = 0
         progress = 0
         if print_progress:
             print("[", end="", flush=True)
         for word in words:
-            value: int = self.openocd.read_word(mem_map.EEPROM_REGS_EEDAT)
+            value: int = values[word_num]
             if words[word_num] != value:
                 print(
                     f"Unexpect value at {word_num} word, expect {word:#0x}, get {value:#0x}", flush=True)
@@ -170,31 +217,36 @@ class EEPROM():
 
         pages_offsets = list(pages)
 
+        task = progress.start('eeprom verify', pages_offsets.__len__() * 128)
         for index, page_offset in enumerate(pages_offsets):
             page_words = bytes2words(pages[page_offset])
 
-            print(
-                f"Check page {page_offset:#06x}... {(index*100)//pages_offsets.__len__()}%", flush=True)
+            progress.detail(
+                f"Check page {page_offset:#06x}... {(index*100)//pages_offsets.__len__()}%")
 
             if self.eeprom_check_data(page_words, page_offset, False):
+                task.finish(False)
                 print("Page mismatch!", flush=True)
                 return 1
+            task.advance(128, page_offset)
 
+        task.finish()
         print("EEPROM page check completed", flush=True)
         return 0
 
     def write_pages(self, pages: Dict[int, List[int]]) -> int:
         self.openocd.halt()
         self.eeprom_sysinit()
-        self.eeprom_global_erase()
-
-        if self.eeprom_check_data_ahb_lite([0]*2048, 0, False):
-            print("EEPROM global erase failed, try again", flush=True)
+        with profiler.phase('eeprom erase'):
             self.eeprom_global_erase()
 
             if self.eeprom_check_data_ahb_lite([0]*2048, 0, False):
-                print("EEPROM global erase failed", flush=True)
-                return 1
+                print("EEPROM global erase failed, try again", flush=True)
+                self.eeprom_global_erase()
+
+                if self.eeprom_check_data_ahb_lite([0]*2048, 0, False):
+                    print("EEPROM global erase failed", flush=True)
+                    return 1
             
         # configure cycles duration
         self.eeprom_configure_cycles(1, 3, 1, 100000, 1000)
@@ -203,28 +255,51 @@ class EEPROM():
 
         pages_offsets = list(pages)
 
+        task = progress.start('eeprom program', pages_offsets.__len__() * 128)
         for index, page_offset in enumerate(pages_offsets):
             page_words = bytes2words(pages[page_offset])
 
-            print(
-                f"Writing page {page_offset:#06x}... {(index*100)//pages_offsets.__len__()}%", flush=True)
-            self.eeprom_write_page(page_offset, page_words)
+            progress.detail(
+                f"Writing page {page_offset:#06x}... {(index*100)//pages_offsets.__len__()}%")
+            with profiler.phase('eeprom program', address=page_offset):
+                self.eeprom_write_page(page_offset, page_words)
 
-            if self.eeprom_check_data(page_words, page_offset, False):
-                print("Page mismatch!", flush=True)
-                return 1
+            with profiler.phase('eeprom verify', address=page_offset):
+                if self.eeprom_check_data(page_words, page_offset, False):
+                    task.finish(False)
+                    print("Page mismatch!", flush=True)
+                    return 1
+            task.advance(128, page_offset)
 
+        task.finish()
         print("EEPROM page recording completed", flush=True)
         return 0
 
     def wait_halted(self, timeout_seconds: float = 2):
         self.openocd.run(f'wait_halt {int(timeout_seconds * 1000)}')
 
-    def write_memory(self, pages: Dict[int, List[int]], driver_path: str) -> int:
+    def write_pages_apb(self, bytes_list: List[int], offset: int) -> int:
+        """
+        Записать страницы после offset, стертые драйвером, через регистры EEPROM
+        """
+        self.eeprom_configure_cycles(1, 3, 1, 100000, 1000)
+        for page_offset in range(offset, len(bytes_list), 128):
+            page_words = bytes2words(bytes_list[page_offset:page_offset + 128])
+            progress.detail(f"Writing page {page_offset:#06x}...")
+            with profiler.phase('eeprom program', address=page_offset):
+                self.eeprom_write_page(page_offset, page_words)
+            with profiler.phase('eeprom verify', address=page_offset):
+                if self.eeprom_check_data(page_words, page_offset, False):
+                    print(f"Page {page_offset // 128} mismatch!", flush=True)
+                    return 1
+        return 0
+
+    def write_memory(self, pages: Dict[int, List[int]], driver_path: Union[str, ram.DriverImage]) -> int:
         """
         Записать всю память с использованием драйвера.
 
         pages: Dict[int, List[int]] -- страница - список байт, ключ - адрес в EEPROM
+        driver_path -- путь к файлу драйвера или заранее прочитанный образ драйвера
         """
 
         # TODO: добавить проверку на версию mik32 - текущий драйвер поддерживает
@@ -241,18 +316,23 @@ class EEPROM():
 
         STATUS_CODE_M = 0xFF
 
-        max_address = len(bytes_list) // 128
+        # поле числа страниц в слове статуса драйвера шестибитное, последняя
+        # страница полностью заполненной EEPROM записывается без драйвера
+        page_count = len(bytes_list) // 128
+        max_address = min(page_count, DRIVER_MAX_PAGE_COUNT)
         self.openocd.write_memory(RAM_DRIVER_STATUS, 32, [
                                   1 | (max_address << 8)])
 
         pathname = os.path.dirname(sys.argv[0])
 
         print("Uploading driver... ", end="", flush=True)
-        self.openocd.run(f"load_image {{{pathlib.Path(driver_path)}}}")
+        with profiler.phase('eeprom driver load'):
+            ram.load_driver(self.openocd, driver_path)
         print("OK!", flush=True)
 
         print("Uploading data...   ", end="", flush=True)
-        result = self.openocd.write_memory(RAM_BUFFER_OFFSET, 8, bytes_list)
+        with profiler.phase('eeprom data upload'):
+            result = self.openocd.write_buffer(RAM_BUFFER_OFFSET, bytes_list)
         if result:
             print("ERROR!", flush=True)
             print("An error occurred while writing data to the buffer area!")
@@ -265,23 +345,33 @@ class EEPROM():
         self.openocd.run(f"wp 0x{RAM_DRIVER_STATUS:08x} 4 w")
 
         print("Run driver...", flush=True)
-        self.openocd.resume(RAM_OFFSET)
+        task = progress.start('eeprom program', len(bytes_list))
+        # драйвер стирает, записывает и проверяет память за один запуск
+        with profiler.phase('eeprom program'):
+            self.openocd.resume(RAM_OFFSET)
 
-        try:
-            # ждем, когда watchpoint сработает
-            self.wait_halted(10)
-        except TclException:
-            print("Timeout!", flush=True)
-            # return 1
+            try:
+                # ждем, когда watchpoint сработает
+                self.wait_halted(10)
+            except TclException:
+                print("Timeout!", flush=True)
+                # return 1
 
-        # watchpoint ловит до изменения слова
-        self.openocd.run(f"rwp 0x{RAM_DRIVER_STATUS:08x}")
-        # делаем шаг, чтобы прочитать новое слово
-        self.openocd.run("step")
+            # watchpoint ловит до изменения слова
+            self.openocd.run(f"rwp 0x{RAM_DRIVER_STATUS:08x}")
+            # делаем шаг, чтобы прочитать новое слово
+            self.openocd.run("step")
 
-        result = self.openocd.read_memory(RAM_DRIVER_STATUS, 32, 1)[0]
+            result = self.openocd.read_memory(RAM_DRIVER_STATUS, 32, 1)[0]
 
         if (result & STATUS_CODE_M) == 0:
+            task.advance(max_address * 128, max_address * 128)
+            if page_count > max_address:
+                if self.write_pages_apb(bytes_list, max_address * 128):
+                    task.finish(False)
+                    return 1
+                task.advance((page_count - max_address) * 128, len(bytes_list))
+            task.finish()
             print(f"EEPROM writing successfully completed!", flush=True)
         else:
             miss_page = (result >> 8) & (64 - 1)
@@ -289,6 +379,7 @@ class EEPROM():
             expected_byte = pages[miss_page*128][miss_byte]
             miss_byte = (result >> 24) & 0xFF
 
+            task.finish(False)
             print(f"EEPROM writing failed!", flush=True)
             print(f"First mismatched byte in page {miss_page},")
             print(
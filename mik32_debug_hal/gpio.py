@@ -1,31 +1,54 @@
 from enum import Enum
+from typing import Union
 from tclrpc import OpenOcdTclRpc
 import mik32_debug_hal.registers.memory_map as mem_map
+from mik32_debug_hal.register_cache import RegisterCache
 
 
 class MIK32_Version(Enum):
     MIK32V0 = "MIK32V0"
     MIK32V2 = "MIK32V2"
+    # определяется при подключении, см. target_probe.resolve_version
+    AUTO = "auto"
 
     def __str__(self):
         return self.value
 
 
-port2_value = 0
+# регистр настройки выводов порта 2 (выводы SPIFI), который пишет только компьютер
+CACHEABLE_REGISTERS = frozenset([
+    mem_map.PAD_CONFIG_REGS + mem_map.PAD_CONFIG_REGS_V0.PORT_2_CFG.value,
+    mem_map.PAD_CONFIG_REGS + mem_map.PAD_CONFIG_REGS_V2.PORT_2_CFG.value,
+])
+
 
+# значение PORT_2_CFG до последнего вызова gpio_init
+port2_value = 0
 
-def gpio_init(openocd: OpenOcdTclRpc, version: MIK32_Version):
 
-    port2_addr = 0
+def port2_address(version: MIK32_Version) -> Union[int, None]:
     if version == MIK32_Version.MIK32V0:
-        port2_addr = mem_map.PAD_CONFIG_REGS + mem_map.PAD_CONFIG_REGS_V0.PORT_2_CFG.value
+        return mem_map.PAD_CONFIG_REGS + mem_map.PAD_CONFIG_REGS_V0.PORT_2_CFG.value
     elif version == MIK32_Version.MIK32V2:
-        port2_addr = mem_map.PAD_CONFIG_REGS + mem_map.PAD_CONFIG_REGS_V2.PORT_2_CFG.value
-    else:
-        return
+        return mem_map.PAD_CONFIG_REGS + mem_map.PAD_CONFIG_REGS_V2.PORT_2_CFG.value
+    return None
+
+
+def gpio_init(openocd: OpenOcdTclRpc, version: MIK32_Version) -> int:
+    """
+    Настройка выводов порта 2 для SPIFI.
+    @return: значение PORT_2_CFG до настройки для gpio_deinit
+    """
+    global port2_value
+
+    port2_addr = port2_address(version)
+    if port2_addr is None:
+        return 0
+
+    registers = RegisterCache(openocd, CACHEABLE_REGISTERS)
 
     openocd.halt()
-    port2_value = openocd.read_memory(port2_addr, 32, 1)[0]
+    port2_value = registers.read(port2_addr)
 
     port2_value_updated = port2_value
 
@@ -35,22 +58,22 @@ def gpio_init(openocd: OpenOcdTclRpc, version: MIK32_Version):
         port2_value_updated |= 0x000
     elif version == MIK32_Version.MIK32V2:
         port2_value_updated |= 0x555
-    else:
-        return
-    
 
-    openocd.write_word(port2_addr, port2_value_updated)
+    registers.write(port2_addr, port2_value_updated)
 
-    openocd.write_word(port2_addr + 8, 0x0500)
+    registers.write(port2_addr + 8, 0x0500)
 
+    return port2_value
 
-def gpio_deinit(openocd: OpenOcdTclRpc, version: MIK32_Version):
 
-    if version == MIK32_Version.MIK32V0:
-        port2_addr = mem_map.PAD_CONFIG_REGS + mem_map.PAD_CONFIG_REGS_V0.PORT_2_CFG.value
-    elif version == MIK32_Version.MIK32V2:
-        port2_addr = mem_map.PAD_CONFIG_REGS + mem_map.PAD_CONFIG_REGS_V2.PORT_2_CFG.value
-    else:
+def gpio_deinit(openocd: OpenOcdTclRpc, version: MIK32_Version, value: Union[int, None] = None):
+    """
+    Восстановление PORT_2_CFG.
+    @value: значение, возвращенное gpio_init, по умолчанию - сохраненное последним вызовом
+    """
+    port2_addr = port2_address(version)
+    if port2_addr is None:
         return
 
-    openocd.write_word(port2_addr, port2_value)
+    RegisterCache(openocd, CACHEABLE_REGISTERS).write(
+        port2_addr, port2_value if value is None else value)
@@ -1,85 +1,174 @@
-from tclrpc import OpenOcdTclRpc
+from enum import Enum
+from typing import NamedTuple, Union
+from tclrpc import OpenOcdTclRpc, TargetState
 import mik32_debug_hal.registers.memory_map as mem_map
 import mik32_debug_hal.registers.bitfields.power_manager as pm_fields
 import mik32_debug_hal.registers.bitfields.wakeup as wake_fields
+from mik32_debug_hal.registers.description import WritePlan
 
 
-def pm_init(openocd: OpenOcdTclRpc) -> int:
+class ClockProfile(NamedTuple):
+    """
+    Делители частоты шин AHB, APB_M и APB_P: частота шины равна
+    системной частоте, деленной на (делитель + 1)
+    """
+    div_ahb: int
+    div_apb_m: int
+    div_apb_p: int
+
+
+class ClockMode(Enum):
+    KEEP = 'keep'  # делители, установленные прошивкой
+    FAST = 'fast'  # без деления системной частоты на время записи
+
+    def __str__(self):
+        return self.value
+
+
+# без деления частоты EEPROM и SPIFI тактируются системной частотой,
+# на которую рассчитаны длительности операций EEPROM (eeprom_configure_cycles).
+# Источник системной частоты не переключается, так как внешний
+# кварцевый резонатор может отсутствовать на плате
+FAST_PROFILE = ClockProfile(0, 0, 0)
+
+# начальные значения регистров тактирования
+APB_P_default = 0
+
+AHB_default = (
+    pm_fields.CLOCK_AHB_CPU_M |
+    pm_fields.CLOCK_AHB_EEPROM_M |
+    pm_fields.CLOCK_AHB_RAM_M |
+    pm_fields.CLOCK_AHB_SPIFI_M |
+    pm_fields.CLOCK_AHB_TCB_M |
+    pm_fields.CLOCK_AHB_DMA_M
+)
+
+APB_M_default = (
+    pm_fields.CLOCK_APB_M_PM_M |
+    pm_fields.CLOCK_APB_M_PAD_CONFIG_M |
+    pm_fields.CLOCK_APB_M_WU_M
+)
+
+WU_CLOCKS_default = 128 << wake_fields.CLOCKS_BU_ADJ_RC32K_S
+
+
+class ClockState(NamedTuple):
+    """Делители и включенные такты шин"""
+    profile: ClockProfile
+    ahb: int
+    apb_m: int
+    apb_p: int
+    wu_clocks: int
+
+
+class PmInitResult(NamedTuple):
+    """Результат pm_init"""
+    # 0 - успех, 1 - ошибка
+    result: int
+    # делители до вызова pm_init для pm_deinit, None - pm_init их не менял
+    original_profile: Union[ClockProfile, None]
+
+
+def pm_read(openocd: OpenOcdTclRpc) -> ClockState:
+    """
+    Чтение настроек тактирования: регистры PM от DIV_AHB до CLK_APB_P_SET
+    читаются одной командой, CLOCKS_BU в блоке WU - второй
+    """
+    pm = openocd.read_memory(mem_map.PM_Div_AHB_OFFSET, 32,
+                             (mem_map.PM_Clk_APB_P_Set_OFFSET - mem_map.PM_Div_AHB_OFFSET) // 4 + 1)
+    return ClockState(
+        ClockProfile(pm[0], pm[1], pm[2]),
+        ahb=pm[(mem_map.PM_Clk_AHB_Set_OFFSET - mem_map.PM_Div_AHB_OFFSET) // 4],
+        apb_m=pm[(mem_map.PM_Clk_APB_M_Set_OFFSET - mem_map.PM_Div_AHB_OFFSET) // 4],
+        apb_p=pm[(mem_map.PM_Clk_APB_P_Set_OFFSET - mem_map.PM_Div_AHB_OFFSET) // 4],
+        wu_clocks=openocd.read_word(mem_map.WU_CLOCKS_BU_OFFSET),
+    )
+
+
+def pm_write_plan(state: ClockState) -> WritePlan:
+    """
+    Запись настроек тактирования: регистры PM от DIV_AHB до CLK_APB_P_CLEAR
+    идут подряд и записываются одной командой. Маски установки и сброса
+    взаимно дополняют друг друга, поэтому порядок SET и CLEAR не важен
+    """
+    plan = WritePlan()
+    plan.write(mem_map.PM_Div_AHB_OFFSET, state.profile.div_ahb)
+    plan.write(mem_map.PM_Div_APB_M_OFFSET, state.profile.div_apb_m)
+    plan.write(mem_map.PM_Div_APB_P_OFFSET, state.profile.div_apb_p)
+    plan.write(mem_map.PM_Clk_AHB_Set_OFFSET, state.ahb)
+    plan.write(mem_map.PM_Clk_AHB_Clear_OFFSET, ~state.ahb)
+    plan.write(mem_map.PM_Clk_APB_M_Set_OFFSET, state.apb_m)
+    plan.write(mem_map.PM_Clk_APB_M_Clear_OFFSET, ~state.apb_m)
+    plan.write(mem_map.PM_Clk_APB_P_Set_OFFSET, state.apb_p)
+    plan.write(mem_map.PM_Clk_APB_P_Clear_OFFSET, ~state.apb_p)
+    plan.write(mem_map.WU_CLOCKS_BU_OFFSET, state.wu_clocks)
+    return plan
+
+
+def pm_init(openocd: OpenOcdTclRpc, clock_mode: ClockMode = ClockMode.KEEP) -> PmInitResult:
     """ Настройка тактирования
 
+    Регистры читаются, и запись выполняется только если настройки отличаются
+    от требуемых.
+
     Ключевые аргументы:
     openocd - объект для доступа к интерфейсу Tcl OpenOCD
+    clock_mode - делители частоты на время записи, исходные делители
+    восстанавливает pm_deinit
 
     Возвращаемое значение:
-    0 - успех
-    1 - ошибка
+    PmInitResult: 0 - успех, 1 - ошибка, и исходные делители, которые
+    передаются pm_deinit
     """
-
     iter = 1
     max_iter = 2  # число попыток записи регистров
 
-    while True:
-        print('Clock init... ', end='')
-
-        # определение начальных значений регистров
-        APB_P_default = 0
-
-        AHB_default = (
-            pm_fields.CLOCK_AHB_CPU_M |
-            pm_fields.CLOCK_AHB_EEPROM_M |
-            pm_fields.CLOCK_AHB_RAM_M |
-            pm_fields.CLOCK_AHB_SPIFI_M |
-            pm_fields.CLOCK_AHB_TCB_M |
-            pm_fields.CLOCK_AHB_DMA_M
-        )
-
-        APB_M_default = (
-            pm_fields.CLOCK_APB_M_PM_M |
-            pm_fields.CLOCK_APB_M_PAD_CONFIG_M |
-            pm_fields.CLOCK_APB_M_WU_M
-        )
-
-        WU_CLOCKS_default = 128 << wake_fields.CLOCKS_BU_ADJ_RC32K_S
+    print('Clock init... ', end='')
 
-        # запись начальных значений в регистры
-        openocd.halt()
-
-        openocd.write_word(mem_map.PM_Clk_APB_P_Clear_OFFSET, ~APB_P_default)
-        openocd.write_word(mem_map.PM_Clk_APB_P_Set_OFFSET, APB_P_default)
+    openocd.halt()
+    real = pm_read(openocd)
 
-        openocd.write_word(mem_map.PM_Clk_AHB_Clear_OFFSET, ~AHB_default)
-        openocd.write_word(mem_map.PM_Clk_AHB_Set_OFFSET, AHB_default)
+    profile = FAST_PROFILE if clock_mode == ClockMode.FAST else real.profile
+    original_profile = real.profile if profile != real.profile else None
 
-        openocd.write_word(mem_map.PM_Clk_APB_M_Clear_OFFSET, ~APB_M_default)
-        openocd.write_word(mem_map.PM_Clk_APB_M_Set_OFFSET, APB_M_default)
+    default = ClockState(profile, AHB_default, APB_M_default, APB_P_default, WU_CLOCKS_default)
 
-        openocd.write_word(mem_map.WU_CLOCKS_BU_OFFSET, WU_CLOCKS_default)
+    while real != default:
+        pm_write_plan(default).execute(openocd)
 
         # проверка записи на случай неожиданного ресета и перезаписи прошивкой
-        APB_P_real = openocd.read_word(mem_map.PM_Clk_APB_P_Set_OFFSET)
-        AHB_real = openocd.read_word(mem_map.PM_Clk_AHB_Set_OFFSET)
-        APB_M_real = openocd.read_word(mem_map.PM_Clk_APB_M_Set_OFFSET)
-        WU_CLOCKS_real = openocd.read_word(mem_map.WU_CLOCKS_BU_OFFSET)
-
-        if (
-            (WU_CLOCKS_real == WU_CLOCKS_default) and
-            (AHB_real == AHB_default) and
-            (APB_M_real == APB_M_default) and
-            (APB_P_real == APB_P_default)
-        ):
-            print('OK!')
-            return 0
+        real = pm_read(openocd)
+        if real == default:
+            break
 
         print('\nPM initialization results:')
-        print(
-            f'wu    def 0x{WU_CLOCKS_default:08x} real 0x{WU_CLOCKS_real:08x}')
-        print(f'ahb   def 0x{AHB_default:08x} real 0x{AHB_real:08x}')
-        print(f'apb_m def 0x{APB_M_default:08x} real 0x{APB_M_real:08x}')
-        print(f'apb_p def 0x{APB_P_default:08x} real 0x{APB_P_real:08x}')
+        print(f'wu    def 0x{default.wu_clocks:08x} real 0x{real.wu_clocks:08x}')
+        print(f'ahb   def 0x{default.ahb:08x} real 0x{real.ahb:08x}')
+        print(f'apb_m def 0x{default.apb_m:08x} real 0x{real.apb_m:08x}')
+        print(f'apb_p def 0x{default.apb_p:08x} real 0x{real.apb_p:08x}')
+        print(f'div   def {tuple(default.profile)} real {tuple(real.profile)}')
 
         iter += 1
         if iter > max_iter:
             print('ERROR: PM initialization failed, aborting', flush=True)
-            return 1
+            return PmInitResult(1, original_profile)
 
         print(f'ERROR: PM initialization failed, retry #{iter}...', flush=True)
+        # после неожиданного сброса цель может работать, остановка повторяется
+        openocd.set_state(TargetState.UNKNOWN)
+        openocd.halt()
+
+    print('OK!')
+    return PmInitResult(0, original_profile)
+
+
+def pm_deinit(openocd: OpenOcdTclRpc, profile: Union[ClockProfile, None]):
+    """
+    Восстановление делителей частоты, измененных pm_init, одной командой.
+    Вызывается до запуска прошивки.
+    @profile: исходные делители из результата pm_init, None - не менялись
+    """
+    if profile is None:
+        return
+
+    openocd.write_memory(mem_map.PM_Div_AHB_OFFSET, 32, list(profile))
@@ -1,11 +1,13 @@
-from typing import List
-from mik32_upload import Segment
+from typing import List, Union
+from hex_parser import Segment
 from tclrpc import TclException
 from tclrpc import OpenOcdTclRpc
 from pathlib import Path
 import time
 
 from utils import bytes2words
+import profiler
+import progress
 
 def write_file(filename):
 
@@ -17,12 +19,35 @@ def write_file(filename):
 
 def write_segments(segments: List[Segment], openocd: OpenOcdTclRpc):
     openocd.halt()
+    task = progress.start('ram upload', sum(segment.data.__len__() for segment in segments))
     for segment in segments:
         t = time.localtime()
         current_time = time.strftime("%H:%M:%S", t)
-        print(f"[{current_time}] Writing segment %s with size %d..." % (hex(segment.offset), segment.data.__len__()))
-        segment_words = bytes2words(segment.data)
-        openocd.write_memory(segment.offset, 32, segment_words)
+        progress.detail(f"[{current_time}] Writing segment %s with size %d..." % (hex(segment.offset), segment.data.__len__()))
+        with profiler.phase('ram upload', address=segment.offset):
+            openocd.write_buffer(segment.offset, segment.data)
+        task.advance(segment.data.__len__(), segment.offset)
+    task.finish()
+
+
+class DriverImage:
+    """
+    Образ драйвера, прочитанный из файла заранее. Записывается в ОЗУ через
+    write_buffer, поэтому OpenOCD не нужен доступ к файлу драйвера
+    """
+
+    def __init__(self, path: str, segments: List[Segment]):
+        self.path = path
+        self.segments = segments
+
+
+def load_driver(openocd: OpenOcdTclRpc, driver: Union[str, DriverImage]):
+    """Записать драйвер в ОЗУ из образа или из файла командой load_image"""
+    if isinstance(driver, DriverImage):
+        for segment in driver.segments:
+            openocd.write_buffer(segment.offset, segment.data)
+    else:
+        openocd.run(f"load_image {{{Path(driver)}}}")
 
 
 def check_segments(segments: List[Segment], openocd: OpenOcdTclRpc) -> int:
@@ -0,0 +1,54 @@
+from typing import FrozenSet
+
+from mik32_debug_hal.registers.description import WritePlan
+from tclrpc import OpenOcdTclRpc, TargetState
+
+
+class RegisterCache:
+    """
+    Доступ к регистрам периферии с теневыми копиями регистров из cacheable.
+
+    Кэшируются только регистры, которые пишет лишь компьютер, пока ядро
+    остановлено: регистры настройки без битов состояния. Копии хранятся
+    в соединении (OpenOcdTclRpc.shadow) и общие для всех модулей, они
+    действительны, пока цель остановлена этим соединением, и сбрасываются
+    при запуске, сбросе и остановке цели. Запись всегда выполняется
+    в регистр (write-through)
+    """
+
+    def __init__(self, openocd: OpenOcdTclRpc, cacheable: FrozenSet[int]):
+        self.openocd = openocd
+        self.cacheable = cacheable
+
+    def _is_cached(self, address: int) -> bool:
+        return address in self.cacheable and self.openocd.state == TargetState.HALTED
+
+    def read(self, address: int) -> int:
+        if self._is_cached(address):
+            value = self.openocd.shadow.get(address)
+            if value is not None:
+                return value
+
+        value = self.openocd.read_word(address)
+        if self._is_cached(address):
+            self.openocd.shadow[address] = value
+        return value
+
+    def write(self, address: int, value: int):
+        value &= 0xFFFFFFFF
+        self.openocd.write_word(address, value)
+        if self._is_cached(address):
+            self.openocd.shadow[address] = value
+
+    def modify(self, address: int, clear_mask: int, set_mask: int) -> int:
+        """Чтение-изменение-запись: сброс битов clear_mask и установка set_mask"""
+        value = (self.read(address) & ~clear_mask) | set_mask
+        self.write(address, value)
+        return value & 0xFFFFFFFF
+
+    def execute(self, plan: WritePlan):
+        """Выполнение плана записи с обновлением теневых копий"""
+        plan.execute(self.openocd)
+        for address, value in plan.writes:
+            if self._is_cached(address):
+                self.openocd.shadow[address] = value
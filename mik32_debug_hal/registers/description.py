@@ -0,0 +1,140 @@
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+from tclrpc import OpenOcdTclRpc
+
+
+class Field:
+    """
+    Битовое поле регистра: смещение, ширина и именованные значения
+    """
+
+    def __init__(self, name: str, shift: int, width: int, values: Union[Dict[str, int], None] = None):
+        self.name = name
+        self.shift = shift
+        self.width = width
+        self.values = values if values is not None else {}
+
+    @property
+    def mask(self) -> int:
+        return ((1 << self.width) - 1) << self.shift
+
+
+def _compile(name: str, source: str) -> Callable:
+    namespace: Dict[str, Callable] = {}
+    exec(compile(source, f"<register {name}>", 'exec'), namespace)
+    return namespace[name]
+
+
+def compile_encoder(name: str, fields: Sequence[Field]) -> Callable[..., int]:
+    """
+    Функция сборки значения регистра из полей с аргументами-именами полей,
+    поля без аргумента равны 0. Сдвиги и маски подставляются в код функции
+    """
+    if fields.__len__() == 0:
+        return _compile('encode', 'def encode():\n    return 0\n')
+    arguments = ', '.join(f"{field.name}=0" for field in fields)
+    terms = ' | '.join(
+        f"(({field.name} & {(1 << field.width) - 1:#x}) << {field.shift})" for field in fields)
+    return _compile('encode', f"def encode(*, {arguments}):\n    return {terms}\n")
+
+
+def compile_decoder(name: str, fields: Sequence[Field]) -> Callable[[int], Dict[str, int]]:
+    """Функция разбора значения регистра на поля"""
+    items = ', '.join(
+        f"'{field.name}': (value >> {field.shift}) & {(1 << field.width) - 1:#x}" for field in fields)
+    return _compile('decode', f"def decode(value):\n    return {{{items}}}\n")
+
+
+class Register:
+    """
+    32-битный регистр периферии с полями. encode и decode генерируются
+    по описанию полей при создании регистра
+    """
+
+    def __init__(self, name: str, offset: int, fields: Sequence[Field] = ()):
+        self.name = name
+        self.offset = offset
+        self.address = offset
+        self.fields = list(fields)
+        self.encode = compile_encoder(name, self.fields)
+        self.decode = compile_decoder(name, self.fields)
+
+    def field(self, name: str) -> Field:
+        return next(field for field in self.fields if field.name == name)
+
+
+class Peripheral:
+    """
+    Блок периферии: базовый адрес, регистры и константы.
+    Регистры доступны как атрибуты: EEPROM.EECON
+    """
+
+    def __init__(self, name: str, base: int, registers: Sequence[Register],
+                 constants: Union[Dict[str, int], None] = None):
+        self.name = name
+        self.base = base
+        self.registers = list(registers)
+        self.constants = constants if constants is not None else {}
+        for register in self.registers:
+            register.address = base + register.offset
+            setattr(self, register.name, register)
+
+
+class WritePlan:
+    """
+    Последовательность записей 32-битных регистров. Записи по соседним
+    адресам, идущие подряд, объединяются в одну команду write_memory;
+    порядок записей сохраняется, так как запись некоторых регистров
+    (например CMD SPIFI) запускает операцию
+    """
+
+    def __init__(self):
+        self.writes: List[Tuple[int, int]] = []
+
+    def write(self, register: Union[Register, int], value: int) -> 'WritePlan':
+        address = register.address if isinstance(register, Register) else register
+        self.writes.append((address, value & 0xFFFFFFFF))
+        return self
+
+    def bursts(self) -> List[Tuple[int, List[int]]]:
+        bursts: List[Tuple[int, List[int]]] = []
+        for address, value in self.writes:
+            if bursts and bursts[-1][0] + bursts[-1][1].__len__() * 4 == address:
+                bursts[-1][1].append(value)
+            else:
+                bursts.append((address, [value]))
+        return bursts
+
+    def execute(self, openocd: OpenOcdTclRpc):
+        for address, words in self.bursts():
+            openocd.write_memory(address, 32, words)
+
+
+def tcl_source(peripherals: Iterable[Peripheral]) -> str:
+    """
+    Описание регистров для скриптов OpenOCD: переменные адресов регистров
+    <БЛОК>_REGS_<РЕГИСТР>, сдвигов и масок полей <БЛОК>_<РЕГИСТР>_<ПОЛЕ>_S/_M,
+    значений полей и констант <БЛОК>_<ИМЯ>
+    """
+    lines: List[str] = []
+    for peripheral in peripherals:
+        lines.append('#--------------------------')
+        lines.append(f"# {peripheral.name}")
+        lines.append('#--------------------------')
+        lines.append(f"set {peripheral.name}_REGS_BASE_ADDRESS {peripheral.base:#010x}")
+        for register in peripheral.registers:
+            lines.append(f"set {peripheral.name}_REGS_{register.name} {register.address:#010x}")
+        for register in peripheral.registers:
+            if register.fields.__len__() == 0:
+                continue
+            lines.append(f"#{register.name}")
+            for field in register.fields:
+                prefix = f"{peripheral.name}_{register.name}_{field.name}"
+                lines.append(f"set {prefix}_S {field.shift}")
+                lines.append(f"set {prefix}_M {field.mask:#010x}")
+                for value_name, value in field.values.items():
+                    lines.append(f"set {peripheral.name}_{value_name} {value}")
+        for name, value in peripheral.constants.items():
+            lines.append(f"set {peripheral.name}_{name} {value:#x}")
+        lines.append('')
+    return '\n'.join(lines)
@@ -31,6 +31,9 @@ def DMA_CHANNEL_CONFIG(i):
 # --------------------------
 SPIFI_REGS = 0x00070000
 
+# окно чтения флеш памяти в режиме отображения в память
+SPIFI_MEMORY = 0x80000000
+
 SPIFI_CONFIG_CTRL = SPIFI_REGS + 0x000
 SPIFI_CONFIG_CMD = SPIFI_REGS + 0x004
 SPIFI_CONFIG_ADDR = SPIFI_REGS + 0x008
@@ -48,6 +51,9 @@ SPIFI_CONFIG_STAT = SPIFI_REGS + 0x01C
 
 PM_REGS = 0x000050000
 
+PM_Div_AHB_OFFSET = PM_REGS + 0x00
+PM_Div_APB_M_OFFSET = PM_REGS + 0x04
+PM_Div_APB_P_OFFSET = PM_REGS + 0x08
 PM_Clk_AHB_Set_OFFSET = PM_REGS + 0x0C
 PM_Clk_AHB_Clear_OFFSET = PM_REGS + 0x10
 PM_Clk_APB_M_Set_OFFSET = PM_REGS + 0x14
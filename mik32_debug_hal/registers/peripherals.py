@@ -0,0 +1,213 @@
+"""
+Описание регистров EEPROM, SPIFI и DMA для сборки значений регистров
+на стороне компьютера и для скриптов OpenOCD.
+
+Адреса и сдвиги берутся из memory_map и bitfields. Файл
+openocd-scripts/mik32_registers.tcl генерируется из этого описания:
+
+    python -m mik32_debug_hal.registers.peripherals
+    python -m mik32_debug_hal.registers.peripherals --check
+"""
+
+import argparse
+import os
+import sys
+
+from mik32_debug_hal.registers.description import Field, Peripheral, Register, tcl_source
+import mik32_debug_hal.registers.memory_map as mem_map
+import mik32_debug_hal.registers.bitfields.dma as dma_fields
+import mik32_debug_hal.registers.bitfields.eeprom as eeprom_fields
+import mik32_debug_hal.registers.bitfields.spifi as spifi_fields
+
+
+EEPROM = Peripheral('EEPROM', mem_map.EEPROM_REGS_BASE_ADDRESS, [
+    Register('EEDAT', mem_map.EEPROM_REGS_EEDAT - mem_map.EEPROM_REGS_BASE_ADDRESS),
+    Register('EEA', mem_map.EEPROM_REGS_EEA - mem_map.EEPROM_REGS_BASE_ADDRESS),
+    Register('EECON', mem_map.EEPROM_REGS_EECON - mem_map.EEPROM_REGS_BASE_ADDRESS, [
+        Field('EX', eeprom_fields.EECON_EX_S, 1),
+        Field('OP', eeprom_fields.EECON_OP_S, 2, {
+            'OP_RD': eeprom_fields.OP_RD,
+            'OP_ER': eeprom_fields.OP_ER,
+            'OP_PR': eeprom_fields.OP_PR,
+        }),
+        Field('WRBEH', eeprom_fields.EECON_WRBEH_S, 2, {
+            'BEH_EVEN': eeprom_fields.BEH_EVEN,
+            'BEH_ODD': eeprom_fields.BEH_ODD,
+            'BEH_GLOB': eeprom_fields.BEH_GLOB,
+        }),
+        Field('APBNWS', eeprom_fields.EECON_APBNWS_S, 1),
+        Field('DISECC', eeprom_fields.EECON_DISECC_S, 1),
+        Field('BWE', eeprom_fields.EECON_BWE_S, 1),
+        Field('IESERR', eeprom_fields.EECON_IESERR_S, 1),
+    ]),
+    Register('EESTA', mem_map.EEPROM_REGS_EESTA - mem_map.EEPROM_REGS_BASE_ADDRESS, [
+        Field('BSY', eeprom_fields.EESTA_BSY_S, 1),
+        Field('SERR', eeprom_fields.EESTA_SERR_S, 1),
+    ]),
+    Register('EERB', mem_map.EEPROM_REGS_EERB - mem_map.EEPROM_REGS_BASE_ADDRESS),
+    Register('EEADJ', mem_map.EEPROM_REGS_EEADJ - mem_map.EEPROM_REGS_BASE_ADDRESS),
+    Register('NCYCRL', mem_map.EEPROM_REGS_NCYCRL - mem_map.EEPROM_REGS_BASE_ADDRESS, [
+        Field('N_LD', eeprom_fields.NCYCRL_N_LD_S, 8),
+        Field('N_R_1', eeprom_fields.NCYCRL_N_R_1_S, 8),
+        Field('N_R_2', eeprom_fields.NCYCRL_N_R_2_S, 8),
+    ]),
+    Register('NCYCEP1', mem_map.EEPROM_REGS_NCYCEP1 - mem_map.EEPROM_REGS_BASE_ADDRESS),
+    Register('NCYCEP2', mem_map.EEPROM_REGS_NCYCEP2 - mem_map.EEPROM_REGS_BASE_ADDRESS),
+], {
+    'PAGE_MASK': eeprom_fields.EEPROM_PAGE_MASK,
+})
+
+
+def _spifi_command_fields(values=False):
+    """Поля CMD и MCMD, именованные значения объявляются только для CMD"""
+    return [
+        Field('POLL', spifi_fields.SPIFI_CONFIG_CMD_POLL_S, 1),
+        Field('DOUT', spifi_fields.SPIFI_CONFIG_CMD_DOUT_S, 1),
+        Field('INTLEN', spifi_fields.SPIFI_CONFIG_CMD_INTLEN_S, 3),
+        Field('FIELDFORM', spifi_fields.SPIFI_CONFIG_CMD_FIELDFORM_S, 2, {
+            'FIELDFORM_ALL_SERIAL': spifi_fields.SPIFI_CONFIG_CMD_FIELDFORM_ALL_SERIAL,
+            'FIELDFORM_DATA_PARALLEL': spifi_fields.SPIFI_CONFIG_CMD_FIELDFORM_DATA_PARALLEL,
+            'FIELDFORM_OPCODE_SERIAL': spifi_fields.SPIFI_CONFIG_CMD_FIELDFORM_OPCODE_SERIAL,
+            'FIELDFORM_ALL_PARALLEL': spifi_fields.SPIFI_CONFIG_CMD_FIELDFORM_ALL_PARALLEL,
+        } if values else None),
+        Field('FRAMEFORM', spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_S, 3, {
+            'FRAMEFORM_OPCODE_NOADDR': spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_OPCODE_NOADDR,
+            'FRAMEFORM_OPCODE_1ADDR': spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_OPCODE_1ADDR,
+            'FRAMEFORM_OPCODE_2ADDR': spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_OPCODE_2ADDR,
+            'FRAMEFORM_OPCODE_3ADDR': spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_OPCODE_3ADDR,
+            'FRAMEFORM_OPCODE_4ADDR': spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_OPCODE_4ADDR,
+            'FRAMEFORM_NOOPCODE_3ADDR': spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_NOOPCODE_3ADDR,
+            'FRAMEFORM_NOOPCODE_4ADDR': spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_NOOPCODE_4ADDR,
+        } if values else None),
+        Field('OPCODE', spifi_fields.SPIFI_CONFIG_CMD_OPCODE_S, 8),
+    ]
+
+
+SPIFI = Peripheral('SPIFI', mem_map.SPIFI_REGS, [
+    Register('CTRL', mem_map.SPIFI_CONFIG_CTRL - mem_map.SPIFI_REGS, [
+        Field('TIMEOUT', spifi_fields.SPIFI_CONFIG_CTRL_TIMEOUT_S, 16),
+        Field('CSHIGH', spifi_fields.SPIFI_CONFIG_CTRL_CSHIGH_S, 4),
+        Field('CACHE_EN', spifi_fields.SPIFI_CONFIG_CTRL_CACHE_EN_S, 1),
+        Field('D_CACHE_DIS', spifi_fields.SPIFI_CONFIG_CTRL_D_CACHE_DIS_S, 1),
+        Field('INTEN', spifi_fields.SPIFI_CONFIG_CTRL_INTEN_S, 1),
+        Field('MODE3', spifi_fields.SPIFI_CONFIG_CTRL_MODE3_S, 1),
+        Field('SCK_DIV', spifi_fields.SPIFI_CONFIG_CTRL_SCK_DIV_S, 3),
+        Field('PREFETCH_DIS', spifi_fields.SPIFI_CONFIG_CTRL_PREFETCH_DIS_S, 1),
+        Field('DUAL', spifi_fields.SPIFI_CONFIG_CTRL_DUAL_S, 1),
+        Field('RFCLK', spifi_fields.SPIFI_CONFIG_CTRL_RFCLK_S, 1),
+        Field('FBCLK', spifi_fields.SPIFI_CONFIG_CTRL_FBCLK_S, 1),
+        Field('DMAEN', spifi_fields.SPIFI_CONFIG_CTRL_DMAEN_S, 1),
+    ]),
+    Register('CMD', mem_map.SPIFI_CONFIG_CMD - mem_map.SPIFI_REGS,
+             [Field('DATALEN', spifi_fields.SPIFI_CONFIG_CMD_DATALEN_S, 14)] + _spifi_command_fields(True)),
+    Register('ADDR', mem_map.SPIFI_CONFIG_ADDR - mem_map.SPIFI_REGS),
+    Register('IDATA', mem_map.SPIFI_CONFIG_IDATA - mem_map.SPIFI_REGS),
+    Register('CLIMIT', mem_map.SPIFI_CONFIG_CLIMIT - mem_map.SPIFI_REGS),
+    Register('DATA32', mem_map.SPIFI_CONFIG_DATA32 - mem_map.SPIFI_REGS),
+    Register('MCMD', mem_map.SPIFI_CONFIG_MCMD - mem_map.SPIFI_REGS, _spifi_command_fields()),
+    Register('STAT', mem_map.SPIFI_CONFIG_STAT - mem_map.SPIFI_REGS, [
+        Field('MCINIT', spifi_fields.SPIFI_CONFIG_STAT_MCINIT_S, 1),
+        Field('CMD', spifi_fields.SPIFI_CONFIG_STAT_CMD_S, 1),
+        Field('RESET', spifi_fields.SPIFI_CONFIG_STAT_RESET_S, 1),
+        Field('INTRQ', spifi_fields.SPIFI_CONFIG_STAT_INTRQ_S, 1),
+        Field('VERSION', spifi_fields.SPIFI_CONFIG_STAT_VERSION_S, 8),
+    ]),
+])
+
+
+def _dma_channel_registers(channel: int):
+    """Регистры канала, поля CONFIG описываются один раз для канала 0"""
+    return [
+        Register(f"CH{channel}_DESTINATION", mem_map.DMA_CHANNEL_DESTINATION(channel) - mem_map.DMA_REGS),
+        Register(f"CH{channel}_SOURCE", mem_map.DMA_CHANNEL_SOURCE(channel) - mem_map.DMA_REGS),
+        Register(f"CH{channel}_LEN", mem_map.DMA_CHANNEL_LEN(channel) - mem_map.DMA_REGS),
+        Register(f"CH{channel}_CONFIG", mem_map.DMA_CHANNEL_CONFIG(channel) - mem_map.DMA_REGS, [
+            Field('ENABLE', dma_fields.CFG_CH_ENABLE_S, 1),
+            Field('PRIOR', dma_fields.CFG_CH_PRIOR_S, 2),
+            Field('READ_MODE', dma_fields.CFG_CH_READ_MODE_S, 1),
+            Field('WRITE_MODE', dma_fields.CFG_CH_WRITE_MODE_S, 1),
+            Field('READ_INCREMENT', dma_fields.CFG_CH_READ_INCREMENT_S, 1),
+            Field('WRITE_INCREMENT', dma_fields.CFG_CH_WRITE_INCREMENT_S, 1),
+            Field('READ_SIZE', dma_fields.CFG_CH_READ_SIZE_S, 2),
+            Field('WRITE_SIZE', dma_fields.CFG_CH_WRITE_SIZE_S, 2),
+            Field('READ_BURST_SIZE', dma_fields.CFG_CH_READ_BURST_SIZE_S, 3),
+            Field('WRITE_BURST_SIZE', dma_fields.CFG_CH_WRITE_BURST_SIZE_S, 3),
+            Field('READ_REQ', dma_fields.CFG_CH_READ_REQ_S, 4),
+            Field('WRITE_REQ', dma_fields.CFG_CH_WRITE_REQ_S, 4),
+            Field('ACK_READ', dma_fields.CFG_CH_ACK_READ_S, 1),
+            Field('ACK_WRITE', dma_fields.CFG_CH_ACK_WRITE_S, 1),
+        ] if channel == 0 else []),
+    ]
+
+
+DMA = Peripheral('DMA', mem_map.DMA_REGS, [
+    register for channel in range(dma_fields.CHANNEL_COUNT) for register in _dma_channel_registers(channel)
+] + [
+    Register('CONTROL', mem_map.DMA_CONTROL - mem_map.DMA_REGS, [
+        Field('CLEAR_LOCAL_IRQ', dma_fields.CONTROL_CLEAR_LOCAL_IRQ_S, dma_fields.CHANNEL_COUNT),
+        Field('CLEAR_GLOBAL_IRQ', dma_fields.CONTROL_CLEAR_GLOBAL_IRQ_S, 1),
+        Field('CLEAR_ERROR_IRQ', dma_fields.CONTROL_CLEAR_ERROR_IRQ_S, 1),
+        Field('GLOBAL_IRQ_ENA', dma_fields.CONTROL_GLOBAL_IRQ_ENA_S, 1),
+        Field('ERROR_IRQ_ENA', dma_fields.CONTROL_ERROR_IRQ_ENA_S, 1),
+        Field('CURRENT_VALUE', dma_fields.CONTROL_CURRENT_VALUE_S, 1),
+    ]),
+    # чтение по адресу CONTROL возвращает состояние каналов
+    Register('STATUS', mem_map.DMA_CONTROL - mem_map.DMA_REGS, [
+        Field('READY', dma_fields.STATUS_READY_S, dma_fields.CHANNEL_COUNT),
+    ]),
+], {
+    'CHANNEL_COUNT': dma_fields.CHANNEL_COUNT,
+    'CHANNEL_SIZEOF': mem_map.DMA_CHANNEL_SIZEOF,
+})
+
+# поля настройки одинаковы для всех каналов
+DMA_CHANNEL_CONFIG = DMA.CH0_CONFIG
+
+PERIPHERALS = [EEPROM, SPIFI, DMA]
+
+TCL_HEADER = """\
+# Регистры MIK32 для скриптов OpenOCD.
+# Файл сгенерирован python -m mik32_debug_hal.registers.peripherals,
+# изменения вносятся в описание mik32_debug_hal/registers/peripherals.py
+
+"""
+
+default_tcl_path = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'openocd-scripts', 'mik32_registers.tcl')
+
+
+def generate_tcl() -> str:
+    return TCL_HEADER + tcl_source(PERIPHERALS)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Генерация описания регистров MIK32 для скриптов OpenOCD")
+    parser.add_argument('output', nargs='?', default=default_tcl_path,
+                        help=f"Путь к файлу Tcl. По умолчанию: {default_tcl_path}")
+    parser.add_argument('--check', dest='check', action='store_true', default=False,
+                        help="Проверить, что файл совпадает с описанием, без записи")
+    args = parser.parse_args()
+
+    source = generate_tcl()
+    if args.check:
+        try:
+            with open(args.output, 'r', encoding='utf-8') as f:
+                current = f.read()
+        except OSError:
+            current = None
+        if current != source:
+            print(f"{args.output} is out of date, run python -m mik32_debug_hal.registers.peripherals")
+            return 1
+        print(f"{args.output} is up to date")
+        return 0
+
+    with open(args.output, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(source)
+    print(f"Written {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
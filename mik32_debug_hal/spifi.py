@@ -1,15 +1,52 @@
 from enum import Enum
-from typing import List, Union
+from typing import List, Tuple, Union
 import time
 from tclrpc import OpenOcdTclRpc
+from utils import words2bytes
 import mik32_debug_hal.registers.memory_map as mem_map
 import mik32_debug_hal.registers.bitfields.spifi as spifi_fields
 import mik32_debug_hal.dma as dma
+from mik32_debug_hal.dma import Transfer
+from mik32_debug_hal.register_cache import RegisterCache
+from mik32_debug_hal.registers.description import WritePlan
+from mik32_debug_hal.registers.peripherals import SPIFI as SPIFI_REGS
+
+
+# регистры настройки SPIFI, которые пишет только компьютер. STAT изменяется
+# контроллером, ADDR и IDATA записываются каждой командой
+CACHEABLE_REGISTERS = frozenset([
+    mem_map.SPIFI_CONFIG_CTRL,
+    mem_map.SPIFI_CONFIG_CLIMIT,
+    mem_map.SPIFI_CONFIG_MCMD,
+])
 
 
 class SPIFI():
 
     DEFAULT_READ_DATA_COMMAND = 0x03
+    FAST_READ_QUAD_OUTPUT_COMMAND = 0x6B
+    FAST_READ_QUAD_IO_COMMAND = 0xEB
+
+    # команды чтения в режиме отображения в память: формат полей и число
+    # промежуточных байт (8 тактов для 0x6B, режим и 4 такта для 0xEB)
+    MEMORY_READ_COMMANDS = {
+        DEFAULT_READ_DATA_COMMAND: (spifi_fields.SPIFI_CONFIG_CMD_FIELDFORM_ALL_SERIAL, 0),
+        FAST_READ_QUAD_OUTPUT_COMMAND: (spifi_fields.SPIFI_CONFIG_CMD_FIELDFORM_DATA_PARALLEL, 1),
+        FAST_READ_QUAD_IO_COMMAND: (spifi_fields.SPIFI_CONFIG_CMD_FIELDFORM_OPCODE_SERIAL, 3),
+    }
+
+    # размер одного чтения read_memory из окна флеш памяти, байт
+    MEMORY_READ_WINDOW = 16 * 1024
+
+    # буфер в ОЗУ для передачи данных команд через DMA из окон (адрес, размер),
+    # которые заполняются цепочкой передач DMA по порядку. Первое окно не занято
+    # драйверами: код драйверов SPIFI и EEPROM заканчивается до 0x02001000.
+    # Второе окно - начало буфера страниц драйвера EEPROM, который заполняется
+    # перед каждым запуском драйвера EEPROM; буфер, статус и стек драйвера
+    # SPIFI (с 0x02002000) и статус драйвера EEPROM (0x02003800) не затрагиваются
+    DMA_WINDOWS: List[Tuple[int, int]] = [(0x02001000, 2 * 1024), (0x02001800, 2 * 1024)]
+    # вмещает сектор флеш памяти
+    DMA_BUFFER_SIZE = sum(size for _, size in DMA_WINDOWS)
 
     class SpifiError(Exception):
         def __init__(self, value):
@@ -46,22 +83,29 @@ class SPIFI():
 
     def __init__(self, openocd: OpenOcdTclRpc):
         self.openocd = openocd
+        self.registers = RegisterCache(openocd, CACHEABLE_REGISTERS)
 
         self.init()
 
+    # В STAT записываются только биты INTRQ (сброс записью 1) и RESET
+    # (сбрасывается контроллером), остальные биты только для чтения,
+    # поэтому чтение перед записью не требуется
+
     def intrq_clear(self):
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_STAT, self.openocd.read_word(mem_map.SPIFI_CONFIG_STAT) |
-                                spifi_fields.SPIFI_CONFIG_STAT_INTRQ_M)
+        self.openocd.write_word(mem_map.SPIFI_CONFIG_STAT, spifi_fields.SPIFI_CONFIG_STAT_INTRQ_M)
 
     def init_periphery(self):
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_STAT, self.openocd.read_word(mem_map.SPIFI_CONFIG_STAT) |
+        self.openocd.write_word(mem_map.SPIFI_CONFIG_STAT,
                                 #    SPIFI_CONFIG_STAT_INTRQ_M |
                                 spifi_fields.SPIFI_CONFIG_STAT_RESET_M)
         # openocd.write_word(SPIFI_CONFIG_CTRL, openocd.read_word(
         #     SPIFI_CONFIG_CTRL) | (7 << SPIFI_CONFIG_CTRL_SCK_DIV_S))
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_ADDR, 0x00)
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_IDATA, 0x00)
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_CLIMIT, 0x00)
+        # ADDR, IDATA и CLIMIT записываются одной командой
+        plan = WritePlan()
+        plan.write(SPIFI_REGS.ADDR, 0x00)
+        plan.write(SPIFI_REGS.IDATA, 0x00)
+        plan.write(SPIFI_REGS.CLIMIT, 0x00)
+        self.registers.execute(plan)
 
         time.sleep(self.INIT_DELAY)
 
@@ -69,28 +113,63 @@ class SPIFI():
 
         self.init_periphery()
 
-        control = self.openocd.read_word(mem_map.SPIFI_CONFIG_CTRL)
-        control |= spifi_fields.SPIFI_CONFIG_CTRL_DMAEN_M
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_CTRL, control)
+        self.registers.modify(mem_map.SPIFI_CONFIG_CTRL, 0, spifi_fields.SPIFI_CONFIG_CTRL_DMAEN_M)
 
         time.sleep(self.INIT_DELAY)
 
-    def init_memory(self):
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_STAT, self.openocd.read_word(mem_map.SPIFI_CONFIG_STAT) |
+    def init_memory(
+            self,
+            read_command: int = DEFAULT_READ_DATA_COMMAND,
+            fieldform: Union[int, None] = None,
+            idata_length: Union[int, None] = None,
+    ):
+        """
+        Режим отображения флеш памяти в адреса начиная с SPIFI_MEMORY.
+        @read_command: команда чтения, для команд Quad SPI во флеш памяти
+        должен быть установлен бит QE
+        @fieldform, idata_length: формат полей и число промежуточных байт,
+        по умолчанию - из MEMORY_READ_COMMANDS
+        """
+        if fieldform is None or idata_length is None:
+            fieldform, intlen = self.MEMORY_READ_COMMANDS[read_command]
+        else:
+            intlen = idata_length
+        self.openocd.write_word(mem_map.SPIFI_CONFIG_STAT,
                                 spifi_fields.SPIFI_CONFIG_STAT_INTRQ_M |
                                 spifi_fields.SPIFI_CONFIG_STAT_RESET_M)
         # openocd.write_word(SPIFI_CONFIG_CTRL, openocd.read_word(
         #     SPIFI_CONFIG_CTRL) | (7 << SPIFI_CONFIG_CTRL_SCK_DIV_S))
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_ADDR, 0x00)
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_IDATA, 0x00)
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_CLIMIT, 0x00)
-        self.openocd.write_word(mem_map.SPIFI_CONFIG_MCMD, (0 << spifi_fields.SPIFI_CONFIG_MCMD_INTLEN_S) |
-                                (spifi_fields.SPIFI_CONFIG_CMD_FIELDFORM_ALL_SERIAL << spifi_fields.SPIFI_CONFIG_MCMD_FIELDFORM_S) |
-                                (spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_OPCODE_3ADDR << spifi_fields.SPIFI_CONFIG_MCMD_FRAMEFORM_S) |
-                                (self.DEFAULT_READ_DATA_COMMAND << spifi_fields.SPIFI_CONFIG_MCMD_OPCODE_S))
+        plan = WritePlan()
+        plan.write(SPIFI_REGS.ADDR, 0x00)
+        plan.write(SPIFI_REGS.IDATA, 0x00)
+        plan.write(SPIFI_REGS.CLIMIT, 0x00)
+        plan.write(SPIFI_REGS.MCMD, SPIFI_REGS.MCMD.encode(
+            INTLEN=intlen,
+            FIELDFORM=fieldform,
+            FRAMEFORM=spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_OPCODE_3ADDR,
+            OPCODE=read_command,
+        ))
+        self.registers.execute(plan)
 
         time.sleep(self.INIT_DELAY)
 
+    def read_memory_mapped(self, address: int, byte_count: int) -> List[int]:
+        """
+        Чтение флеш памяти через окно SPIFI_MEMORY словами по MEMORY_READ_WINDOW байт
+        за обращение к OpenOCD. Перед чтением нужно вызвать init_memory.
+        @address: адрес во флеш памяти
+        @return: список прочитанных байт
+        """
+        start = address & ~0x3
+        end = (address + byte_count + 3) & ~0x3
+
+        data: List[int] = []
+        for window in range(start, end, self.MEMORY_READ_WINDOW):
+            word_count = (min(window + self.MEMORY_READ_WINDOW, end) - window) // 4
+            data.extend(words2bytes(self.openocd.read_memory(mem_map.SPIFI_MEMORY + window, 32, word_count)))
+
+        return data[address - start:address - start + byte_count]
+
     def spifi_wait_intrq_timeout(self, error_message: str):
         time_end = time.perf_counter() + self.TIMEOUT
         while time.perf_counter() < time_end:
@@ -98,6 +177,54 @@ class SPIFI():
                 return
         raise self.SpifiError(error_message)
 
+    def dma_pieces(self, offset: int, byte_count: int) -> List[Tuple[int, int]]:
+        """
+        Части буфера DMA (адрес в ОЗУ, размер) для byte_count байт
+        со смещения offset от начала буфера, по окнам DMA_WINDOWS
+        """
+        if offset + byte_count > self.DMA_BUFFER_SIZE:
+            raise self.SpifiError(f"Byte count {byte_count} at offset {offset} is more than DMA buffer size")
+
+        pieces: List[Tuple[int, int]] = []
+        for window, size in self.DMA_WINDOWS:
+            if byte_count == 0:
+                break
+            if offset >= size:
+                offset -= size
+                continue
+            length = min(size - offset, byte_count)
+            pieces.append((window + offset, length))
+            offset = 0
+            byte_count -= length
+        return pieces
+
+    @staticmethod
+    def merge_pieces(pieces: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Соседние в ОЗУ части буфера читаются и записываются одним обращением"""
+        merged: List[Tuple[int, int]] = []
+        for address, length in pieces:
+            if merged and merged[-1][0] + merged[-1][1] == address:
+                merged[-1] = (merged[-1][0], merged[-1][1] + length)
+            else:
+                merged.append((address, length))
+        return merged
+
+    def write_dma_buffer(self, data: List[int], offset: int = 0):
+        """Запись данных в буфер DMA со смещения offset"""
+        position = 0
+        for address, length in self.merge_pieces(self.dma_pieces(offset, data.__len__())):
+            self.openocd.write_buffer(address, data[position:position + length])
+            position += length
+
+    def read_dma_buffer(self, byte_count: int) -> List[int]:
+        out_list: List[int] = []
+        for address, length in self.merge_pieces(self.dma_pieces(0, byte_count)):
+            if length % 4 == 0:
+                out_list.extend(words2bytes(self.openocd.read_memory(address, 32, length // 4)))
+            else:
+                out_list.extend(self.openocd.read_memory(address, 8, length))
+        return out_list
+
     def send_command(
             self,
             cmd: int,
@@ -110,62 +237,70 @@ class SPIFI():
             idata_length=0,
             direction=Direction.READ,
             data: List[int] = [],
-            dma: Union[dma.DMA, None] = None
+            dma: Union[dma.DMA, None] = None,
+            buffer_offset: Union[int, None] = None,
     ) -> List[int]:
+        """
+        Команда флеш памяти. С dma данные передаются через буфер DMA_WINDOWS
+        цепочкой передач DMA, до DMA_BUFFER_SIZE байт за команду.
+        @buffer_offset: данные записи уже лежат в буфере DMA с этого смещения
+        (write_dma_buffer), None - data записываются в начало буфера
+        """
+        transfers: List[Transfer] = []
         if (dma is not None) and (direction == self.Direction.WRITE):
-            self.openocd.write_memory(0x02003F00, 8, data)
-
-            dma.channels[0].start(
-                0x02003F00,
-                mem_map.SPIFI_CONFIG_DATA32,
-                255
-            )
+            if buffer_offset is None:
+                self.write_dma_buffer(data[:byte_count])
+                buffer_offset = 0
+            transfers = [Transfer(piece, mem_map.SPIFI_CONFIG_DATA32, length)
+                         for piece, length in self.dma_pieces(buffer_offset, byte_count)]
+            channel = dma.channels[0]
         elif (dma is not None) and (direction == self.Direction.READ):
-            dma.channels[1].start(
-                mem_map.SPIFI_CONFIG_DATA32,
-                0x02003F00,
-                255
-            )
-
-        self.openocd.write_memory(
-            mem_map.SPIFI_CONFIG_ADDR, 32, [address, idata])
-
-        cmd_write_value = ((cmd << spifi_fields.SPIFI_CONFIG_CMD_OPCODE_S) |
-                           (frameform.value << spifi_fields.SPIFI_CONFIG_CMD_FRAMEFORM_S) |
-                           (fieldform.value << spifi_fields.SPIFI_CONFIG_CMD_FIELDFORM_S) |
-                           (byte_count << spifi_fields.SPIFI_CONFIG_CMD_DATALEN_S) |
-                           (idata_length << spifi_fields.SPIFI_CONFIG_CMD_INTLEN_S) |
-                           (direction.value << spifi_fields.SPIFI_CONFIG_CMD_DOUT_S))
-
-        self.openocd.write_memory(
-            mem_map.SPIFI_CONFIG_CMD, 32, [cmd_write_value])
+            transfers = [Transfer(mem_map.SPIFI_CONFIG_DATA32, piece, length)
+                         for piece, length in self.dma_pieces(0, byte_count)]
+            channel = dma.channels[1]
+
+        # первая передача запускается до команды, остальные - цепочкой после нее
+        if transfers:
+            channel.start(*transfers[0])
+
+        # запись CMD запускает команду, поэтому выполняется после ADDR и IDATA
+        plan = WritePlan()
+        plan.write(SPIFI_REGS.ADDR, address)
+        plan.write(SPIFI_REGS.IDATA, idata)
+        plan.write(SPIFI_REGS.CMD, SPIFI_REGS.CMD.encode(
+            OPCODE=cmd,
+            FRAMEFORM=frameform.value,
+            FIELDFORM=fieldform.value,
+            DATALEN=byte_count,
+            INTLEN=idata_length,
+            DOUT=direction.value,
+        ))
+        plan.execute(self.openocd)
+
+        if transfers:
+            if transfers.__len__() == 1:
+                dma.dma_wait(channel, 0.1)
+            else:
+                dma.run_chain(channel, transfers, timeout=0.1, started=True)
 
         if direction == self.Direction.READ:
-            out_list = []
             if dma is not None:
-                dma.dma_wait(dma.channels[1], 0.1)
-                out_list.extend(self.openocd.read_memory(
-                    0x02003F00, 8, byte_count))
-
-                return out_list
+                return self.read_dma_buffer(byte_count)
+            out_list = []
+            for i in range(byte_count):
+                out_list.append(self.openocd.read_memory(
+                    mem_map.SPIFI_CONFIG_DATA32, 8, 1)[0])
+            return out_list
+
+        if direction == self.Direction.WRITE and dma is None:
+            if (byte_count % 4) == 0:
+                for i in range(0, byte_count, 4):
+                    self.openocd.write_memory(mem_map.SPIFI_CONFIG_DATA32, 32, [
+                        data[i] + data[i+1] * 256 + data[i+2] * 256 * 256 + data[i+3] * 256 * 256 * 256])
             else:
                 for i in range(byte_count):
-                    out_list.append(self.openocd.read_memory(
-                        mem_map.SPIFI_CONFIG_DATA32, 8, 1)[0])
-                return out_list
-
-        if direction == self.Direction.WRITE:
-            if dma is not None:
-                dma.dma_wait(dma.channels[0], 0.1)
-            else:
-                if (byte_count % 4) == 0:
-                    for i in range(0, byte_count, 4):
-                        self.openocd.write_memory(mem_map.SPIFI_CONFIG_DATA32, 32, [
-                            data[i] + data[i+1] * 256 + data[i+2] * 256 * 256 + data[i+3] * 256 * 256 * 256])
-                else:
-                    for i in range(byte_count):
-                        self.openocd.write_memory(
-                            mem_map.SPIFI_CONFIG_DATA32, 8, [data[i]])
+                    self.openocd.write_memory(
+                        mem_map.SPIFI_CONFIG_DATA32, 8, [data[i]])
 
         return []
 
@@ -173,8 +308,6 @@ class SPIFI():
         dma_instance = dma.DMA(self.openocd)
         dma_instance.init()
 
-        dma_instance.channels[0].write_buffer = 0
-
         dma_instance.channels[0].channel = dma.ChannelIndex.CHANNEL_0
         dma_instance.channels[0].priority = dma.ChannelPriority.VERY_HIGH
 
@@ -192,8 +325,6 @@ class SPIFI():
         dma_instance.channels[0].write_request = dma.ChannelRequest.SPIFI_REQUEST
         dma_instance.channels[0].write_ack = dma.ChannelAck.DISABLE
 
-        dma_instance.channels[1].write_buffer = 0
-
         dma_instance.channels[1].channel = dma.ChannelIndex.CHANNEL_1
         dma_instance.channels[1].priority = dma.ChannelPriority.VERY_HIGH
 
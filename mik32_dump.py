@@ -0,0 +1,346 @@
+import os
+import re
+import time
+from typing import Iterator, List, Tuple, Union
+
+import adapter_clock
+from flash_drivers.generic_flash import GenericFlash
+from gdbrsp import GdbRspClient, GdbRspError
+from mik32_debug_hal.gpio import MIK32_Version, gpio_init, gpio_deinit
+from mik32_debug_hal.spifi import SPIFI
+import mik32_debug_hal.power_manager as power_manager
+from mik32_upload import BootMode, OpenOCDError, adapter_default_speed, default_log_path, default_post_action, \
+    mik32_sections, open_session, openocd_exec_path, openocd_interface_path, openocd_scripts_path, \
+    openocd_target_path, run_openocd
+from openocd_process import OpenOcdProcess
+from parsers import ParserError, RecordType, parse_hex_line
+import profiler
+import progress
+import target_probe
+from tclrpc import OpenOcdTclRpc, TclException, TclPortError
+from transfer import TransferMode
+from transport import Transport
+from utils import words2bytes
+
+
+# размер одного чтения EEPROM и ОЗУ через read_memory, байт
+READ_CHUNK = 4 * 1024
+
+_RE_RANGE = re.compile(r'^\s*(\w*)\s*([:+])\s*(\w*)\s*$')
+
+
+class DumpError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __repr__(self):
+        return 'DumpError %r' % (self.msg)
+
+    def __str__(self):
+        return f"ERROR: Dump: {self.msg}"
+
+
+def parse_range(text: Union[str, None], length: int) -> Tuple[int, int]:
+    """
+    Разбор диапазона относительно начала памяти: START:END, START+SIZE,
+    START: (до конца памяти), :END. Без диапазона - вся память.
+    @return: начало и конец диапазона
+    """
+    if text is None:
+        return 0, length
+
+    match = _RE_RANGE.match(text)
+    if match is None:
+        raise DumpError(f"wrong range {text}, expected START:END or START+SIZE")
+
+    try:
+        start = int(match.group(1), 0) if match.group(1) else 0
+        if match.group(2) == '+':
+            end = start + int(match.group(3), 0)
+        else:
+            end = int(match.group(3), 0) if match.group(3) else length
+    except ValueError:
+        raise DumpError(f"wrong range {text}, expected START:END or START+SIZE")
+
+    if not (0 <= start < end <= length):
+        raise DumpError(f"range {start:#x}:{end:#x} is outside of memory size {length:#x}")
+    return start, end
+
+
+class BinWriter:
+    """
+    Запись прочитанных данных в двоичный файл, начинающийся с начала диапазона.
+    При продолжении данные дописываются после уже записанных
+    """
+
+    def __init__(self, path: str, resume=False):
+        self.written = os.path.getsize(path) if resume and os.path.exists(path) else 0
+        self.file = open(path, 'ab' if resume else 'wb')
+
+    def resume_address(self, start_address: int) -> int:
+        return start_address + self.written
+
+    def write(self, address: int, data: List[int]):
+        self.file.write(bytes(data))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class HexWriter:
+    """
+    Запись прочитанных данных в файл Intel HEX с абсолютными адресами.
+    При продолжении запись конца файла удаляется, данные дописываются
+    после последней записи данных
+    """
+
+    RECORD_SIZE = 16
+
+    def __init__(self, path: str, resume=False):
+        self.next_address: Union[int, None] = None
+        if resume and os.path.exists(path):
+            self.next_address = self._truncate_eof(path)
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        self.upper = -1
+
+    @staticmethod
+    def _truncate_eof(path: str) -> Union[int, None]:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+        upper = 0
+        next_address = None
+        kept: List[str] = []
+        for line_n, line in enumerate(lines):
+            if not line:
+                continue
+            try:
+                record = parse_hex_line(line, line_n + 1)
+            except (ParserError, ValueError, IndexError):
+                # последняя строка могла быть записана не полностью
+                break
+            if record.type == RecordType.EOF:
+                break
+            if record.type == RecordType.EXTADDR:
+                upper = record.address
+            elif record.type == RecordType.DATA:
+                next_address = upper + record.address + record.data.__len__()
+            kept.append(line)
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(''.join(line + '\n' for line in kept))
+        return next_address
+
+    def resume_address(self, start_address: int) -> int:
+        if self.next_address is None:
+            return start_address
+        return max(start_address, self.next_address)
+
+    def _record(self, record_type: int, address: int, data: List[int]):
+        body = [data.__len__(), (address >> 8) & 0xFF, address & 0xFF, record_type] + data
+        self.file.write(':' + ''.join(f"{byte:02X}" for byte in body) + f"{(-sum(body)) & 0xFF:02X}\n")
+
+    def write(self, address: int, data: List[int]):
+        for offset in range(0, data.__len__(), self.RECORD_SIZE):
+            line_address = address + offset
+            if line_address >> 16 != self.upper:
+                self.upper = line_address >> 16
+                self._record(0x04, 0, [(self.upper >> 8) & 0xFF, self.upper & 0xFF])
+            self._record(0x00, line_address & 0xFFFF, data[offset:offset + self.RECORD_SIZE])
+        self.file.flush()
+
+    def close(self):
+        self._record(0x01, 0, [])
+        self.file.close()
+
+
+def open_writer(path: str, resume=False) -> Union[BinWriter, HexWriter]:
+    if os.path.splitext(path)[1].lower() == '.hex':
+        return HexWriter(path, resume)
+    return BinWriter(path, resume)
+
+
+def read_words_chunks(openocd: OpenOcdTclRpc, address: int, byte_count: int, phase: str) -> Iterator[Tuple[int, List[int]]]:
+    """Чтение памяти на шине AHB словами по READ_CHUNK байт"""
+    task = progress.start(phase, byte_count)
+    for chunk in range(address, address + byte_count, READ_CHUNK):
+        chunk_size = min(READ_CHUNK, address + byte_count - chunk)
+        start = chunk & ~0x3
+        end = (chunk + chunk_size + 3) & ~0x3
+        with profiler.phase(phase, address=chunk):
+            data = words2bytes(openocd.read_memory(start, 32, (end - start) // 4))
+        task.advance(chunk_size, chunk)
+        yield chunk, data[chunk - start:chunk - start + chunk_size]
+    task.finish()
+
+
+def dump_memory(
+        openocd: OpenOcdTclRpc,
+        memory: BootMode,
+        output: str,
+        address_range: Union[str, None] = None,
+        resume=False,
+        use_quad_spi=False,
+        mik_version=MIK32_Version.AUTO,
+        board: Union[str, None] = None,
+) -> int:
+    """
+    Чтение EEPROM, флеш памяти SPIFI или ОЗУ в файл через установленное
+    соединение с OpenOCD. EEPROM и ОЗУ читаются по шине AHB, флеш память -
+    в режиме отображения в память. Прочитанные участки сразу записываются в файл.
+    @memory: читаемая память
+    @output: путь к файлу, .hex - Intel HEX, иначе двоичный файл
+    @address_range: диапазон относительно начала памяти, см. parse_range
+    @resume: продолжить чтение в существующий файл
+    @board: ключ платы для сохранения варианта МК и параметров флеш памяти
+    @return: возвращает 0 в случае успеха, 1 - иначе
+    """
+    section = next(section for section in mik32_sections if section.type == memory.to_memory_type())
+    start, end = parse_range(address_range, section.length)
+
+    writer = open_writer(output, resume)
+    try:
+        if resume:
+            start = writer.resume_address(section.offset + start) - section.offset
+            if start >= end:
+                print(f"Range is already dumped to {output}")
+                return 0
+            print(f"Resuming from {section.offset + start:#010x}")
+
+        start_time = time.perf_counter()
+        openocd.halt()
+
+        if memory == BootMode.SPIFI:
+            with profiler.phase('pm_init'):
+                power_manager.pm_init(openocd)
+            with profiler.phase('probe'):
+                mik_version = target_probe.resolve_version(openocd, mik_version, board)
+            with profiler.phase('gpio_init'):
+                port2_value = gpio_init(openocd, mik_version)
+            flash = GenericFlash(SPIFI(openocd))
+            with profiler.phase('probe'):
+                target_probe.probe_flash(flash, board)
+            # без диапазона читается вся флеш память по объему из SFDP
+            if address_range is None:
+                end = flash.geometry.size
+            elif end > flash.geometry.size:
+                gpio_deinit(openocd, mik_version, port2_value)
+                raise DumpError(f"range {address_range} exceeds flash size {flash.geometry.size:#x}")
+            if start >= end:
+                gpio_deinit(openocd, mik_version, port2_value)
+                print(f"Range is already dumped to {output}")
+                return 0
+            chunks = flash.dump(start, end - start, use_quad_spi)
+        else:
+            if memory == BootMode.EEPROM:
+                with profiler.phase('pm_init'):
+                    power_manager.pm_init(openocd)
+            chunks = read_words_chunks(openocd, section.offset + start, end - start, f"{memory} read")
+
+        for chunk, data in chunks:
+            if memory == BootMode.SPIFI:
+                chunk += section.offset
+            writer.write(chunk, data)
+
+        if memory == BootMode.SPIFI:
+            with profiler.phase('gpio_deinit'):
+                gpio_deinit(openocd, mik_version, port2_value)
+
+        read_time = time.perf_counter() - start_time
+        print(f"Read {end - start} bytes in {read_time:.2f} seconds "
+              f"(effective {((end - start) / (read_time * 1024)):.1f} kbyte/s) to {output}")
+    finally:
+        writer.close()
+
+    return 0
+
+
+def dump(
+        memory: BootMode,
+        output: str,
+        address_range: Union[str, None] = None,
+        resume=False,
+        use_quad_spi=False,
+        host: str = '127.0.0.1',
+        port: int = OpenOcdTclRpc.DEFAULT_PORT,
+        is_run_openocd=False,
+        openocd_exec=openocd_exec_path,
+        openocd_scripts=openocd_scripts_path,
+        openocd_interface=openocd_interface_path,
+        openocd_target=openocd_target_path,
+        adapter_speed=adapter_default_speed,
+        is_open_console=False,
+        log_path=default_log_path,
+        post_action=default_post_action,
+        mik_version=MIK32_Version.AUTO,
+        transfer_mode=TransferMode.AUTO,
+        transport=Transport.TCL,
+        gdb_port: int = GdbRspClient.DEFAULT_PORT,
+        adapter_serial: Union[str, None] = None,
+) -> int:
+    """
+    Чтение памяти MIK32 в файл, при необходимости с запуском OpenOCD.
+    @return: возвращает 0 в случае успеха, 1 - иначе
+    """
+    result = 0
+
+    # диапазон проверяется до запуска OpenOCD
+    section = next(section for section in mik32_sections if section.type == memory.to_memory_type())
+    try:
+        parse_range(address_range, section.length)
+    except DumpError as e:
+        print(e)
+        return 1
+
+    try:
+        port = int(port)
+        gdb_port = int(gdb_port)
+    except ValueError:
+        print("An integer argument --openocd-port and --gdb-port was expected!")
+
+    proc: Union[OpenOcdProcess, None] = None
+    if is_run_openocd:
+        try:
+            proc = run_openocd(openocd_exec, openocd_scripts,
+                               openocd_interface, openocd_target, is_open_console,
+                               adapter_serial=adapter_serial, tcl_port=port, gdb_port=gdb_port)
+        except OSError as e:
+            raise OpenOCDError(e)
+
+    openocd: Union[OpenOcdTclRpc, None] = None
+    try:
+        openocd = open_session(proc, host, port, openocd_interface, adapter_speed,
+                               log_path, transfer_mode, transport, gdb_port, adapter_serial)
+        if openocd is None:
+            return 1
+
+        result = dump_memory(openocd, memory, output, address_range, resume, use_quad_spi, mik_version,
+                             adapter_clock.cache_key(openocd_interface, adapter_serial))
+        if result == 0:
+            with profiler.phase('post action'):
+                openocd.run(post_action)
+    except DumpError as e:
+        print(e)
+        result = 1
+    except ConnectionRefusedError:
+        print("ERROR: The connection to OpenOCD is not established. Check the settings and connection of the debugger")
+        result = 1
+    except (OpenOCDError, TclPortError, TclException, GdbRspError) as e:
+        print(e)
+        result = 1
+    except ConnectionResetError as e:
+        print("ERROR: Tcl connection reset")
+        print("Check OpenOCD log")
+        print(e.strerror)
+        result = 1
+    except OSError as e:
+        print(f"ERROR: Cannot write {output}: {e}")
+        result = 1
+    finally:
+        if openocd is not None:
+            openocd.__exit__()
+        if proc is not None:
+            proc.kill()
+
+    return result
@@ -0,0 +1,215 @@
+import glob
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, NamedTuple, Tuple, Union
+
+from gdbrsp import GdbRspClient
+from mik32_upload import Firmware, PreparedFirmware, prepare_firmware, upload_segments, BootMode, \
+    openocd_scripts_path, openocd_interface_path
+from tclrpc import OpenOcdTclRpc
+import progress
+
+
+default_telnet_port = 4444
+
+
+class GangBoard(NamedTuple):
+    serial: str
+    tcl_port: int
+    gdb_port: int
+    telnet_port: int
+
+
+@dataclass
+class BoardResult:
+    board: GangBoard
+    result: int
+    elapsed: float
+
+
+def assign_ports(serials: List[str]) -> List[GangBoard]:
+    """
+    Назначение каждому отладчику своих портов Tcl, GDB и telnet серверов OpenOCD
+    """
+    return [
+        GangBoard(
+            serial,
+            OpenOcdTclRpc.DEFAULT_PORT + i,
+            GdbRspClient.DEFAULT_PORT + i,
+            default_telnet_port + i
+        ) for i, serial in enumerate(serials)
+    ]
+
+
+def read_vid_pid(openocd_scripts: str, openocd_interface: str) -> Union[Tuple[int, int], None]:
+    """
+    Чтение VID и PID отладчика из файла конфигурации интерфейса
+    """
+    path = openocd_interface
+    if not os.path.isabs(path):
+        path = os.path.join(openocd_scripts, openocd_interface)
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = f.read()
+    except OSError:
+        return None
+
+    match = re.search(r"^\s*\S*\s*vid_pid\s+(0x[0-9a-fA-F]+)\s+(0x[0-9a-fA-F]+)", config, re.MULTILINE)
+    if match is None:
+        return None
+
+    return int(match.group(1), base=16), int(match.group(2), base=16)
+
+
+def find_adapter_serials(
+    openocd_scripts: str = openocd_scripts_path,
+    openocd_interface: str = openocd_interface_path
+) -> List[str]:
+    """
+    Поиск серийных номеров подключенных отладчиков с VID и PID из файла конфигурации интерфейса.
+    Поиск выполняется через sysfs и доступен только в Linux
+    """
+    vid_pid = read_vid_pid(openocd_scripts, openocd_interface)
+    if vid_pid is None:
+        return []
+
+    serials: List[str] = []
+    for device in sorted(glob.glob('/sys/bus/usb/devices/*')):
+        try:
+            with open(os.path.join(device, 'idVendor')) as f:
+                vid = int(f.read(), base=16)
+            with open(os.path.join(device, 'idProduct')) as f:
+                pid = int(f.read(), base=16)
+            with open(os.path.join(device, 'serial')) as f:
+                serial = f.read().strip()
+        except (OSError, ValueError):
+            continue
+
+        if (vid, pid) == vid_pid and serial not in serials:
+            serials.append(serial)
+
+    return serials
+
+
+class BoardOutput:
+    """
+    Вывод с префиксом серийного номера отладчика для потоков, прошивающих платы.
+    Строки каждого потока выводятся целиком и не перемешиваются
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def set_prefix(self, prefix: Union[str, None]):
+        self.local.prefix = prefix
+        self.local.buffer = ''
+
+    def write(self, text: str):
+        prefix = getattr(self.local, 'prefix', None)
+        if prefix is None:
+            return self.stream.write(text)
+
+        lines = (self.local.buffer + text).split('\n')
+        self.local.buffer = lines.pop()
+        with self.lock:
+            for line in lines:
+                self.stream.write(f"[{prefix}] {line}\n")
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def upload_board(board: GangBoard, firmware: PreparedFirmware, output: BoardOutput, upload_args: dict) -> BoardResult:
+    output.set_prefix(board.serial)
+    progress.set_board(board.serial)
+    start_time = time.perf_counter()
+    try:
+        result = upload_segments(
+            firmware.segments,
+            firmware.pages,
+            firmware.drivers,
+            port=board.tcl_port,
+            gdb_port=board.gdb_port,
+            telnet_port=board.telnet_port,
+            adapter_serial=board.serial,
+            is_run_openocd=True,
+            **upload_args
+        )
+    except Exception as e:
+        print(f"ERROR: {e!r}")
+        result = 1
+    finally:
+        output.set_prefix(None)
+        progress.set_board(None)
+
+    return BoardResult(board, result, time.perf_counter() - start_time)
+
+
+def print_summary(results: List[BoardResult], total_time: float):
+    print(f"{'Adapter serial':<20} {'Tcl port':>8} {'Result':>6} {'Time, s':>8}")
+    for board_result in results:
+        status = "PASS" if board_result.result == 0 else "FAIL"
+        print(f"{board_result.board.serial:<20} {board_result.board.tcl_port:>8} "
+              f"{status:>6} {board_result.elapsed:>8.2f}")
+
+    passed = sum(1 for board_result in results if board_result.result == 0)
+    print(f"Passed {passed}/{len(results)} boards in {total_time:.2f} seconds")
+
+
+def gang_upload(
+    filename: Firmware,
+    serials: List[str],
+    boot_mode=BootMode.UNDEFINED,
+    **upload_args
+) -> int:
+    """
+    Одновременная прошивка нескольких плат, подключенных к одному компьютеру.
+    Для каждого отладчика запускается отдельный OpenOCD со своими портами,
+    файл прошивки и драйверы читаются один раз.
+    @filename: полный путь до файла прошивки или список образов (FirmwareImage)
+    @serials: серийные номера отладчиков, если список пуст, выполняется поиск
+    @upload_args: аргументы upload_segments, общие для всех плат
+    @return: возвращает 0, если все платы прошиты успешно, 1 - иначе
+    """
+
+    if serials.__len__() == 0:
+        serials = find_adapter_serials(
+            upload_args.get('openocd_scripts', openocd_scripts_path),
+            upload_args.get('openocd_interface', openocd_interface_path)
+        )
+        if serials.__len__() == 0:
+            print("ERROR: No adapters found, specify serial numbers with --adapter-serial")
+            return 1
+
+    print(f"Gang programming of {serials.__len__()} boards: {', '.join(serials)}")
+
+    firmware = prepare_firmware(filename, boot_mode, upload_args.get('use_driver', True))
+    if firmware is None:
+        return 1
+
+    boards = assign_ports(serials)
+
+    output = BoardOutput(sys.stdout)
+    sys.stdout = output
+    start_time = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=boards.__len__()) as executor:
+            results = list(executor.map(
+                lambda board: upload_board(board, firmware, output, upload_args),
+                boards
+            ))
+    finally:
+        sys.stdout = output.stream
+
+    print_summary(results, time.perf_counter() - start_time)
+
+    return 0 if all(board_result.result == 0 for board_result in results) else 1
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Union
+
+from mik32_debug_hal.gpio import MIK32_Version
+from mik32_debug_hal.power_manager import ClockMode
+from mik32_upload import BootMode, FirmwareImage, configure_openocd, prepare_firmware, write_firmware, \
+    adapter_default_speed, default_log_path, default_post_action, openocd_interface_path
+from rpc_trace import command_type, load_trace, print_latency_histograms
+from tclrpc import OpenOcdTclRpc, TclException
+from transfer import TransferMode
+
+
+class ReplayError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __repr__(self):
+        return 'ReplayError %r' % (self.msg)
+
+    def __str__(self):
+        return f"ERROR: Replay: {self.msg}"
+
+
+class ReplayRpc(OpenOcdTclRpc):
+    """
+    Соединение с OpenOCD, отвечающее записанными ответами из трассы.
+    Команды HAL сверяются с записанными по типу, при расхождении
+    воспроизведение прерывается. В режиме realtime ответ задерживается
+    на записанное время
+    """
+
+    __slots__ = (
+        'records',
+        'index',
+        'realtime',
+    )
+
+    def __init__(self, records: List[Dict], transfer_mode=TransferMode.TCL_TEXT, realtime=False):
+        super().__init__('127.0.0.1', OpenOcdTclRpc.DEFAULT_PORT, transfer_mode)
+        self.records = records
+        self.index = 0
+        self.realtime = realtime
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def sendrecv(self, cmd):
+        if self.index >= self.records.__len__():
+            raise ReplayError(f"trace ended before command #{self.index}: {cmd[:80]}")
+
+        record = self.records[self.index]
+        if command_type(cmd) != command_type(record['cmd']):
+            raise ReplayError(f"command #{self.index} diverged: trace has {command_type(record['cmd'])}, "
+                              f"got {command_type(cmd)}")
+        self.index += 1
+
+        if self.realtime:
+            time.sleep(record['dt'])
+
+        self.stats.commands += 1
+        self.stats.bytes_sent += cmd.__len__() + 1
+        self.stats.bytes_received += record['reply'].__len__() + 1
+        return record['reply']
+
+
+def replay_trace(trace_path: str, filename: Union[str, None] = None, realtime=False) -> int:
+    """
+    Воспроизведение записанной прошивки без отладчика: тот же код HAL получает
+    записанные ответы OpenOCD. Время воспроизведения без realtime - время работы
+    скрипта на стороне компьютера.
+    @filename: файл прошивки, по умолчанию - файл из заголовка трассы
+    @return: возвращает 0, если трасса воспроизведена полностью, 1 - иначе
+    """
+    header, records = load_trace(trace_path)
+    if header.get('transport', 'tcl') != 'tcl':
+        print("ERROR: Traces recorded with the gdb transport cannot be replayed")
+        return 1
+
+    if filename is None:
+        filename = header.get('file')
+    if filename is None:
+        print("ERROR: Firmware file is not specified in the trace, use --firmware")
+        return 1
+
+    if isinstance(filename, list):
+        # образы с адресами начала, записанные одним сеансом
+        filename = [FirmwareImage(path, base_address) for path, base_address in filename]
+
+    use_driver = header.get('use_driver', True)
+    firmware = prepare_firmware(filename, BootMode(header.get('boot_mode', 'undefined')), use_driver)
+    if firmware is None:
+        return 1
+
+    transfer_mode = TransferMode(header.get('transfer', TransferMode.TCL_TEXT.value))
+    if header.get('transfer_check', False):
+        # auto для локального адреса: load_image с проверкой первой передачи
+        transfer_mode = TransferMode.AUTO
+    openocd = ReplayRpc(records, transfer_mode, realtime)
+
+    # копии сохраненных параметров цели и скоростей отладчиков на момент записи,
+    # файлы пользователя не изменяются
+    target_cache = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump(header.get('target_cache', {}), target_cache)
+    target_cache.close()
+    speed_cache = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump(header.get('speed_cache', {}), speed_cache)
+    speed_cache.close()
+
+    result = 0
+    start_time = time.perf_counter()
+    try:
+        configure_openocd(
+            openocd,
+            header.get('openocd_interface', openocd_interface_path),
+            header.get('adapter_speed', adapter_default_speed),
+            header.get('log_path', default_log_path),
+            header.get('adapter_serial'),
+            speed_cache.name,
+        )
+        result = write_firmware(
+            openocd,
+            firmware.segments,
+            firmware.pages,
+            use_quad_spi=header.get('use_quad_spi', False),
+            mik_version=MIK32_Version(header.get('mcu_type', MIK32_Version.MIK32V2.value)),
+            use_driver=use_driver,
+            drivers=firmware.drivers,
+            clock_mode=ClockMode(header.get('clock_mode', ClockMode.KEEP.value)),
+            board=header.get('board'),
+            target_cache_path=target_cache.name,
+        )
+        if result == 0:
+            openocd.run(header.get('post_action', default_post_action))
+    except (ReplayError, TclException) as e:
+        print(e)
+        result = 1
+    finally:
+        os.unlink(target_cache.name)
+        os.unlink(speed_cache.name)
+    replay_time = time.perf_counter() - start_time
+
+    openocd_time = sum(record['dt'] for record in records)
+    recorded_time = 0
+    if records.__len__() > 0:
+        recorded_time = records[-1]['t'] + records[-1]['dt'] - records[0]['t']
+    print(f"Replayed {openocd.index}/{records.__len__()} commands in {replay_time:.3f} seconds")
+    print(f"Recorded session {recorded_time:.3f} seconds, waiting for OpenOCD {openocd_time:.3f} seconds, "
+          f"host side {recorded_time - openocd_time:.3f} seconds")
+
+    if openocd.index != records.__len__():
+        print(f"ERROR: {records.__len__() - openocd.index} recorded commands were not replayed")
+        result = 1
+
+    return result
+
+
+def createParser():
+    parser = argparse.ArgumentParser(
+        prog='mik32_replay.py',
+        usage='python mik32_replay.py trace.jsonl',
+        description='''Воспроизведение и анализ записи обращений к OpenOCD, сделанной
+        с аргументом --trace скрипта mik32_upload.py'''
+    )
+    parser.add_argument(
+        'trace',
+        help='Путь к файлу записи'
+    )
+    parser.add_argument(
+        '--firmware',
+        dest='firmware',
+        default=None,
+        help='Путь к файлу прошивки. По умолчанию: файл, указанный в записи'
+    )
+    parser.add_argument(
+        '--realtime',
+        dest='realtime',
+        action='store_true',
+        default=False,
+        help='Задерживать ответы на записанное время'
+    )
+    parser.add_argument(
+        '--stats',
+        dest='stats',
+        action='store_true',
+        default=False,
+        help='Только вывести гистограммы задержек по типам команд'
+    )
+    return parser
+
+
+if __name__ == '__main__':
+    parser = createParser()
+    namespace = parser.parse_args()
+
+    if namespace.stats:
+        header, records = load_trace(namespace.trace)
+        print_latency_histograms(records)
+        sys.exit(0)
+
+    sys.exit(replay_trace(namespace.trace, namespace.firmware, namespace.realtime))
@@ -0,0 +1,334 @@
+import json
+import os
+import socket
+import socketserver
+import time
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from typing import List, Tuple, Union
+
+import adapter_clock
+from gdbrsp import GdbRspClient, GdbRspError
+from hex_parser import Segment
+from parsers import ParserError
+from openocd_process import OpenOCDError, OpenOcdProcess
+from mik32_debug_hal.dma import DmaError
+from mik32_debug_hal.gpio import MIK32_Version
+from mik32_debug_hal.power_manager import ClockMode
+from mik32_debug_hal.spifi import SPIFI
+from flash_drivers.generic_flash import GenericFlash
+from mik32_upload import BootMode, Pages, form_pages, open_session, read_driver_images, read_firmware, \
+    run_openocd, write_firmware, adapter_default_speed, default_log_path, default_post_action, \
+    openocd_exec_path, openocd_scripts_path, openocd_interface_path, openocd_target_path
+from tclrpc import OpenOcdTclRpc, TargetState, TclException, TclPortError
+from transfer import TransferMode
+from transport import Transport
+
+
+default_server_port = 6680
+
+
+class ImageCache:
+    """
+    Кэш разобранных файлов прошивки. Файл разбирается повторно,
+    только если изменились время изменения или размер.
+    Хранится не более max_images файлов, при переполнении удаляется
+    файл, который дольше всего не использовался
+    """
+
+    DEFAULT_MAX_IMAGES = 16
+
+    def __init__(self, max_images: int = DEFAULT_MAX_IMAGES):
+        self.max_images = max_images
+        self.images: OrderedDict[Tuple[str, BootMode], Tuple[Tuple[int, int], List[Segment], Pages]] = \
+            OrderedDict()
+
+    def get(self, filename: str, boot_mode: BootMode) -> Union[Tuple[List[Segment], Pages], None]:
+        path = os.path.abspath(filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            print(f"ERROR: File {filename} does not exist")
+            return None
+
+        key = (path, boot_mode)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self.images.get(key)
+        if cached is not None and cached[0] == version:
+            print(f"Using cached image {path}")
+            self.images.move_to_end(key)
+            return cached[1], cached[2]
+
+        segments = read_firmware(path)
+        if segments is None:
+            return None
+
+        pages = form_pages(segments, boot_mode)
+        self.images[key] = (version, segments, pages)
+        self.images.move_to_end(key)
+        while self.images.__len__() > self.max_images:
+            self.images.popitem(last=False)
+        return segments, pages
+
+
+class JobOutput:
+    """
+    Пересылка вывода задания клиенту построчно в формате JSON
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.buffer = ''
+
+    def send(self, message: dict):
+        try:
+            self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+            self.wfile.flush()
+        except OSError:
+            pass
+
+    def write(self, text: str):
+        lines = (self.buffer + text).split('\n')
+        self.buffer = lines.pop()
+        for line in lines:
+            self.send({'output': line})
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.send({'output': self.buffer})
+            self.buffer = ''
+
+
+class FlashServer:
+    """
+    Сервер прошивки, сохраняющий запущенный OpenOCD, соединение с ним
+    и разобранные файлы прошивки между заданиями.
+    Перед каждым заданием цель исследуется заново, что позволяет менять
+    платы без перезапуска OpenOCD
+    """
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = OpenOcdTclRpc.DEFAULT_PORT,
+        is_run_openocd=False,
+        openocd_exec=openocd_exec_path,
+        openocd_scripts=openocd_scripts_path,
+        openocd_interface=openocd_interface_path,
+        openocd_target=openocd_target_path,
+        adapter_speed=adapter_default_speed,
+        adapter_serial: Union[str, None] = None,
+        log_path=default_log_path,
+        transfer_mode=TransferMode.AUTO,
+        transport=Transport.TCL,
+        gdb_port: int = GdbRspClient.DEFAULT_PORT,
+        job_defaults: Union[dict, None] = None,
+    ):
+        self.host = host
+        self.port = int(port)
+        self.is_run_openocd = is_run_openocd
+        self.openocd_exec = openocd_exec
+        self.openocd_scripts = openocd_scripts
+        self.openocd_interface = openocd_interface
+        self.openocd_target = openocd_target
+        self.adapter_speed = adapter_speed
+        self.adapter_serial = adapter_serial
+        self.log_path = log_path
+        self.transfer_mode = transfer_mode
+        self.transport = transport
+        self.gdb_port = int(gdb_port)
+        self.job_defaults = job_defaults if job_defaults is not None else {}
+
+        self.images = ImageCache()
+        self.drivers = read_driver_images()
+        self.proc: Union[OpenOcdProcess, None] = None
+        self.openocd: Union[OpenOcdTclRpc, None] = None
+        self.jobs_done = 0
+
+    def start(self):
+        if self.is_run_openocd and (self.proc is None or self.proc.poll() is not None):
+            try:
+                self.proc = run_openocd(self.openocd_exec, self.openocd_scripts,
+                                        self.openocd_interface, self.openocd_target,
+                                        adapter_serial=self.adapter_serial, tcl_port=self.port,
+                                        gdb_port=self.gdb_port)
+            except OSError as e:
+                raise OpenOCDError(e)
+
+        self.openocd = open_session(self.proc, self.host, self.port, self.openocd_interface, self.adapter_speed,
+                                    self.log_path, self.transfer_mode, self.transport, self.gdb_port,
+                                    self.adapter_serial)
+        if self.openocd is None:
+            raise ConnectionRefusedError
+
+    def disconnect(self):
+        if self.openocd is not None:
+            try:
+                self.openocd.__exit__()
+            except OSError:
+                pass
+            self.openocd = None
+
+    def stop(self):
+        self.disconnect()
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc = None
+
+    def examine(self):
+        """
+        Повторная инициализация цепочки JTAG и исследование цели
+        на случай замены платы
+        """
+        self.openocd.run("capture \"jtag arp_init\"")
+        self.openocd.run("capture \"riscv.cpu arp_examine\"")
+        # между заданиями цель могли сбросить или заменить
+        self.openocd.set_state(TargetState.UNKNOWN)
+
+    def run_job(self, job: dict) -> int:
+        options = dict(self.job_defaults)
+        options.update({key: value for key, value in job.items() if value is not None})
+
+        try:
+            image = self.images.get(options['file'], BootMode(options.get('boot_mode', 'undefined')))
+        except ParserError as e:
+            print(e)
+            return 1
+        if image is None:
+            return 1
+        segments, pages = image
+
+        for attempt in range(2):
+            try:
+                if self.openocd is None:
+                    self.start()
+                self.examine()
+                result = write_firmware(
+                    self.openocd,
+                    segments,
+                    pages,
+                    use_quad_spi=options.get('use_quad_spi', False),
+                    mik_version=MIK32_Version(options.get('mcu_type', MIK32_Version.MIK32V2.value)),
+                    use_driver=options.get('use_driver', True),
+                    drivers=self.drivers,
+                    clock_mode=ClockMode(options.get('clock_mode', ClockMode.KEEP.value)),
+                    board=adapter_clock.cache_key(self.openocd_interface, self.adapter_serial),
+                )
+                if result == 0:
+                    self.openocd.run(options.get('post_action', default_post_action))
+                return result
+            except (ConnectionError, TclPortError, GdbRspError, socket.timeout) as e:
+                # соединение с OpenOCD потеряно, переподключение и повтор задания
+                print(f"ERROR: OpenOCD connection lost: {e!r}")
+                self.disconnect()
+            except (OpenOCDError, TclException) as e:
+                print(e)
+                return 1
+            except (DmaError, SPIFI.SpifiError, GenericFlash.FlashError) as e:
+                print(e)
+                return 1
+
+        return 1
+
+    def serve_forever(self, server_port: int = default_server_port):
+        server = self
+
+        class JobHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                output = JobOutput(self.wfile)
+                try:
+                    job = json.loads(self.rfile.readline().decode('utf-8'))
+                except ValueError:
+                    output.send({'result': 1, 'error': 'Malformed job'})
+                    return
+
+                if job.get('command') == 'shutdown':
+                    output.send({'result': 0})
+                    self.server.shutdown_requested = True
+                    return
+                if job.get('command') == 'status':
+                    output.send({'result': 0, 'jobs_done': server.jobs_done,
+                                 'connected': server.openocd is not None})
+                    return
+                if 'file' not in job:
+                    output.send({'result': 1, 'error': 'Job has no firmware file'})
+                    return
+
+                start_time = time.perf_counter()
+                with redirect_stdout(output):
+                    result = server.run_job(job)
+                    output.flush()
+                elapsed = time.perf_counter() - start_time
+                server.jobs_done += 1
+                print(f"Job #{server.jobs_done} {job.get('file')}: "
+                      f"{'OK' if result == 0 else 'FAILED'} in {elapsed:.2f} seconds", flush=True)
+                output.send({'result': result, 'elapsed': elapsed})
+
+        with socketserver.TCPServer(('127.0.0.1', server_port), JobHandler) as tcp_server:
+            tcp_server.shutdown_requested = False
+            print(f"Waiting for jobs on port {server_port}", flush=True)
+            while not tcp_server.shutdown_requested:
+                tcp_server.handle_request()
+
+
+def serve(server_port: int = default_server_port, **server_args) -> int:
+    """
+    Запуск сервера прошивки.
+    @server_port: порт для приема заданий
+    @server_args: аргументы FlashServer
+    @return: возвращает 0 после команды shutdown, 1 - если OpenOCD не удалось запустить
+    """
+    server = FlashServer(**server_args)
+    try:
+        server.start()
+        print("OpenOCD session is ready")
+        server.serve_forever(int(server_port))
+    except (ConnectionRefusedError, OpenOCDError, TclException) as e:
+        print(f"ERROR: OpenOCD session failed: {e!r}")
+        return 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+    return 0
+
+
+def submit_job(
+    job: dict,
+    server_host: str = '127.0.0.1',
+    server_port: int = default_server_port,
+) -> int:
+    """
+    Отправка задания серверу прошивки и вывод его результатов.
+    @job: словарь с полями file, boot_mode, use_quad_spi, use_driver, clock_mode, post_action, mcu_type
+        или command (status, shutdown)
+    @return: код результата задания
+    """
+    if 'file' in job:
+        job['file'] = os.path.abspath(job['file'])
+
+    try:
+        with socket.create_connection((server_host, int(server_port))) as sock:
+            sock.sendall(json.dumps(job).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as reply:
+                for line in reply:
+                    message = json.loads(line.decode('utf-8'))
+                    if 'output' in message:
+                        print(message['output'], flush=True)
+                    elif 'result' in message:
+                        if 'error' in message:
+                            print(f"ERROR: {message['error']}")
+                        if 'elapsed' in message:
+                            print(f"Job done in {message['elapsed']:.2f} seconds")
+                        if 'jobs_done' in message:
+                            print(f"Jobs done: {message['jobs_done']}, "
+                                  f"OpenOCD connected: {message['connected']}")
+                        return message['result']
+    except ConnectionRefusedError:
+        print("ERROR: Flashing server is not running")
+        return 1
+
+    print("ERROR: Flashing server closed the connection")
+    return 1
@@ -4,16 +4,29 @@ import socket
 import subprocess
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import List, Dict, NamedTuple, Union
+from typing import Callable, List, Dict, NamedTuple, Set, Tuple, Union
 from hex_parser import FirmwareFile, MemorySection, MemoryType, Segment
-from tclrpc import OpenOcdTclRpc, TclException, TclPortError
+from tclrpc import OpenOcdTclRpc, TargetState, TclException, TclPortError
+from transfer import TransferMode
+from transport import Transport, create_rpc
+from gdbrsp import GdbRspClient, GdbRspError
+from openocd_process import OpenOCDError, OpenOcdProcess
 from mik32_debug_hal.gpio import MIK32_Version, gpio_init, gpio_deinit
+from mik32_debug_hal.power_manager import ClockMode
 from mik32_debug_hal.eeprom import EEPROM
 from mik32_debug_hal.spifi import SPIFI
 from flash_drivers.generic_flash import GenericFlash
+from mik32_debug_hal.dma import DmaError
 import mik32_debug_hal.ram as ram
 import mik32_debug_hal.power_manager as power_manager
+import adapter_clock
+import target_probe
+import upload_journal
+import profiler
+import progress
+import rpc_trace
 from _version import applicaton_version
 from parsers import *
 import logging
@@ -53,6 +66,8 @@ if os.name == 'nt':
 
 adapter_default_speed = 500
 
+default_profile_path = "mik32-profile.json"
+
 
 memory_page_size = {
     MemoryType.EEPROM: 128,
@@ -114,40 +129,52 @@ def segments_to_pages(segments: List[Segment], page_size: int) -> Dict[int, List
     return pages
 
 
-class OpenOCDError(Exception):
-    def __init__(self, msg):
-        self.msg = msg
-
-    def __repr__(self):
-        return f"ERROR: OpenOCD Startup Exception: {self.msg}"
-
-
 def run_openocd(
     openocd_exec=openocd_exec_path,
     openocd_scripts=openocd_scripts_path,
     openocd_interface=openocd_interface_path,
     openocd_target=openocd_target_path,
-    is_open_console=False
-) -> subprocess.Popen:
-    cmd = [openocd_exec, "-s", openocd_scripts,
-           "-f", openocd_interface, "-f", openocd_target]
-
+    is_open_console=False,
+    adapter_serial: Union[str, None] = None,
+    tcl_port: Union[int, None] = None,
+    gdb_port: Union[int, None] = None,
+    telnet_port: Union[int, None] = None,
+) -> OpenOcdProcess:
+    cmd = [openocd_exec, "-s", openocd_scripts, "-f", openocd_interface]
+
+    # настройки отладчика и портов должны быть заданы до init в файле МК
+    if adapter_serial is not None:
+        cmd += ["-c", f"adapter serial {adapter_serial}"]
+    if tcl_port is not None:
+        cmd += ["-c", f"tcl_port {tcl_port}"]
+    if gdb_port is not None:
+        cmd += ["-c", f"gdb_port {gdb_port}"]
+    if telnet_port is not None:
+        cmd += ["-c", f"telnet_port {telnet_port}"]
+
+    cmd += ["-f", openocd_target]
+
+    creation_flags = 0
     if os.name == 'nt':
         creation_flags = subprocess.SW_HIDE
         if is_open_console:
             creation_flags |= subprocess.CREATE_NEW_CONSOLE
 
-        proc = subprocess.Popen(
-            cmd, creationflags=creation_flags)
-    else:
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-
-    return proc
+    # вывод OpenOCD в отдельной консоли не перехватывается
+    return OpenOcdProcess(
+        cmd,
+        tcl_port=tcl_port if tcl_port is not None else OpenOcdTclRpc.DEFAULT_PORT,
+        capture_output=not (os.name == 'nt' and is_open_console),
+        creation_flags=creation_flags
+    )
 
 
 class Pages(NamedTuple):
     pages_eeprom: Dict[int, List[int]]
     pages_spifi: Dict[int, List[int]]
+    # размер данных прошивки без заполнения страниц
+    bytes_eeprom: int = 0
+    bytes_spifi: int = 0
 
 
 def filter_segments(segments: List[Segment], memory_type: MemoryType, boot_type: MemoryType = MemoryType.UNKNOWN) -> List[Segment]:
@@ -164,18 +191,25 @@ def filter_segments(segments: List[Segment], memory_type: MemoryType, boot_type:
 
 
 def form_pages(segments: List[Segment], boot_mode=BootMode.UNDEFINED) -> Pages:
+    segments_eeprom = filter_segments(segments, MemoryType.EEPROM,
+                                      boot_mode.to_memory_type())
     pages_eeprom = segments_to_pages(
-        filter_segments(segments, MemoryType.EEPROM,
-                        boot_mode.to_memory_type()),
+        segments_eeprom,
         memory_page_size[MemoryType.EEPROM]
     )
+    segments_spifi = filter_segments(segments, MemoryType.SPIFI,
+                                     boot_mode.to_memory_type())
     pages_spifi = segments_to_pages(
-        filter_segments(segments, MemoryType.SPIFI,
-                        boot_mode.to_memory_type()),
+        segments_spifi,
         memory_page_size[MemoryType.SPIFI]
     )
 
-    return Pages(pages_eeprom, pages_spifi)
+    return Pages(
+        pages_eeprom,
+        pages_spifi,
+        sum(segment.data.__len__() for segment in segments_eeprom),
+        sum(segment.data.__len__() for segment in segments_spifi)
+    )
 
 
 adapter_speed_not_supported = [
@@ -184,8 +218,201 @@ adapter_speed_not_supported = [
 ]
 
 
+def read_firmware(filename: str) -> Union[List[Segment], None]:
+    """
+    Чтение файла прошивки в формате Intel HEX или бинарном.
+    @filename: полный путь до файла прошивки
+    @return: список сегментов или None, если файл не удалось прочитать
+    """
+
+    if not os.path.exists(filename):
+        print(f"ERROR: File {filename} does not exist")
+        return None
+
+    try:
+        file = FirmwareFile(filename, mik32_sections)
+    except ParserError as e:
+        print(e)
+        return None
+
+    return file.get_segments()
+
+
+class FirmwareImage(NamedTuple):
+    """Файл прошивки и адрес начала образа, None - адреса из файла"""
+    path: str
+    base_address: Union[int, None] = None
+
+    def __str__(self):
+        if self.base_address is None:
+            return self.path
+        return f"{self.path}@{self.base_address:#x}"
+
+
+# один файл или несколько образов, записываемых за один сеанс
+Firmware = Union[str, FirmwareImage, List[Union[str, FirmwareImage]]]
+
+
+def parse_image(argument: str) -> FirmwareImage:
+    """Аргумент файла прошивки: путь или путь@адрес"""
+    path, separator, address = argument.rpartition('@')
+    if separator:
+        try:
+            return FirmwareImage(path, int(address, 0))
+        except ValueError:
+            pass
+    return FirmwareImage(argument)
+
+
+def firmware_images(firmware: Firmware) -> List[FirmwareImage]:
+    if not isinstance(firmware, list):
+        firmware = [firmware]
+    return [image if isinstance(image, FirmwareImage) else FirmwareImage(image) for image in firmware]
+
+
+def relocate_segments(segments: List[Segment], base_address: int) -> List[Segment]:
+    """Перенос сегментов образа так, чтобы образ начинался с base_address"""
+    if segments.__len__() == 0:
+        return segments
+    shift = base_address - min(segment.offset for segment in segments)
+    return [Segment(segment.offset + shift, segment.data, mik32_sections) for segment in segments]
+
+
+def segment_destination(segment: Segment, boot_mode=BootMode.UNDEFINED) -> Union[Tuple[MemoryType, int], None]:
+    """
+    Память и смещение, куда записывается сегмент, с учетом отображения
+    загрузочной области. None - сегмент не записывается
+    """
+    if segment.memory is None:
+        return None
+    memory_type = segment.memory.type
+    if memory_type == MemoryType.BOOT:
+        memory_type = boot_mode.to_memory_type()
+        if memory_type == MemoryType.UNKNOWN:
+            return None
+    return memory_type, segment.offset - segment.memory.offset
+
+
+def find_overlaps(images: List[Tuple[FirmwareImage, List[Segment]]], boot_mode=BootMode.UNDEFINED) -> List[str]:
+    """Пересечения образов в памяти МК, описания для вывода"""
+    ranges: List[Tuple[MemoryType, int, int, FirmwareImage]] = []
+    for image, segments in images:
+        for segment in segments:
+            destination = segment_destination(segment, boot_mode)
+            if destination is not None:
+                memory_type, offset = destination
+                ranges.append((memory_type, offset, offset + segment.data.__len__(), image))
+
+    overlaps: List[str] = []
+    for i, (memory_type, start, end, image) in enumerate(ranges):
+        for other_type, other_start, other_end, other in ranges[i + 1:]:
+            if other is not image and other_type == memory_type and start < other_end and other_start < end:
+                overlaps.append(f"{image} and {other} overlap in {memory_type.name} at "
+                                f"{max(start, other_start):#x}..{min(end, other_end) - 1:#x}")
+    return overlaps
+
+
+def read_images(firmware: Firmware, boot_mode=BootMode.UNDEFINED) -> Union[List[Segment], None]:
+    """
+    Чтение образов и проверка их пересечения в памяти МК.
+    @return: сегменты всех образов или None, если файл не прочитан
+    или образы пересекаются
+    """
+    images: List[Tuple[FirmwareImage, List[Segment]]] = []
+    for image in firmware_images(firmware):
+        segments = read_firmware(image.path)
+        if segments is None:
+            return None
+        if image.base_address is not None:
+            try:
+                segments = relocate_segments(segments, image.base_address)
+            except ParserError as e:
+                print(f"{e} in {image}")
+                return None
+        images.append((image, segments))
+
+    overlaps = find_overlaps(images, boot_mode)
+    for overlap in overlaps:
+        print(f"ERROR: {overlap}")
+    if overlaps.__len__() > 0:
+        return None
+
+    return [segment for _, segments in images for segment in segments]
+
+
+class DriverImages(NamedTuple):
+    eeprom: Union[str, ram.DriverImage]
+    spifi: Union[str, ram.DriverImage]
+
+
+def get_driver_path(driver_name: str) -> str:
+    return os.path.join(
+        default_drivers_path,
+        driver_name,
+        default_drivers_build_path,
+        'firmware.hex'
+    )
+
+
+default_driver_images = DriverImages(
+    get_driver_path('jtag-eeprom'),
+    get_driver_path('jtag-spifi')
+)
+
+
+def read_driver_images() -> DriverImages:
+    """
+    Чтение драйверов EEPROM и SPIFI на стороне компьютера.
+    Драйвер, который не удалось прочитать, загружается командой load_image по пути
+    """
+    images = []
+    for path in default_driver_images:
+        try:
+            images.append(ram.DriverImage(path, FirmwareFile(path, mik32_sections).get_segments()))
+        except (OSError, ParserError):
+            images.append(path)
+
+    return DriverImages(*images)
+
+
+class RegionResult(NamedTuple):
+    """Результат записи области памяти: объем данных, время, число обращений к OpenOCD"""
+    memory: MemoryType
+    bytes: int
+    elapsed: float
+    rpc_count: int
+    error: Union[str, None] = None
+
+
+class PreparedFirmware(NamedTuple):
+    segments: List[Segment]
+    pages: Pages
+    drivers: DriverImages
+
+
+def prepare_firmware(filename: Firmware, boot_mode=BootMode.UNDEFINED, use_driver=True) -> Union[PreparedFirmware, None]:
+    """
+    Подготовка прошивки на стороне компьютера: разбор файлов, формирование страниц
+    и чтение драйверов.
+    @filename: файл прошивки или список образов, записываемых вместе
+    @return: подготовленная прошивка или None, если файл не удалось прочитать
+    или образы пересекаются
+    """
+    with profiler.phase('parse', remote=False):
+        segments = read_images(filename, boot_mode)
+    if segments is None:
+        return None
+
+    with profiler.phase('page forming', remote=False):
+        pages: Pages = form_pages(segments, boot_mode)
+    with profiler.phase('driver read', remote=False):
+        drivers = read_driver_images() if use_driver else default_driver_images
+
+    return PreparedFirmware(segments, pages, drivers)
+
+
 def upload_file(
-        filename: str,
+        filename: Firmware,
         host: str = '127.0.0.1',
         port: int = OpenOcdTclRpc.DEFAULT_PORT,
         is_run_openocd=False,
@@ -201,166 +428,475 @@ def upload_file(
         post_action=default_post_action,
         mik_version=MIK32_Version.MIK32V2,
         use_driver=True,
+        transfer_mode=TransferMode.AUTO,
+        transport=Transport.TCL,
+        gdb_port: int = GdbRspClient.DEFAULT_PORT,
+        adapter_serial: Union[str, None] = None,
+        clock_mode=ClockMode.KEEP,
+        resume=False,
 ) -> int:
     """
     Запись прошивки в формате Intel HEX или бинарном в память MIK32.
-    @filename: полный путь до файла прошивки
+    Разбор файла выполняется одновременно с запуском OpenOCD и подключением к нему.
+    @filename: полный путь до файла прошивки или список образов (FirmwareImage),
+    записываемых за один сеанс: драйверы загружаются один раз, post_action
+    выполняется после записи всех образов
+    @resume: продолжить прерванную запись флеш памяти SPIFI по журналу
     @return: возвращает 0 в случае успеха, 1 - если прошивка неудачна
     """
 
-    print(f"Using {mik_version.value}")
+    if mik_version != MIK32_Version.AUTO:
+        print(f"Using {mik_version.value}")
+
+    return upload_prepared(
+        lambda: prepare_firmware(filename, boot_mode, use_driver),
+        host=host,
+        port=port,
+        is_run_openocd=is_run_openocd,
+        use_quad_spi=use_quad_spi,
+        openocd_exec=openocd_exec,
+        openocd_scripts=openocd_scripts,
+        openocd_interface=openocd_interface,
+        openocd_target=openocd_target,
+        adapter_speed=adapter_speed,
+        is_open_console=is_open_console,
+        log_path=log_path,
+        post_action=post_action,
+        mik_version=mik_version,
+        use_driver=use_driver,
+        transfer_mode=transfer_mode,
+        transport=transport,
+        gdb_port=gdb_port,
+        adapter_serial=adapter_serial,
+        clock_mode=clock_mode,
+        resume=resume,
+    )
 
-    result = 0
 
-    if not os.path.exists(filename):
-        print(f"ERROR: File {filename} does not exist")
-        return 1
+def upload_segments(
+        segments: List[Segment],
+        pages: Pages,
+        drivers: DriverImages = default_driver_images,
+        **upload_args
+) -> int:
+    """
+    Запись разобранной прошивки в память MIK32, при необходимости с запуском OpenOCD.
+    @segments: сегменты прошивки
+    @pages: страницы EEPROM и SPIFI, сформированные из сегментов
+    @drivers: драйверы EEPROM и SPIFI, пути к файлам или прочитанные образы
+    @upload_args: аргументы upload_prepared
+    @return: возвращает 0 в случае успеха, 1 - если прошивка неудачна
+    """
 
-    try:
-        file = FirmwareFile(filename, mik32_sections)
-    except ParserError as e:
-        print(e)
-        return 1
+    return upload_prepared(lambda: PreparedFirmware(segments, pages, drivers), **upload_args)
+
+
+def open_session(
+        proc: Union[OpenOcdProcess, None],
+        host: str = '127.0.0.1',
+        port: int = OpenOcdTclRpc.DEFAULT_PORT,
+        openocd_interface=openocd_interface_path,
+        adapter_speed=adapter_default_speed,
+        log_path=default_log_path,
+        transfer_mode=TransferMode.AUTO,
+        transport=Transport.TCL,
+        gdb_port: int = GdbRspClient.DEFAULT_PORT,
+        adapter_serial: Union[str, None] = None,
+) -> Union[OpenOcdTclRpc, None]:
+    """
+    Ожидание запуска OpenOCD, подключение к нему и начальная настройка.
+    @proc: запущенный OpenOCD или None, если OpenOCD запущен пользователем
+    @adapter_serial: серийный номер отладчика для сохранения подобранной скорости
+    @return: открытое соединение или None, если соединение не работает
+    """
+    if proc is not None:
+        with profiler.phase('openocd start', remote=False):
+            startup_time = proc.wait_ready()
+        print(f"OpenOCD started in {startup_time:.2f} seconds")
+
+    with profiler.phase('connect'):
+        openocd = create_rpc(host, port, transport, gdb_port, transfer_mode)
+        openocd.__enter__()
+        profiler.attach(openocd.stats)
+        rpc_trace.attach(openocd)
+        if configure_openocd(openocd, openocd_interface, adapter_speed, log_path, adapter_serial) != 0:
+            openocd.__exit__()
+            return None
 
-    segments: List[Segment] = file.get_segments()
-    pages: Pages = form_pages(segments, boot_mode)
+    return openocd
+
+
+def upload_prepared(
+        prepare: Callable[[], Union[PreparedFirmware, None]],
+        use_quad_spi=False,
+        mik_version=MIK32_Version.MIK32V2,
+        use_driver=True,
+        clock_mode=ClockMode.KEEP,
+        openocd_interface=openocd_interface_path,
+        adapter_serial: Union[str, None] = None,
+        resume=False,
+        **session_args
+) -> int:
+    """
+    Запись прошивки в память MIK32, при необходимости с запуском OpenOCD.
+    Подготовка прошивки prepare выполняется в отдельном потоке одновременно
+    с запуском OpenOCD и подключением к нему, запись начинается после
+    завершения обеих частей.
+    @prepare: функция подготовки прошивки, возвращает None при ошибке
+    @adapter_serial: серийный номер отладчика, если к компьютеру подключено несколько
+    @resume: продолжить прерванную запись флеш памяти SPIFI по журналу
+    @session_args: аргументы run_prepared
+    @return: возвращает 0 в случае успеха, 1 - если прошивка неудачна
+    """
+    board = adapter_clock.cache_key(openocd_interface, adapter_serial)
+
+    return run_prepared(
+        prepare,
+        lambda openocd, firmware: write_firmware(
+            openocd,
+            firmware.segments,
+            firmware.pages,
+            use_quad_spi=use_quad_spi,
+            mik_version=mik_version,
+            use_driver=use_driver,
+            drivers=firmware.drivers,
+            clock_mode=clock_mode,
+            board=board,
+            resume=resume,
+            journal_path=upload_journal.default_journal_path,
+        ),
+        openocd_interface=openocd_interface,
+        adapter_serial=adapter_serial,
+        **session_args
+    )
+
+
+def run_prepared(
+        prepare: Callable[[], Union[PreparedFirmware, None]],
+        action: Callable[[OpenOcdTclRpc, PreparedFirmware], int],
+        host: str = '127.0.0.1',
+        port: int = OpenOcdTclRpc.DEFAULT_PORT,
+        is_run_openocd=False,
+        openocd_exec=openocd_exec_path,
+        openocd_scripts=openocd_scripts_path,
+        openocd_interface=openocd_interface_path,
+        openocd_target=openocd_target_path,
+        adapter_speed=adapter_default_speed,
+        is_open_console=False,
+        log_path=default_log_path,
+        post_action=default_post_action,
+        transfer_mode=TransferMode.AUTO,
+        transport=Transport.TCL,
+        gdb_port: int = GdbRspClient.DEFAULT_PORT,
+        adapter_serial: Union[str, None] = None,
+        telnet_port: Union[int, None] = None,
+        errors: Union[List[str], None] = None,
+) -> int:
+    """
+    Сеанс работы с MIK32 для разобранной прошивки: запуск OpenOCD при необходимости,
+    подготовка прошивки одновременно с подключением, действие action
+    (запись или проверка) и действие после него post_action.
+    @prepare: функция подготовки прошивки, возвращает None при ошибке
+    @action: действие с прошивкой, возвращает 0 в случае успеха
+    @adapter_serial: серийный номер отладчика, если к компьютеру подключено несколько
+    @errors: список, в который добавляются сообщения об ошибках сеанса
+    @return: возвращает 0 в случае успеха, 1 - иначе
+    """
+
+    def add_error(message: str):
+        if errors is not None:
+            errors.append(message)
+
+    result = 0
 
     try:
         port = int(port)
+        gdb_port = int(gdb_port)
     except ValueError:
-        print("An integer argument --openocd-port was expected!")
+        print("ERROR: An integer argument --openocd-port and --gdb-port was expected!")
+        add_error("An integer argument --openocd-port and --gdb-port was expected")
+        return 1
+
+    start_time = time.perf_counter()
 
-    proc: Union[subprocess.Popen, None] = None
+    proc: Union[OpenOcdProcess, None] = None
     if is_run_openocd:
         try:
             logging.debug("OpenOCD try start!")
 
             proc = run_openocd(openocd_exec, openocd_scripts,
-                               openocd_interface, openocd_target, is_open_console)
+                               openocd_interface, openocd_target, is_open_console,
+                               adapter_serial=adapter_serial, tcl_port=port,
+                               gdb_port=gdb_port, telnet_port=telnet_port)
 
             logging.debug("OpenOCD started!")
 
         except OSError as e:
             raise OpenOCDError(e)
-    try:
-        time.sleep(0.1)
-        with OpenOcdTclRpc(host, port) as openocd:
-            try:
-                openocd.run(f"log_output \"{log_path}\"")
-                openocd.run(f"debug_level 1")
-                openocd.run("capture \"riscv.cpu curstate\"")
-            except OSError as e:
-                print("ERROR: Tcl port connection failed")
-                print("Check connectivity and OpenOCD log")
-                return 1
-            
-            if (all(openocd_interface.find(i) == -1 for i in adapter_speed_not_supported)):
-                openocd.run(f"adapter speed {adapter_speed}")
-            
-
-            logging.debug("OpenOCD configured!")
-
-            result = power_manager.pm_init(openocd)
-            if result != 0:
-                return 1
 
-            logging.debug("PM configured!")
-
-            if (pages.pages_eeprom.__len__() > 0):
-                eeprom = EEPROM(openocd)
-                
-                start_time = time.perf_counter()
-
-                if use_driver:
-                    result |= eeprom.write_memory(
-                        pages.pages_eeprom,
-                        os.path.join(
-                            default_drivers_path,
-                            'jtag-eeprom',
-                            default_drivers_build_path,
-                            'firmware.hex'
-                        )
-                    )
-                else:
-                    result |= eeprom.write_pages(
-                        pages.pages_eeprom
-                    )
-
-                write_time = time.perf_counter() - start_time
-                write_size = pages.pages_eeprom.__len__(
-                ) * memory_page_size[MemoryType.EEPROM]
-                t = time.localtime()
-                current_time = time.strftime("%H:%M:%S", t)
-                if result == 0:
-                    print(
-                        f"[{current_time}] Wrote {write_size} bytes in {write_time:.2f} seconds (effective {(write_size/(write_time*1024)):.1f} kbyte/s)")
-            if (pages.pages_spifi.__len__() > 0):
-                gpio_init(openocd, mik_version)
-                spifi = SPIFI(openocd)
-                flash = GenericFlash(spifi)
-                start_time = time.perf_counter()
-
-                if use_driver:
-                    result |= flash.write_pages_by_sectors(
-                        pages.pages_spifi,
-                        os.path.join(
-                            default_drivers_path,
-                            'jtag-spifi',
-                            default_drivers_build_path,
-                            'firmware.hex'
-                        )
-                    )
-                else:
-                    result |= flash.write_pages(
-                        pages.pages_spifi,
-                        openocd,
-                        use_quad_spi=use_quad_spi
-                    )
-
-                write_time = time.perf_counter() - start_time
-                write_size = pages.pages_spifi.__len__(
-                ) * memory_page_size[MemoryType.SPIFI]
-                t = time.localtime()
-                current_time = time.strftime("%H:%M:%S", t)
-                if result == 0:
-                    print(
-                        f"[{current_time}] Wrote {write_size} bytes in {write_time:.2f} seconds (effective {(write_size/(write_time*1024)):.1f} kbyte/s)")
-                gpio_deinit(openocd, mik_version)
-
-            segments_ram = list(filter(
-                lambda segment: (segment.memory is not None) and (segment.memory.type == MemoryType.RAM), segments))
-            if (segments_ram.__len__() > 0):
-                ram.write_segments(segments_ram, openocd)
-                result |= 0
+    def timed_prepare():
+        prepare_start = time.perf_counter()
+        return prepare(), time.perf_counter() - prepare_start
 
+    openocd: Union[OpenOcdTclRpc, None] = None
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            preparing = executor.submit(timed_prepare)
+            openocd = open_session(proc, host, port, openocd_interface, adapter_speed,
+                                   log_path, transfer_mode, transport, gdb_port, adapter_serial)
+            session_time = time.perf_counter() - start_time
+            firmware, prepare_time = preparing.result()
+
+        if openocd is None:
+            add_error("OpenOCD session is not established")
+            return 1
+        if firmware is None:
+            add_error("Firmware is not prepared")
+            return 1
+
+        ready_time = time.perf_counter() - start_time
+        print(f"Firmware prepared in {prepare_time:.2f} seconds, OpenOCD session ready in "
+              f"{session_time:.2f} seconds, overlap saved {max(prepare_time + session_time - ready_time, 0):.2f} seconds")
+
+        result = action(openocd, firmware)
+        if result != 0:
+            return 1
+
+        with profiler.phase('post action'):
             openocd.run(post_action)
     except ConnectionRefusedError:
         print("ERROR: The connection to OpenOCD is not established. Check the settings and connection of the debugger")
-    except (OpenOCDError, TclPortError, TclException) as e:
+        add_error("The connection to OpenOCD is not established")
+        result = 1
+    except (OpenOCDError, TclPortError, TclException, GdbRspError) as e:
         print(e)
-        exit(1)
+        add_error(str(e))
+        result = 1
+    except (DmaError, SPIFI.SpifiError, GenericFlash.FlashError) as e:
+        print(e)
+        add_error(str(e.value))
+        result = 1
     except ConnectionResetError as e:
         print("ERROR: Tcl connection reset")
         print("Check OpenOCD log")
         print(e.strerror)
+        add_error("Tcl connection reset")
+        result = 1
     finally:
+        if openocd is not None:
+            openocd.__exit__()
         if proc is not None:
             proc.kill()
 
     return result
 
 
+def configure_openocd(
+        openocd: OpenOcdTclRpc,
+        openocd_interface=openocd_interface_path,
+        adapter_speed=adapter_default_speed,
+        log_path=default_log_path,
+        adapter_serial: Union[str, None] = None,
+        speed_cache_path: Union[str, None] = adapter_clock.default_cache_path,
+) -> int:
+    """
+    Начальная настройка OpenOCD после подключения: журнал и скорость отладчика.
+    @adapter_speed: скорость в кГц или auto - подбор самой быстрой устойчивой скорости
+    @adapter_serial: серийный номер отладчика для сохранения подобранной скорости
+    @speed_cache_path: файл сохраненных скоростей отладчиков, None - не сохранять
+    @return: возвращает 0 в случае успеха, 1 - если соединение не работает
+    """
+    try:
+        openocd.run(f"log_output \"{log_path}\"")
+        openocd.run(f"debug_level 1")
+        curstate = openocd.run("capture \"riscv.cpu curstate\"").strip()
+    except OSError as e:
+        print("ERROR: Tcl port connection failed")
+        print("Check connectivity and OpenOCD log")
+        return 1
+    # лишние остановки уже остановленной цели пропускаются
+    openocd.set_state({'halted': TargetState.HALTED, 'running': TargetState.RUNNING}.get(
+        curstate, TargetState.UNKNOWN))
+
+    if (all(openocd_interface.find(i) == -1 for i in adapter_speed_not_supported)):
+        if str(adapter_speed) == adapter_clock.AUTO:
+            with profiler.phase('adapter speed'):
+                adapter_clock.select_speed(openocd, openocd_interface, adapter_serial,
+                                           adapter_default_speed, speed_cache_path)
+        else:
+            openocd.run(f"adapter speed {adapter_speed}")
+    elif str(adapter_speed) == adapter_clock.AUTO:
+        print("Adapter speed cannot be changed for this interface, --adapter-speed auto is ignored")
+
+    logging.debug("OpenOCD configured!")
+
+    return 0
+
+
+def write_firmware(
+        openocd: OpenOcdTclRpc,
+        segments: List[Segment],
+        pages: Pages,
+        use_quad_spi=False,
+        mik_version=MIK32_Version.MIK32V2,
+        use_driver=True,
+        drivers: DriverImages = default_driver_images,
+        clock_mode=ClockMode.KEEP,
+        board: Union[str, None] = None,
+        target_cache_path: Union[str, None] = target_probe.default_cache_path,
+        resume=False,
+        journal_path: Union[str, None] = None,
+        regions: Union[List[RegionResult], None] = None,
+) -> int:
+    """
+    Запись прошивки в память MIK32 через установленное соединение с OpenOCD.
+    @mik_version: вариант МК, AUTO - сохраненный для платы
+    @drivers: драйверы EEPROM и SPIFI, пути к файлам или прочитанные образы
+    @clock_mode: делители частоты на время записи EEPROM и SPIFI
+    @board: ключ платы для сохранения варианта МК и параметров флеш памяти
+    (adapter_clock.cache_key), None - не сохранять
+    @target_cache_path: файл сохраненных вариантов МК и параметров флеш памяти
+    @resume: продолжить запись SPIFI драйвером с первого незаписанного сектора
+    @journal_path: журнал записанных секторов SPIFI (upload_journal), None - без журнала
+    @regions: список, в который добавляются результаты записи областей памяти
+    @return: возвращает 0 в случае успеха, 1 - если прошивка неудачна
+    """
+
+    def add_region(memory_type: MemoryType, byte_count: int, start_time: float, start_commands: int,
+                   region_result: int, error: Union[str, None] = None):
+        if regions is None:
+            return
+        if region_result != 0 and error is None:
+            error = f"{memory_type.name} write failed"
+        regions.append(RegionResult(memory_type, byte_count, time.perf_counter() - start_time,
+                                    openocd.stats.commands - start_commands, error))
+
+    with profiler.phase('pm_init'):
+        result, original_profile = power_manager.pm_init(openocd, clock_mode)
+    try:
+        if result != 0:
+            return 1
+
+        logging.debug("PM configured!")
+
+        if (pages.pages_eeprom.__len__() > 0):
+            eeprom = EEPROM(openocd)
+
+            start_time = time.perf_counter()
+            start_commands = openocd.stats.commands
+
+            if use_driver:
+                eeprom_result = eeprom.write_memory(
+                    pages.pages_eeprom,
+                    drivers.eeprom
+                )
+            else:
+                eeprom_result = eeprom.write_pages(
+                    pages.pages_eeprom
+                )
+            result |= eeprom_result
+            add_region(MemoryType.EEPROM, pages.bytes_eeprom, start_time, start_commands, eeprom_result)
+
+            write_time = time.perf_counter() - start_time
+            write_size = pages.bytes_eeprom
+            t = time.localtime()
+            current_time = time.strftime("%H:%M:%S", t)
+            if result == 0:
+                print(
+                    f"[{current_time}] Wrote {write_size} bytes in {write_time:.2f} seconds (effective {(write_size/(write_time*1024)):.1f} kbyte/s)")
+        if (pages.pages_spifi.__len__() > 0):
+            # время области включает определение МК и флеш памяти
+            region_start = time.perf_counter()
+            start_commands = openocd.stats.commands
+
+            with profiler.phase('target probe'):
+                mik_version = target_probe.resolve_version(openocd, mik_version, board, target_cache_path)
+            with profiler.phase('gpio_init'):
+                port2_value = gpio_init(openocd, mik_version)
+            spifi = SPIFI(openocd)
+            flash = GenericFlash(spifi)
+            with profiler.phase('target probe'):
+                flash_info = target_probe.probe_flash(flash, board, target_cache_path)
+
+            spifi_end = max(pages.pages_spifi) + memory_page_size[MemoryType.SPIFI]
+            if spifi_end > flash.geometry.size:
+                error = f"Firmware ends at SPIFI offset {spifi_end:#x}, flash size is {flash.geometry.size:#x} bytes"
+                print(f"ERROR: {error}")
+                add_region(MemoryType.SPIFI, pages.bytes_spifi, region_start, start_commands, 1, error)
+                gpio_deinit(openocd, mik_version, port2_value)
+                return 1
+
+            start_time = time.perf_counter()
+
+            journal: Union[upload_journal.UploadJournal, None] = None
+            skip_sectors: Set[int] = set()
+            if use_driver and journal_path is not None and board is not None:
+                journal = upload_journal.UploadJournal(
+                    journal_path, board, upload_journal.image_hash(pages.pages_spifi), flash_info.jedec_id, resume)
+                if journal.resumed:
+                    skip_sectors = upload_journal.verify_sectors(openocd, flash, pages.pages_spifi, journal.sectors)
+                    print(f"Resuming SPIFI write, {skip_sectors.__len__()} sectors already written")
+            elif resume:
+                print("WARNING: --resume requires the SPIFI driver, writing from the start")
+
+            if use_driver:
+                spifi_result = flash.write_pages_by_sectors(
+                    pages.pages_spifi,
+                    drivers.spifi,
+                    use_quad_spi=use_quad_spi,
+                    skip_sectors=skip_sectors,
+                    on_sector=journal.sector_done if journal is not None else None,
+                )
+                if spifi_result == 0 and journal is not None:
+                    journal.complete()
+            else:
+                spifi_result = flash.write_pages(
+                    pages.pages_spifi,
+                    use_quad_spi=use_quad_spi
+                )
+            result |= spifi_result
+            add_region(MemoryType.SPIFI, pages.bytes_spifi, region_start, start_commands, spifi_result)
+
+            write_time = time.perf_counter() - start_time
+            write_size = pages.bytes_spifi
+            t = time.localtime()
+            current_time = time.strftime("%H:%M:%S", t)
+            if result == 0:
+                print(
+                    f"[{current_time}] Wrote {write_size} bytes in {write_time:.2f} seconds (effective {(write_size/(write_time*1024)):.1f} kbyte/s)")
+            with profiler.phase('gpio_deinit'):
+                gpio_deinit(openocd, mik_version, port2_value)
+    finally:
+        # делители восстанавливаются и при ошибке записи
+        power_manager.pm_deinit(openocd, original_profile)
+
+    segments_ram = list(filter(
+        lambda segment: (segment.memory is not None) and (segment.memory.type == MemoryType.RAM), segments))
+    if (segments_ram.__len__() > 0):
+        start_time = time.perf_counter()
+        start_commands = openocd.stats.commands
+        ram.write_segments(segments_ram, openocd)
+        result |= 0
+        add_region(MemoryType.RAM, sum(segment.data.__len__() for segment in segments_ram),
+                   start_time, start_commands, 0)
+
+    return result
+
+
 def createParser():
     parser = argparse.ArgumentParser(
         prog='mik32_upload.py',
-        usage='python mik32_upload.py firmware_name.hex',
+        usage='python mik32_upload.py firmware_name.hex [other.hex calibration.bin@0x01001f00 ...]',
         description='''Скрипт предназначен для записи программы в ОЗУ, EEPROM и внешнюю flash память, 
         подключенную по интерфейсу SPIFI. Поддерживаемые форматы прошивок: *.hex, *.bin'''
     )
     parser.add_argument(
         'filepath',
-        nargs='?',
-        help='Путь к файлу прошивки'
+        nargs='*',
+        type=parse_image,
+        help='Пути к файлам прошивки. Несколько образов записываются за одно подключение, '
+        'пересекающиеся образы не записываются. Суффикс @АДРЕС переносит образ так, '
+        'чтобы он начинался с АДРЕС (для *.bin - адрес записи вместо 0)'
     )
     parser.add_argument(
         '--run-openocd',
@@ -392,7 +928,8 @@ def createParser():
         '--adapter-speed',
         dest='adapter_speed',
         default=adapter_default_speed,
-        help=f"Скорость отладчика в кГц. По умолчанию: {adapter_default_speed}"
+        help=f"Скорость отладчика в кГц или auto - подбор самой быстрой устойчивой скорости "
+        f"с проверкой записи и чтения ОЗУ. По умолчанию: {adapter_default_speed}"
     )
     parser.add_argument(
         '--openocd-exec',
@@ -454,9 +991,10 @@ def createParser():
         dest='mcu_type',
         type=MIK32_Version,
         choices=list(MIK32_Version),
-        default=MIK32_Version.MIK32V2,
-        help="Выбор микроконтроллера. "
-        f"По умолчанию: {MIK32_Version.MIK32V2}"
+        default=MIK32_Version.AUTO,
+        help="Выбор микроконтроллера. auto - вариант, сохраненный для платы при запуске "
+        "с явно заданным вариантом, иначе MIK32V2. "
+        f"По умолчанию: {MIK32_Version.AUTO}"
     )
     parser.add_argument(
         '--no-driver',
@@ -465,37 +1003,349 @@ def createParser():
         default=True,
         help='Отключает прошивку с использованием драйвера в ОЗУ'
     )
+    parser.add_argument(
+        '--clock',
+        dest='clock_mode',
+        type=ClockMode,
+        choices=list(ClockMode),
+        default=ClockMode.KEEP,
+        help="Делители системной частоты на время записи EEPROM и SPIFI: "
+        "keep - оставить установленные прошивкой, fast - без деления частоты, "
+        "исходные делители восстанавливаются после записи. "
+        f"По умолчанию: {ClockMode.KEEP}"
+    )
+    parser.add_argument(
+        '--buffer-transfer',
+        dest='transfer_mode',
+        type=TransferMode,
+        choices=list(TransferMode),
+        default=TransferMode.AUTO,
+        help="Способ передачи буферов в ОЗУ: списком Tcl (tcl-text) или через временный файл "
+        "и команду load_image (load-image), доступно только для OpenOCD на том же компьютере. "
+        f"По умолчанию: {TransferMode.AUTO} - load-image для локального OpenOCD, "
+        "если он открывает временные файлы скрипта"
+    )
+    parser.add_argument(
+        '--transport',
+        dest='transport',
+        type=Transport,
+        choices=list(Transport),
+        default=Transport.TCL,
+        help="Транспорт для передачи данных: tcl - через Tcl сервер OpenOCD, "
+        "gdb - объемные данные через GDB сервер OpenOCD, команды управления через Tcl сервер. "
+        f"По умолчанию: {Transport.TCL}"
+    )
+    parser.add_argument(
+        '--gdb-port',
+        dest='gdb_port',
+        type=int,
+        default=GdbRspClient.DEFAULT_PORT,
+        help=f"Порт gdb сервера openocd. По умолчанию: {GdbRspClient.DEFAULT_PORT}"
+    )
+    parser.add_argument(
+        '--adapter-serial',
+        dest='adapter_serials',
+        nargs='+',
+        default=[],
+        help="Серийные номера отладчиков. Без --gang используется первый номер"
+    )
+    parser.add_argument(
+        '--gang',
+        dest='gang',
+        action='store_true',
+        default=False,
+        help="Одновременная прошивка нескольких плат. Для каждого отладчика из --adapter-serial "
+        "запускается отдельный OpenOCD, порты назначаются по порядку начиная с портов по умолчанию. "
+        "Если номера не указаны, выполняется поиск отладчиков (только Linux)"
+    )
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        nargs='?',
+        const=default_profile_path,
+        default=None,
+        help="Профилирование этапов прошивки: время, число обращений к OpenOCD, объем данных "
+        "и смены состояния цели. "
+        "Результат выводится таблицей и записывается в файл JSON. "
+        f"По умолчанию: {default_profile_path}"
+    )
+    parser.add_argument(
+        '--trace',
+        dest='trace',
+        default=None,
+        help="Запись обращений к Tcl серверу OpenOCD в файл JSON lines для анализа "
+        "и воспроизведения скриптом mik32_replay.py"
+    )
+    parser.add_argument(
+        '--dump',
+        dest='dump',
+        type=BootMode,
+        choices=[BootMode.EEPROM, BootMode.SPIFI, BootMode.RAM],
+        default=None,
+        help="Чтение памяти в файл, указанный аргументом --output"
+    )
+    parser.add_argument(
+        '--range',
+        dest='range',
+        default=None,
+        help="Диапазон чтения относительно начала памяти: START:END, START+SIZE или START:. "
+        "По умолчанию: вся память"
+    )
+    parser.add_argument(
+        '-o', '--output',
+        dest='output',
+        default=None,
+        help="Файл для --dump: .hex - Intel HEX с абсолютными адресами, иначе двоичный файл"
+    )
+    parser.add_argument(
+        '--resume',
+        dest='resume',
+        action='store_true',
+        default=False,
+        help="Продолжить прерванное чтение --dump в существующий файл с того же диапазона. "
+        "При записи - продолжить прерванную запись флеш памяти SPIFI той же прошивки "
+        "с первого незаписанного сектора, записанные секторы проверяются по CRC"
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        dest='verbose',
+        action='store_true',
+        default=False,
+        help="Подробный вывод: строка на каждую записанную и проверенную страницу или сектор"
+    )
+    parser.add_argument(
+        '--progress-json',
+        dest='progress_json',
+        default=None,
+        help="Вывод событий хода прошивки (этап, адрес, объем, скорость, оставшееся время, "
+        "серийный номер отладчика с --gang) в формате JSON lines в файл или в стандартный вывод, если указано '-'. "
+        "С '-' остальной вывод скрипта выводится в стандартный поток ошибок"
+    )
+    parser.add_argument(
+        '--serve',
+        dest='serve',
+        action='store_true',
+        default=False,
+        help="Запуск сервера прошивки, сохраняющего соединение с OpenOCD и разобранные файлы "
+        "прошивки между заданиями. Задания отправляются командой с аргументом --submit"
+    )
+    parser.add_argument(
+        '--submit',
+        dest='submit',
+        action='store_true',
+        default=False,
+        help="Отправка файла прошивки серверу прошивки, запущенному с аргументом --serve. "
+        "Не заданные явно аргументы берутся из аргументов сервера"
+    )
+    parser.add_argument(
+        '--stop-server',
+        dest='stop_server',
+        action='store_true',
+        default=False,
+        help="Остановка сервера прошивки"
+    )
+    parser.add_argument(
+        '--server-port',
+        dest='server_port',
+        default=6680,
+        help="Порт сервера прошивки. По умолчанию: 6680"
+    )
     return parser
 
 
+def explicit_arguments(args: Union[List[str], None] = None) -> Set[str]:
+    """
+    Имена (dest) аргументов, явно заданных в командной строке
+    @args: аргументы, None - sys.argv
+    """
+    parser = createParser()
+    unset = object()
+    parser.set_defaults(**{dest: unset for dest in vars(parser.parse_args([]))})
+    return {dest for dest, value in vars(parser.parse_args(args)).items() if value is not unset}
+
+
 if __name__ == '__main__':
     logging.basicConfig(stream=sys.stderr, level=logging.INFO)
 
     parser = createParser()
     namespace = parser.parse_args()
 
+    progress.configure(
+        namespace.verbose,
+        (progress.open_json_stream(namespace.progress_json)
+         if namespace.progress_json is not None else None)
+    )
+
     print(program_name)
 
-    if namespace.filepath:
+    if namespace.serve:
+        from mik32_server import serve
         exit(
-            upload_file(
-                namespace.filepath,
+            serve(
+                namespace.server_port,
                 host=namespace.openocd_host,
                 port=namespace.openocd_port,
                 is_run_openocd=namespace.run_openocd,
+                openocd_exec=namespace.openocd_exec,
+                openocd_scripts=namespace.openocd_scripts,
+                openocd_interface=namespace.openocd_interface,
+                openocd_target=namespace.openocd_target,
+                adapter_speed=namespace.adapter_speed,
+                adapter_serial=(namespace.adapter_serials[0]
+                                if namespace.adapter_serials else None),
+                log_path=namespace.log_path,
+                transfer_mode=namespace.transfer_mode,
+                transport=namespace.transport,
+                gdb_port=namespace.gdb_port,
+                job_defaults={
+                    'boot_mode': namespace.boot_mode.value,
+                    'use_quad_spi': namespace.use_quad_spi,
+                    'use_driver': namespace.use_driver,
+                    'clock_mode': namespace.clock_mode.value,
+                    'post_action': namespace.post_action,
+                    'mcu_type': namespace.mcu_type.value,
+                },
+            )
+        )
+    elif namespace.dump is not None:
+        if namespace.output is None:
+            print("ERROR: Output file is not specified, use --output")
+            exit(1)
+        from mik32_dump import dump
+        exit(
+            dump(
+                namespace.dump,
+                namespace.output,
+                namespace.range,
+                resume=namespace.resume,
                 use_quad_spi=namespace.use_quad_spi,
+                host=namespace.openocd_host,
+                port=namespace.openocd_port,
+                is_run_openocd=namespace.run_openocd,
                 openocd_exec=namespace.openocd_exec,
                 openocd_scripts=namespace.openocd_scripts,
                 openocd_interface=namespace.openocd_interface,
                 openocd_target=namespace.openocd_target,
                 adapter_speed=namespace.adapter_speed,
                 is_open_console=namespace.open_console,
+                log_path=namespace.log_path,
+                post_action=namespace.post_action,
+                mik_version=namespace.mcu_type,
+                transfer_mode=namespace.transfer_mode,
+                transport=namespace.transport,
+                gdb_port=namespace.gdb_port,
+                adapter_serial=(namespace.adapter_serials[0]
+                                if namespace.adapter_serials else None),
+            )
+        )
+    elif namespace.stop_server:
+        from mik32_server import submit_job
+        exit(submit_job({'command': 'shutdown'}, server_port=namespace.server_port))
+    elif namespace.filepath and namespace.submit:
+        from mik32_server import submit_job
+        if namespace.filepath.__len__() > 1 or namespace.filepath[0].base_address is not None:
+            print("ERROR: --submit accepts one firmware file without @address")
+            exit(1)
+        # не заданные явно параметры задания берутся из аргументов сервера
+        explicit = explicit_arguments()
+        job_options = {
+            'boot_mode': namespace.boot_mode.value,
+            'use_quad_spi': namespace.use_quad_spi,
+            'use_driver': namespace.use_driver,
+            'clock_mode': namespace.clock_mode.value,
+            'post_action': namespace.post_action,
+            'mcu_type': namespace.mcu_type.value,
+        }
+        exit(
+            submit_job(
+                dict({key: value for key, value in job_options.items() if key in explicit},
+                     file=namespace.filepath[0].path),
+                server_port=namespace.server_port
+            )
+        )
+    elif namespace.filepath and namespace.gang:
+        from mik32_gang import gang_upload
+        exit(
+            gang_upload(
+                namespace.filepath,
+                namespace.adapter_serials,
                 boot_mode=namespace.boot_mode,
+                use_quad_spi=namespace.use_quad_spi,
+                openocd_exec=namespace.openocd_exec,
+                openocd_scripts=namespace.openocd_scripts,
+                openocd_interface=namespace.openocd_interface,
+                openocd_target=namespace.openocd_target,
+                adapter_speed=namespace.adapter_speed,
                 log_path=namespace.log_path,
                 post_action=namespace.post_action,
                 mik_version=namespace.mcu_type,
                 use_driver=namespace.use_driver,
+                clock_mode=namespace.clock_mode,
+                transfer_mode=namespace.transfer_mode,
+                transport=namespace.transport,
             )
         )
+    elif namespace.filepath:
+        if namespace.profile is not None:
+            profiler.start_profiling()
+        if namespace.trace is not None:
+            rpc_trace.start_tracing(namespace.trace, {
+                'file': [[os.path.abspath(image.path), image.base_address] for image in namespace.filepath],
+                'boot_mode': namespace.boot_mode.value,
+                'use_quad_spi': namespace.use_quad_spi,
+                'use_driver': namespace.use_driver,
+                'clock_mode': namespace.clock_mode.value,
+                'mcu_type': namespace.mcu_type.value,
+                'openocd_interface': namespace.openocd_interface,
+                'adapter_speed': namespace.adapter_speed,
+                'log_path': namespace.log_path,
+                'post_action': namespace.post_action,
+                'transport': namespace.transport.value,
+                'version': applicaton_version,
+                # сохраненные варианты МК и параметры флеш памяти, чтобы воспроизведение
+                # выполняло те же обращения при определении цели
+                'adapter_serial': namespace.adapter_serials[0] if namespace.adapter_serials else None,
+                'board': adapter_clock.cache_key(namespace.openocd_interface, (
+                    namespace.adapter_serials[0] if namespace.adapter_serials else None)),
+                'target_cache': target_probe.load_cache(target_probe.default_cache_path),
+                'speed_cache': adapter_clock.load_cache(adapter_clock.default_cache_path),
+            })
+
+        result = upload_file(
+            namespace.filepath,
+            host=namespace.openocd_host,
+            port=namespace.openocd_port,
+            is_run_openocd=namespace.run_openocd,
+            use_quad_spi=namespace.use_quad_spi,
+            openocd_exec=namespace.openocd_exec,
+            openocd_scripts=namespace.openocd_scripts,
+            openocd_interface=namespace.openocd_interface,
+            openocd_target=namespace.openocd_target,
+            adapter_speed=namespace.adapter_speed,
+            is_open_console=namespace.open_console,
+            boot_mode=namespace.boot_mode,
+            log_path=namespace.log_path,
+            post_action=namespace.post_action,
+            mik_version=namespace.mcu_type,
+            use_driver=namespace.use_driver,
+            clock_mode=namespace.clock_mode,
+            transfer_mode=namespace.transfer_mode,
+            transport=namespace.transport,
+            gdb_port=namespace.gdb_port,
+            adapter_serial=(namespace.adapter_serials[0]
+                            if namespace.adapter_serials else None),
+            resume=namespace.resume,
+        )
+
+        if namespace.profile is not None:
+            upload_profiler = profiler.stop_profiling()
+            upload_profiler.print_table()
+            upload_profiler.write_json(namespace.profile)
+            print(f"Profile written to {namespace.profile}")
+        if namespace.trace is not None:
+            tracer = rpc_trace.stop_tracing()
+            print(f"Trace of {tracer.count} commands written to {namespace.trace}")
+
+        exit(result)
     else:
         print("Nothing to upload")
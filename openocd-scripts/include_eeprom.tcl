@@ -1,44 +1,6 @@
-set EEPROM_REGS_BASE_ADDRESS 0x00070400
-
-set EEPROM_REGS_EEDAT [expr {($EEPROM_REGS_BASE_ADDRESS + 0x00)}]
-set EEPROM_REGS_EEA [expr {($EEPROM_REGS_BASE_ADDRESS + 0x04)}]
-set EEPROM_REGS_EECON [expr {($EEPROM_REGS_BASE_ADDRESS + 0x08)}]
-set EEPROM_REGS_EESTA [expr {($EEPROM_REGS_BASE_ADDRESS + 0x0C)}]
-set EEPROM_REGS_EERB [expr {($EEPROM_REGS_BASE_ADDRESS + 0x10)}]
-set EEPROM_REGS_EEADJ [expr {($EEPROM_REGS_BASE_ADDRESS + 0x14)}]
-set EEPROM_REGS_NCYCRL [expr {($EEPROM_REGS_BASE_ADDRESS + 0x18)}]
-set EEPROM_REGS_NCYCEP1 [expr {($EEPROM_REGS_BASE_ADDRESS + 0x1C)}]
-set EEPROM_REGS_NCYCEP2 [expr {($EEPROM_REGS_BASE_ADDRESS + 0x20)}]
-
-#--------------------------
-# EEPROM register fields
-#--------------------------
-#EECON
-set EEPROM_EX_S         0
-set EEPROM_OP_S         1
-set EEPROM_WRBEH_S      3
-set EEPROM_APBNWS_S     5
-set EEPROM_DISECC_S     6
-set EEPROM_BWE_S        7
-set EEPROM_IESERR_S     8
-#EESTA
-set EEPROM_BSY_S        0
-set EEPROM_SERR_S       1
-#NCYCRL
-set EEPROM_N_LD_S       0
-set EEPROM_N_R_1_S      8
-set EEPROM_N_R_2_S      16
-#--------------------------
-# EEPROM codes
-#--------------------------
-set EEPROM_OP_RD        0
-set EEPROM_OP_ER        1
-set EEPROM_OP_PR        2
-set EEPROM_BEH_EVEN     1
-set EEPROM_BEH_ODD      2
-set EEPROM_BEH_GLOB     3
-
-set EEPROM_PAGE_MASK    0x1F80
+# адреса регистров, поля и коды EEPROM генерируются из описания
+# mik32_debug_hal/registers/peripherals.py
+source [file join [file dirname [info script]] mik32_registers.tcl]
 
 #set NO_CH  [expr (0<<1)] 
 
@@ -58,18 +20,18 @@ proc eeprom_sysinit {} {
 
 proc eeprom_global_erase {} {
 	puts "EEPROM global erase..."
-    mww $::EEPROM_REGS_NCYCRL [expr {(1<<$::EEPROM_N_LD_S  | 3<<$::EEPROM_N_R_1_S | 1 << $::EEPROM_N_R_2_S)}];
+    mww $::EEPROM_REGS_NCYCRL [expr {(1<<$::EEPROM_NCYCRL_N_LD_S  | 3<<$::EEPROM_NCYCRL_N_R_1_S | 1 << $::EEPROM_NCYCRL_N_R_2_S)}];
     mww $::EEPROM_REGS_NCYCEP1 100000;
     mww $::EEPROM_REGS_NCYCEP2 1000;
     sleep 100;
-    mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_BWE_S) | ($::EEPROM_BEH_GLOB << $::EEPROM_WRBEH_S)}]; #prepare to buffer load
+    mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_EECON_BWE_S) | ($::EEPROM_BEH_GLOB << $::EEPROM_EECON_WRBEH_S)}]; #prepare to buffer load
     mww $::EEPROM_REGS_EEA 0x00000000;
     #buffer load
     for {set i 0} {$i < 32} {incr i} {
         mww $::EEPROM_REGS_EEDAT 0x00000000;
     }
     #start operation
-    mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_EX_S) | (1 << $::EEPROM_BWE_S) | ($::EEPROM_OP_ER << $::EEPROM_OP_S) | ($::EEPROM_BEH_GLOB << $::EEPROM_WRBEH_S)}];
+    mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_EECON_EX_S) | (1 << $::EEPROM_EECON_BWE_S) | ($::EEPROM_OP_ER << $::EEPROM_EECON_OP_S) | ($::EEPROM_BEH_GLOB << $::EEPROM_EECON_WRBEH_S)}];
 	#eeprom_global_erase_check;
 }
 
@@ -92,7 +54,7 @@ proc eeprom_global_erase_check {} {
 }
 
 proc eeprom_write_word {a_addr a_data} {
-    mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_BWE_S)}]; #prepare to buffer load
+    mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_EECON_BWE_S)}]; #prepare to buffer load
     mww $::EEPROM_REGS_EEA $a_addr;
     #buffer load
     mww $::EEPROM_REGS_EEDAT $a_data;
@@ -101,12 +63,12 @@ proc eeprom_write_word {a_addr a_data} {
     #    mww $::EEPROM_REGS_EEDAT 0x00000000;
     #}
     #start operation
-    mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_EX_S) | (1 << $::EEPROM_BWE_S) | ($::EEPROM_OP_PR << $::EEPROM_OP_S)}]
+    mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_EECON_EX_S) | (1 << $::EEPROM_EECON_BWE_S) | ($::EEPROM_OP_PR << $::EEPROM_EECON_OP_S)}]
     sleep 1
 }
 
 proc eeprom_write_page {a_addr a_data} {
-	mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_BWE_S)}]; #prepare to buffer load
+	mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_EECON_BWE_S)}]; #prepare to buffer load
 	mww $::EEPROM_REGS_EEA $a_addr;
     set page_address [expr {$a_addr & $::EEPROM_PAGE_MASK}]
     set n 0
@@ -118,7 +80,7 @@ proc eeprom_write_page {a_addr a_data} {
 		}
 		mww $::EEPROM_REGS_EEDAT $word;
 	}
-    mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_EX_S) | (1 << $::EEPROM_BWE_S) | ($::EEPROM_OP_PR << $::EEPROM_OP_S)}]
+    mww $::EEPROM_REGS_EECON [expr {(1 << $::EEPROM_EECON_EX_S) | (1 << $::EEPROM_EECON_BWE_S) | ($::EEPROM_OP_PR << $::EEPROM_EECON_OP_S)}]
     sleep 1
 }
 
@@ -203,7 +165,7 @@ proc eeprom_check_data_ahb_lite {a_words} {
 proc eeprom_write_file {a_filename} {
 	eeprom_sysinit;
 	eeprom_global_erase;
-	mww $::EEPROM_REGS_NCYCRL [expr {(1<<$::EEPROM_N_LD_S  | 3<<$::EEPROM_N_R_1_S | 1 << $::EEPROM_N_R_2_S)}];
+	mww $::EEPROM_REGS_NCYCRL [expr {(1<<$::EEPROM_NCYCRL_N_LD_S  | 3<<$::EEPROM_NCYCRL_N_R_1_S | 1 << $::EEPROM_NCYCRL_N_R_2_S)}];
     mww $::EEPROM_REGS_NCYCEP1 100000;
     mww $::EEPROM_REGS_NCYCEP2 1000;
     sleep 100;
@@ -252,7 +214,7 @@ proc eeprom_write_file {a_filename} {
 proc eeprom_write_file_by_word {a_filename} {
 	eeprom_sysinit;
 	eeprom_global_erase;
-	mww $::EEPROM_REGS_NCYCRL [expr {(1<<$::EEPROM_N_LD_S  | 3<<$::EEPROM_N_R_1_S | 1 << $::EEPROM_N_R_2_S)}];
+	mww $::EEPROM_REGS_NCYCRL [expr {(1<<$::EEPROM_NCYCRL_N_LD_S  | 3<<$::EEPROM_NCYCRL_N_R_1_S | 1 << $::EEPROM_NCYCRL_N_R_2_S)}];
     mww $::EEPROM_REGS_NCYCEP1 100000;
     mww $::EEPROM_REGS_NCYCEP2 1000;
     sleep 100;
@@ -0,0 +1,209 @@
+# Регистры MIK32 для скриптов OpenOCD.
+# Файл сгенерирован python -m mik32_debug_hal.registers.peripherals,
+# изменения вносятся в описание mik32_debug_hal/registers/peripherals.py
+
+#--------------------------
+# EEPROM
+#--------------------------
+set EEPROM_REGS_BASE_ADDRESS 0x00070400
+set EEPROM_REGS_EEDAT 0x00070400
+set EEPROM_REGS_EEA 0x00070404
+set EEPROM_REGS_EECON 0x00070408
+set EEPROM_REGS_EESTA 0x0007040c
+set EEPROM_REGS_EERB 0x00070410
+set EEPROM_REGS_EEADJ 0x00070414
+set EEPROM_REGS_NCYCRL 0x00070418
+set EEPROM_REGS_NCYCEP1 0x0007041c
+set EEPROM_REGS_NCYCEP2 0x00070420
+#EECON
+set EEPROM_EECON_EX_S 0
+set EEPROM_EECON_EX_M 0x00000001
+set EEPROM_EECON_OP_S 1
+set EEPROM_EECON_OP_M 0x00000006
+set EEPROM_OP_RD 0
+set EEPROM_OP_ER 1
+set EEPROM_OP_PR 2
+set EEPROM_EECON_WRBEH_S 3
+set EEPROM_EECON_WRBEH_M 0x00000018
+set EEPROM_BEH_EVEN 1
+set EEPROM_BEH_ODD 2
+set EEPROM_BEH_GLOB 3
+set EEPROM_EECON_APBNWS_S 5
+set EEPROM_EECON_APBNWS_M 0x00000020
+set EEPROM_EECON_DISECC_S 6
+set EEPROM_EECON_DISECC_M 0x00000040
+set EEPROM_EECON_BWE_S 7
+set EEPROM_EECON_BWE_M 0x00000080
+set EEPROM_EECON_IESERR_S 8
+set EEPROM_EECON_IESERR_M 0x00000100
+#EESTA
+set EEPROM_EESTA_BSY_S 0
+set EEPROM_EESTA_BSY_M 0x00000001
+set EEPROM_EESTA_SERR_S 1
+set EEPROM_EESTA_SERR_M 0x00000002
+#NCYCRL
+set EEPROM_NCYCRL_N_LD_S 0
+set EEPROM_NCYCRL_N_LD_M 0x000000ff
+set EEPROM_NCYCRL_N_R_1_S 8
+set EEPROM_NCYCRL_N_R_1_M 0x0000ff00
+set EEPROM_NCYCRL_N_R_2_S 16
+set EEPROM_NCYCRL_N_R_2_M 0x00ff0000
+set EEPROM_PAGE_MASK 0x1f80
+
+#--------------------------
+# SPIFI
+#--------------------------
+set SPIFI_REGS_BASE_ADDRESS 0x00070000
+set SPIFI_REGS_CTRL 0x00070000
+set SPIFI_REGS_CMD 0x00070004
+set SPIFI_REGS_ADDR 0x00070008
+set SPIFI_REGS_IDATA 0x0007000c
+set SPIFI_REGS_CLIMIT 0x00070010
+set SPIFI_REGS_DATA32 0x00070014
+set SPIFI_REGS_MCMD 0x00070018
+set SPIFI_REGS_STAT 0x0007001c
+#CTRL
+set SPIFI_CTRL_TIMEOUT_S 0
+set SPIFI_CTRL_TIMEOUT_M 0x0000ffff
+set SPIFI_CTRL_CSHIGH_S 16
+set SPIFI_CTRL_CSHIGH_M 0x000f0000
+set SPIFI_CTRL_CACHE_EN_S 20
+set SPIFI_CTRL_CACHE_EN_M 0x00100000
+set SPIFI_CTRL_D_CACHE_DIS_S 21
+set SPIFI_CTRL_D_CACHE_DIS_M 0x00200000
+set SPIFI_CTRL_INTEN_S 22
+set SPIFI_CTRL_INTEN_M 0x00400000
+set SPIFI_CTRL_MODE3_S 23
+set SPIFI_CTRL_MODE3_M 0x00800000
+set SPIFI_CTRL_SCK_DIV_S 24
+set SPIFI_CTRL_SCK_DIV_M 0x07000000
+set SPIFI_CTRL_PREFETCH_DIS_S 27
+set SPIFI_CTRL_PREFETCH_DIS_M 0x08000000
+set SPIFI_CTRL_DUAL_S 28
+set SPIFI_CTRL_DUAL_M 0x10000000
+set SPIFI_CTRL_RFCLK_S 29
+set SPIFI_CTRL_RFCLK_M 0x20000000
+set SPIFI_CTRL_FBCLK_S 30
+set SPIFI_CTRL_FBCLK_M 0x40000000
+set SPIFI_CTRL_DMAEN_S 31
+set SPIFI_CTRL_DMAEN_M 0x80000000
+#CMD
+set SPIFI_CMD_DATALEN_S 0
+set SPIFI_CMD_DATALEN_M 0x00003fff
+set SPIFI_CMD_POLL_S 14
+set SPIFI_CMD_POLL_M 0x00004000
+set SPIFI_CMD_DOUT_S 15
+set SPIFI_CMD_DOUT_M 0x00008000
+set SPIFI_CMD_INTLEN_S 16
+set SPIFI_CMD_INTLEN_M 0x00070000
+set SPIFI_CMD_FIELDFORM_S 19
+set SPIFI_CMD_FIELDFORM_M 0x00180000
+set SPIFI_FIELDFORM_ALL_SERIAL 0
+set SPIFI_FIELDFORM_DATA_PARALLEL 1
+set SPIFI_FIELDFORM_OPCODE_SERIAL 2
+set SPIFI_FIELDFORM_ALL_PARALLEL 3
+set SPIFI_CMD_FRAMEFORM_S 21
+set SPIFI_CMD_FRAMEFORM_M 0x00e00000
+set SPIFI_FRAMEFORM_OPCODE_NOADDR 1
+set SPIFI_FRAMEFORM_OPCODE_1ADDR 2
+set SPIFI_FRAMEFORM_OPCODE_2ADDR 3
+set SPIFI_FRAMEFORM_OPCODE_3ADDR 4
+set SPIFI_FRAMEFORM_OPCODE_4ADDR 5
+set SPIFI_FRAMEFORM_NOOPCODE_3ADDR 6
+set SPIFI_FRAMEFORM_NOOPCODE_4ADDR 7
+set SPIFI_CMD_OPCODE_S 24
+set SPIFI_CMD_OPCODE_M 0xff000000
+#MCMD
+set SPIFI_MCMD_POLL_S 14
+set SPIFI_MCMD_POLL_M 0x00004000
+set SPIFI_MCMD_DOUT_S 15
+set SPIFI_MCMD_DOUT_M 0x00008000
+set SPIFI_MCMD_INTLEN_S 16
+set SPIFI_MCMD_INTLEN_M 0x00070000
+set SPIFI_MCMD_FIELDFORM_S 19
+set SPIFI_MCMD_FIELDFORM_M 0x00180000
+set SPIFI_MCMD_FRAMEFORM_S 21
+set SPIFI_MCMD_FRAMEFORM_M 0x00e00000
+set SPIFI_MCMD_OPCODE_S 24
+set SPIFI_MCMD_OPCODE_M 0xff000000
+#STAT
+set SPIFI_STAT_MCINIT_S 0
+set SPIFI_STAT_MCINIT_M 0x00000001
+set SPIFI_STAT_CMD_S 1
+set SPIFI_STAT_CMD_M 0x00000002
+set SPIFI_STAT_RESET_S 4
+set SPIFI_STAT_RESET_M 0x00000010
+set SPIFI_STAT_INTRQ_S 5
+set SPIFI_STAT_INTRQ_M 0x00000020
+set SPIFI_STAT_VERSION_S 24
+set SPIFI_STAT_VERSION_M 0xff000000
+
+#--------------------------
+# DMA
+#--------------------------
+set DMA_REGS_BASE_ADDRESS 0x00040000
+set DMA_REGS_CH0_DESTINATION 0x00040000
+set DMA_REGS_CH0_SOURCE 0x00040004
+set DMA_REGS_CH0_LEN 0x00040008
+set DMA_REGS_CH0_CONFIG 0x0004000c
+set DMA_REGS_CH1_DESTINATION 0x00040010
+set DMA_REGS_CH1_SOURCE 0x00040014
+set DMA_REGS_CH1_LEN 0x00040018
+set DMA_REGS_CH1_CONFIG 0x0004001c
+set DMA_REGS_CH2_DESTINATION 0x00040020
+set DMA_REGS_CH2_SOURCE 0x00040024
+set DMA_REGS_CH2_LEN 0x00040028
+set DMA_REGS_CH2_CONFIG 0x0004002c
+set DMA_REGS_CH3_DESTINATION 0x00040030
+set DMA_REGS_CH3_SOURCE 0x00040034
+set DMA_REGS_CH3_LEN 0x00040038
+set DMA_REGS_CH3_CONFIG 0x0004003c
+set DMA_REGS_CONTROL 0x00040040
+set DMA_REGS_STATUS 0x00040040
+#CH0_CONFIG
+set DMA_CH0_CONFIG_ENABLE_S 0
+set DMA_CH0_CONFIG_ENABLE_M 0x00000001
+set DMA_CH0_CONFIG_PRIOR_S 1
+set DMA_CH0_CONFIG_PRIOR_M 0x00000006
+set DMA_CH0_CONFIG_READ_MODE_S 3
+set DMA_CH0_CONFIG_READ_MODE_M 0x00000008
+set DMA_CH0_CONFIG_WRITE_MODE_S 4
+set DMA_CH0_CONFIG_WRITE_MODE_M 0x00000010
+set DMA_CH0_CONFIG_READ_INCREMENT_S 5
+set DMA_CH0_CONFIG_READ_INCREMENT_M 0x00000020
+set DMA_CH0_CONFIG_WRITE_INCREMENT_S 6
+set DMA_CH0_CONFIG_WRITE_INCREMENT_M 0x00000040
+set DMA_CH0_CONFIG_READ_SIZE_S 7
+set DMA_CH0_CONFIG_READ_SIZE_M 0x00000180
+set DMA_CH0_CONFIG_WRITE_SIZE_S 9
+set DMA_CH0_CONFIG_WRITE_SIZE_M 0x00000600
+set DMA_CH0_CONFIG_READ_BURST_SIZE_S 11
+set DMA_CH0_CONFIG_READ_BURST_SIZE_M 0x00003800
+set DMA_CH0_CONFIG_WRITE_BURST_SIZE_S 14
+set DMA_CH0_CONFIG_WRITE_BURST_SIZE_M 0x0001c000
+set DMA_CH0_CONFIG_READ_REQ_S 17
+set DMA_CH0_CONFIG_READ_REQ_M 0x001e0000
+set DMA_CH0_CONFIG_WRITE_REQ_S 21
+set DMA_CH0_CONFIG_WRITE_REQ_M 0x01e00000
+set DMA_CH0_CONFIG_ACK_READ_S 25
+set DMA_CH0_CONFIG_ACK_READ_M 0x02000000
+set DMA_CH0_CONFIG_ACK_WRITE_S 26
+set DMA_CH0_CONFIG_ACK_WRITE_M 0x04000000
+#CONTROL
+set DMA_CONTROL_CLEAR_LOCAL_IRQ_S 0
+set DMA_CONTROL_CLEAR_LOCAL_IRQ_M 0x0000000f
+set DMA_CONTROL_CLEAR_GLOBAL_IRQ_S 4
+set DMA_CONTROL_CLEAR_GLOBAL_IRQ_M 0x00000010
+set DMA_CONTROL_CLEAR_ERROR_IRQ_S 5
+set DMA_CONTROL_CLEAR_ERROR_IRQ_M 0x00000020
+set DMA_CONTROL_GLOBAL_IRQ_ENA_S 6
+set DMA_CONTROL_GLOBAL_IRQ_ENA_M 0x00000040
+set DMA_CONTROL_ERROR_IRQ_ENA_S 7
+set DMA_CONTROL_ERROR_IRQ_ENA_M 0x00000080
+set DMA_CONTROL_CURRENT_VALUE_S 8
+set DMA_CONTROL_CURRENT_VALUE_M 0x00000100
+#STATUS
+set DMA_STATUS_READY_S 0
+set DMA_STATUS_READY_M 0x0000000f
+set DMA_CHANNEL_COUNT 0x4
+set DMA_CHANNEL_SIZEOF 0x10
@@ -0,0 +1,125 @@
+import re
+import socket
+import subprocess
+import threading
+import time
+from collections import deque
+from logging import getLogger
+from typing import List, Union
+
+logger = getLogger(__name__)
+
+
+class OpenOCDError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __repr__(self):
+        return f"ERROR: OpenOCD Startup Exception: {self.msg}"
+
+
+_RE_TCL_LISTENING = re.compile(r"Listening on port (\d+) for tcl connections")
+
+
+class OpenOcdProcess:
+    """
+    Запущенный процесс OpenOCD.
+
+    Вывод OpenOCD (stdout и stderr) читается фоновым потоком в кольцевой
+    буфер последних LOG_LINES строк, поэтому канал не переполняется при долгой
+    работе. Готовность определяется по строке "Listening on port ... for tcl
+    connections". Если вывод не перехватывается (OpenOCD в отдельной консоли),
+    готовность определяется подключением к Tcl порту.
+    Время от запуска до готовности сохраняется в startup_time
+    """
+
+    LOG_LINES = 200
+    DEFAULT_TIMEOUT = 5.0
+
+    def __init__(self, cmd: List[str], host: str = '127.0.0.1', tcl_port: int = 6666,
+                 capture_output=True, creation_flags=0):
+        self.cmd = cmd
+        self.host = host
+        self.tcl_port = tcl_port
+        self.capture_output = capture_output
+        self.log: deque = deque(maxlen=self.LOG_LINES)
+        self.ready = threading.Event()
+        self.exited = threading.Event()
+        self.startup_time: Union[float, None] = None
+
+        self.start_time = time.perf_counter()
+        if capture_output:
+            self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                         creationflags=creation_flags)
+            self.reader = threading.Thread(target=self._read_output, name='openocd-output', daemon=True)
+            self.reader.start()
+        else:
+            self.proc = subprocess.Popen(cmd, creationflags=creation_flags)
+            self.reader = None
+
+    def _read_output(self):
+        for raw_line in iter(self.proc.stdout.readline, b''):
+            line = raw_line.decode('utf-8', errors='replace').rstrip()
+            self.log.append(line)
+            logger.debug('openocd: %s', line)
+            if not self.ready.is_set() and _RE_TCL_LISTENING.search(line):
+                self.startup_time = time.perf_counter() - self.start_time
+                self.ready.set()
+        self.proc.stdout.close()
+        self.exited.set()
+
+    def _wait_port(self, timeout: float):
+        while time.perf_counter() - self.start_time < timeout:
+            if self.proc.poll() is not None:
+                return
+            try:
+                socket.create_connection((self.host, self.tcl_port), timeout=0.1).close()
+                self.startup_time = time.perf_counter() - self.start_time
+                self.ready.set()
+                return
+            except OSError:
+                time.sleep(0.01)
+
+    def wait_ready(self, timeout: float = DEFAULT_TIMEOUT) -> float:
+        """
+        Ожидание готовности Tcl сервера OpenOCD.
+        @return: время запуска OpenOCD в секундах
+        @raise OpenOCDError: OpenOCD завершился или не запустился за timeout секунд,
+            сообщение содержит последние строки вывода OpenOCD
+        """
+        if self.reader is None:
+            self._wait_port(timeout)
+        else:
+            deadline = self.start_time + timeout
+            # поток чтения выставляет exited при закрытии вывода, ожидание обоих событий
+            while not (self.ready.is_set() or self.exited.is_set()):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.ready.wait(min(remaining, 0.05))
+
+        if self.ready.is_set():
+            logger.debug("OpenOCD ready in %.3f seconds", self.startup_time)
+            return self.startup_time
+
+        if self.exited.is_set() or self.proc.poll() is not None:
+            self.proc.wait()
+            raise OpenOCDError(f"OpenOCD exited with code {self.proc.returncode}\n{self.format_log()}")
+
+        raise OpenOCDError(f"OpenOCD did not start in {timeout} seconds\n{self.format_log()}")
+
+    def format_log(self, lines: int = 20) -> str:
+        """Последние строки вывода OpenOCD"""
+        tail = list(self.log)[-lines:]
+        if tail.__len__() == 0:
+            return "OpenOCD output is not available"
+        return "\n".join(tail)
+
+    def poll(self):
+        return self.proc.poll()
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.wait()
+        if self.reader is not None:
+            self.reader.join(1.0)
@@ -181,7 +181,6 @@ def parse_hex(file: str) -> Dict:
     #     print(f"{word:#0x}")
 
     if is_error:
-        print("ERROR: error while parsing")
-        exit()
+        raise ParserError("error while parsing")
 
     return memory_blocks
@@ -0,0 +1,126 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Tuple, Union
+
+from tclrpc import RpcStats
+
+
+@dataclass
+class PhaseRecord:
+    name: str
+    start: float
+    wall: float = 0.0
+    rpc_count: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    payload_bytes: int = 0
+    state_changes: int = 0
+    halts_skipped: int = 0
+    details: Dict[str, Union[int, str]] = field(default_factory=dict)
+
+
+class Profiler:
+    """
+    Профилировщик этапов прошивки: время, число обращений к OpenOCD, объем
+    переданных данных, смены состояния цели и пропущенные остановки
+    для каждого этапа.
+
+    Этапы подготовки на стороне компьютера (remote=False) выполняются
+    одновременно с подключением к OpenOCD и не учитывают обращения к OpenOCD
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.stats: Union[RpcStats, None] = None
+        self.records: List[PhaseRecord] = []
+
+    def attach(self, stats: RpcStats):
+        self.stats = stats
+
+    def _snapshot(self, remote: bool) -> Tuple[int, int, int, int, int, int]:
+        if not remote or self.stats is None:
+            return 0, 0, 0, 0, 0, 0
+        return self.stats.snapshot()
+
+    @contextmanager
+    def phase(self, name: str, remote=True, **details):
+        record = PhaseRecord(name, time.perf_counter() - self.start_time, details=details)
+        before = self._snapshot(remote)
+        try:
+            yield record
+        finally:
+            after = self._snapshot(remote)
+            record.wall = time.perf_counter() - self.start_time - record.start
+            record.rpc_count = after[0] - before[0]
+            record.bytes_sent = after[1] - before[1]
+            record.bytes_received = after[2] - before[2]
+            record.payload_bytes = after[3] - before[3]
+            record.state_changes = after[4] - before[4]
+            record.halts_skipped = after[5] - before[5]
+            self.records.append(record)
+
+    def summary(self) -> List[PhaseRecord]:
+        """Записи этапов, сгруппированные по имени в порядке первого появления"""
+        groups: Dict[str, PhaseRecord] = {}
+        for record in sorted(self.records, key=lambda record: record.start):
+            group = groups.get(record.name)
+            if group is None:
+                group = groups[record.name] = PhaseRecord(record.name, record.start, details={'count': 0})
+            group.wall += record.wall
+            group.rpc_count += record.rpc_count
+            group.bytes_sent += record.bytes_sent
+            group.bytes_received += record.bytes_received
+            group.payload_bytes += record.payload_bytes
+            group.state_changes += record.state_changes
+            group.halts_skipped += record.halts_skipped
+            group.details['count'] += 1
+        return list(groups.values())
+
+    def print_table(self):
+        print(f"{'Phase':<20} {'Count':>6} {'Time, s':>8} {'RPC':>7} {'Sent':>10} {'Received':>10} {'Payload':>10} "
+              f"{'State':>6} {'Halts skipped':>14}")
+        for group in self.summary():
+            print(f"{group.name:<20} {group.details['count']:>6} {group.wall:>8.3f} {group.rpc_count:>7} "
+                  f"{group.bytes_sent:>10} {group.bytes_received:>10} {group.payload_bytes:>10} "
+                  f"{group.state_changes:>6} {group.halts_skipped:>14}")
+        print(f"Total wall time {time.perf_counter() - self.start_time:.3f} seconds")
+
+    def write_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'total': time.perf_counter() - self.start_time,
+                'summary': [asdict(group) for group in self.summary()],
+                'phases': [asdict(record) for record in self.records],
+            }, f, indent=2)
+
+
+active_profiler: Union[Profiler, None] = None
+
+
+def start_profiling() -> Profiler:
+    global active_profiler
+    active_profiler = Profiler()
+    return active_profiler
+
+
+def stop_profiling() -> Union[Profiler, None]:
+    global active_profiler
+    profiler, active_profiler = active_profiler, None
+    return profiler
+
+
+def attach(stats: RpcStats):
+    """Подключение счетчиков соединения с OpenOCD к активному профилировщику"""
+    if active_profiler is not None:
+        active_profiler.attach(stats)
+
+
+def phase(name: str, remote=True, **details):
+    """
+    Контекст этапа прошивки. Без активного профилировщика ничего не делает
+    """
+    if active_profiler is None:
+        return nullcontext()
+    return active_profiler.phase(name, remote, **details)
@@ -0,0 +1,157 @@
+import atexit
+import json
+import sys
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import List, TextIO, Union
+
+
+@dataclass
+class ProgressEvent:
+    event: str  # start, progress, done, error
+    phase: str
+    address: Union[int, None]
+    done: int
+    total: int
+    elapsed: float
+    rate: float  # байт в секунду
+    eta: Union[float, None]
+    board: Union[str, None] = None  # серийный номер отладчика при прошивке нескольких плат
+
+
+class ConsoleSink:
+    """
+    Вывод хода прошивки в консоль не чаще одной строки за interval секунд
+    для каждого потока, прошивающего плату.
+    Построчный вывод страниц и секторов (detail) - только в подробном режиме
+    """
+
+    def __init__(self, interval: float = 0.5, verbose=False):
+        self.interval = interval
+        self.verbose = verbose
+        self.local = threading.local()
+
+    def event(self, event: ProgressEvent):
+        if event.event == 'start':
+            self.local.last_time = time.perf_counter()
+            return
+
+        if event.event == 'progress':
+            now = time.perf_counter()
+            if now - getattr(self.local, 'last_time', 0.0) < self.interval:
+                return
+            self.local.last_time = now
+            eta = f" ETA {event.eta:.0f} s" if event.eta is not None else ""
+            address = f" {event.address:#010x}" if event.address is not None else ""
+            print(f"  {event.phase}{address} {event.done * 100 // max(event.total, 1):>3}% "
+                  f"{event.rate / 1024:.1f} kbyte/s{eta}", flush=True)
+        elif event.event == 'done':
+            print(f"  {event.phase} {event.done} bytes in {event.elapsed:.2f} seconds "
+                  f"({event.rate / 1024:.1f} kbyte/s)", flush=True)
+        elif event.event == 'error':
+            address = f" at {event.address:#010x}" if event.address is not None else ""
+            print(f"  {event.phase} failed{address}", flush=True)
+
+    def detail(self, message: str):
+        if self.verbose:
+            print(message, flush=True)
+
+
+class JsonLinesSink:
+    """
+    Вывод событий хода прошивки построчно в формате JSON для внешних программ
+    """
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def event(self, event: ProgressEvent):
+        with self.lock:
+            self.stream.write(json.dumps(asdict(event)) + '\n')
+            self.stream.flush()
+
+    def detail(self, message: str):
+        pass
+
+
+sinks: List[Union[ConsoleSink, JsonLinesSink]] = [ConsoleSink()]
+
+# плата текущего потока, указывается в событиях
+board_local = threading.local()
+
+
+def configure(verbose=False, json_stream: Union[TextIO, None] = None, interval: float = 0.5):
+    """
+    Настройка вывода хода прошивки.
+    @verbose: построчный вывод страниц и секторов
+    @json_stream: поток для событий в формате JSON lines
+    @interval: наименьший интервал между строками хода в консоли, секунд
+    """
+    global sinks
+    sinks = [ConsoleSink(interval, verbose)]
+    if json_stream is not None:
+        sinks.append(JsonLinesSink(json_stream))
+
+
+def open_json_stream(path: str) -> TextIO:
+    """
+    Поток для событий JSON lines: '-' - стандартный вывод, при этом остальной
+    вывод скрипта переводится в стандартный поток ошибок; иначе файл,
+    закрываемый при завершении программы
+    """
+    if path == '-':
+        stream = sys.stdout
+        sys.stdout = sys.stderr
+        return stream
+    stream = open(path, 'w', encoding='utf-8')
+    atexit.register(stream.close)
+    return stream
+
+
+def set_board(board: Union[str, None]):
+    """Плата (серийный номер отладчика), которую прошивает текущий поток, None - одна плата"""
+    board_local.board = board
+
+
+def detail(message: str):
+    """Сообщение о каждой странице или секторе, выводится только в подробном режиме"""
+    for sink in sinks:
+        sink.detail(message)
+
+
+class Task:
+    """
+    Этап прошивки с известным объемом данных: запись, стирание или проверка
+    """
+
+    def __init__(self, phase: str, total: int):
+        self.phase = phase
+        self.total = total
+        self.done = 0
+        self.address: Union[int, None] = None
+        self.board: Union[str, None] = getattr(board_local, 'board', None)
+        self.start_time = time.perf_counter()
+        self._emit('start')
+
+    def _emit(self, name: str):
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else None
+        event = ProgressEvent(name, self.phase, self.address, self.done, self.total, elapsed, rate, eta,
+                              self.board)
+        for sink in sinks:
+            sink.event(event)
+
+    def advance(self, byte_count: int, address: Union[int, None] = None):
+        self.done += byte_count
+        self.address = address
+        self._emit('progress')
+
+    def finish(self, ok=True):
+        self._emit('done' if ok else 'error')
+
+
+def start(phase: str, total: int) -> Task:
+    return Task(phase, total)
@@ -0,0 +1,152 @@
+import json
+import re
+import time
+from typing import Dict, List, Tuple, Union
+
+
+TRACE_VERSION = 1
+
+
+_RE_WRAPPED_COMMAND = re.compile(r'^set _code \[catch \{(.*)\} _msg\];expr', re.DOTALL)
+# начало обертки run, по нему разбираются команды, укороченные до COMMAND_LIMIT
+_WRAPPED_COMMAND_PREFIX = 'set _code [catch {'
+
+
+def command_type(cmd: str) -> str:
+    """
+    Тип команды Tcl без аргументов: write_memory, read_memory, wait_halt и т.д.
+    Обертки run (catch) и capture отбрасываются, для команд цели
+    (riscv.cpu set_reg) добавляется подкоманда
+    """
+    match = _RE_WRAPPED_COMMAND.match(cmd)
+    if match is not None:
+        cmd = match.group(1)
+    elif cmd.startswith(_WRAPPED_COMMAND_PREFIX):
+        cmd = cmd[len(_WRAPPED_COMMAND_PREFIX):]
+    if cmd.startswith('capture '):
+        cmd = cmd[len('capture '):].strip('"{}')
+
+    words = cmd.split()
+    if words.__len__() == 0:
+        return ''
+    if words[0].endswith('.cpu') and words.__len__() > 1:
+        return f"{words[0]} {words[1]}"
+    return words[0]
+
+
+class RpcTracer:
+    """
+    Запись обращений к Tcl серверу OpenOCD в файл JSON lines.
+
+    Первая строка - заголовок с параметрами прошивки, далее по строке на команду:
+    t - время отправки от начала записи, dt - задержка ответа в секундах,
+    cmd - команда (не длиннее COMMAND_LIMIT символов), size - полная длина команды,
+    reply - ответ целиком, он нужен для воспроизведения
+    """
+
+    COMMAND_LIMIT = 256
+
+    def __init__(self, path: str, header: Union[Dict, None] = None):
+        self.path = path
+        self.header = header if header is not None else {}
+        self.file = open(path, 'w', encoding='utf-8')
+        self.start_time = time.perf_counter()
+        self.header_written = False
+        self.count = 0
+
+    def attach(self, openocd):
+        """Запись заголовка и подключение к соединению с OpenOCD"""
+        if not self.header_written:
+            self.header['transfer'] = openocd.transfer.name
+            # load_image с проверкой первой передачи (transfer.LoadImageTransfer)
+            self.header['transfer_check'] = getattr(openocd.transfer, 'shared', True) is None
+            self.header['transport'] = self.header.get('transport', 'tcl')
+            self.file.write(json.dumps({'version': TRACE_VERSION, 'header': self.header}) + '\n')
+            self.header_written = True
+        openocd.tracer = self
+
+    def record(self, cmd: str, reply: str, start: float, latency: float):
+        self.file.write(json.dumps({
+            't': round(start - self.start_time, 6),
+            'dt': round(latency, 6),
+            'cmd': cmd[:self.COMMAND_LIMIT],
+            'size': cmd.__len__(),
+            'reply': reply,
+        }) + '\n')
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+def load_trace(path: str) -> Tuple[Dict, List[Dict]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+
+    if lines.__len__() == 0:
+        return {}, []
+
+    first = json.loads(lines[0])
+    if 'header' not in first:
+        return {}, [json.loads(line) for line in lines if line]
+    return first['header'], [json.loads(line) for line in lines[1:] if line]
+
+
+HISTOGRAM_BUCKETS = [0.0001, 0.001, 0.01, 0.1, 1.0]
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    return values[min(int(values.__len__() * fraction), values.__len__() - 1)]
+
+
+def print_latency_histograms(records: List[Dict]):
+    """Таблица задержек по типам команд и гистограмма с логарифмическими интервалами"""
+    groups: Dict[str, List[float]] = {}
+    for record in records:
+        groups.setdefault(command_type(record['cmd']), []).append(record['dt'])
+
+    ordered = sorted(groups.items(), key=lambda item: sum(item[1]), reverse=True)
+
+    print(f"{'Command':<22} {'Count':>6} {'Total, s':>9} {'Mean, ms':>9} {'p50, ms':>8} "
+          f"{'p90, ms':>8} {'p99, ms':>8} {'Max, ms':>8}")
+    for name, latencies in ordered:
+        latencies = sorted(latencies)
+        total = sum(latencies)
+        print(f"{name:<22} {latencies.__len__():>6} {total:>9.3f} {total * 1000 / latencies.__len__():>9.2f} "
+              f"{_percentile(latencies, 0.5) * 1000:>8.2f} {_percentile(latencies, 0.9) * 1000:>8.2f} "
+              f"{_percentile(latencies, 0.99) * 1000:>8.2f} {latencies[-1] * 1000:>8.2f}")
+
+    print()
+    labels = ['<0.1ms', '<1ms', '<10ms', '<100ms', '<1s', '>=1s']
+    print(f"{'Command':<22} " + " ".join(f"{label:>7}" for label in labels))
+    for name, latencies in ordered:
+        counts = [0] * labels.__len__()
+        for latency in latencies:
+            bucket = 0
+            while bucket < HISTOGRAM_BUCKETS.__len__() and latency >= HISTOGRAM_BUCKETS[bucket]:
+                bucket += 1
+            counts[bucket] += 1
+        print(f"{name:<22} " + " ".join(f"{count:>7}" for count in counts))
+
+
+active_tracer: Union[RpcTracer, None] = None
+
+
+def start_tracing(path: str, header: Union[Dict, None] = None) -> RpcTracer:
+    global active_tracer
+    active_tracer = RpcTracer(path, header)
+    return active_tracer
+
+
+def stop_tracing() -> Union[RpcTracer, None]:
+    global active_tracer
+    tracer, active_tracer = active_tracer, None
+    if tracer is not None:
+        tracer.close()
+    return tracer
+
+
+def attach(openocd):
+    """Подключение активной записи к соединению с OpenOCD"""
+    if active_tracer is not None:
+        active_tracer.attach(openocd)
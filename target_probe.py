@@ -0,0 +1,117 @@
+import os
+from typing import Callable, Dict, List, NamedTuple, Union
+
+from tclrpc import OpenOcdTclRpc
+from mik32_debug_hal.gpio import MIK32_Version
+from flash_drivers.generic_flash import GenericFlash
+import flash_drivers.capabilities as capabilities
+from utils import read_json_file, update_json_file
+
+
+# Вариант MIK32 и параметры флеш памяти SPIFI, сохраненные для платы.
+#
+# Вариант МК не имеет регистра идентификации, и mimpid ядра у вариантов может
+# совпадать, поэтому вариант не определяется, а запоминается для платы (отладчик
+# и файл настроек интерфейса) при запуске с явно заданным --mcu-type.
+# Параметры флеш памяти читаются из SFDP и дополняются таблицей по JEDEC ID
+# (flash_drivers/capabilities.py), SFDP и сохраняются для платы вместе с JEDEC ID:
+# при следующем подключении читается только JEDEC ID, SFDP читается заново,
+# если микросхема другая.
+
+default_cache_path = os.path.join(os.path.expanduser('~'), '.mik32-uploader', 'targets.json')
+
+
+class FlashInfo(NamedTuple):
+    jedec_id: List[int]
+    sfdp: bytes
+    capabilities: capabilities.FlashCapabilities
+    cached: bool
+
+
+def load_cache(path: Union[str, None]) -> Dict[str, Dict]:
+    if path is None:
+        return {'boards': {}}
+    return read_json_file(path, {'boards': {}})
+
+
+def save_board(path: Union[str, None], board: str, update: Callable[[Dict], None]):
+    """
+    Изменение записи платы функцией update, записи других плат (потоков --gang)
+    не затираются
+    """
+    if path is None:
+        return
+    try:
+        update_json_file(path, lambda cache: update(cache['boards'].setdefault(board, {})), {'boards': {}})
+    except OSError as e:
+        print(f"WARNING: Target cache {path} is not written: {e}")
+
+
+def resolve_version(
+    openocd: OpenOcdTclRpc,
+    version: MIK32_Version,
+    board: Union[str, None] = None,
+    cache_path: Union[str, None] = default_cache_path,
+) -> MIK32_Version:
+    """
+    Вариант МК для --mcu-type auto. Явно заданный вариант запоминается
+    для платы.
+    @board: ключ платы (adapter_clock.cache_key), None - не сохранять
+    """
+    if version != MIK32_Version.AUTO:
+        if board is not None:
+            save_board(cache_path, board, lambda entry: entry.update(mcu_type=version.value))
+        return version
+
+    remembered = None
+    if board is not None:
+        remembered = load_cache(cache_path)['boards'].get(board, {}).get('mcu_type')
+    if remembered is None:
+        print(f"MIK32 variant is not remembered for this board, using {MIK32_Version.MIK32V2}. "
+              f"Set --mcu-type once to remember the variant")
+        return MIK32_Version.MIK32V2
+
+    print(f"Using MIK32 variant {remembered} remembered for this board")
+    return MIK32_Version(remembered)
+
+
+def probe_flash(
+    flash: GenericFlash,
+    board: Union[str, None] = None,
+    cache_path: Union[str, None] = default_cache_path,
+) -> FlashInfo:
+    """
+    Чтение JEDEC ID и параметров флеш памяти из SFDP. SFDP, сохраненные для платы
+    с тем же JEDEC ID, используются без чтения. Возможности микросхемы
+    устанавливаются в flash.capabilities, без SFDP - по таблице или по умолчанию.
+    Выводы SPIFI должны быть настроены (gpio_init).
+    @board: ключ платы (adapter_clock.cache_key), None - не сохранять
+    """
+    jedec_id = flash.identify()
+    jedec_key = bytes(jedec_id).hex()
+
+    # без ответа микросхемы (все биты 0 или 1) SFDP не сохраняются
+    responded = any(byte not in (0x00, 0xFF) for byte in jedec_id)
+    save = board is not None and responded
+    entry = load_cache(cache_path)['boards'].get(board, {}) if save else {}
+
+    cached = entry.get('jedec_id') == jedec_key and 'sfdp' in entry
+    if cached:
+        data = bytes.fromhex(entry['sfdp'])
+    else:
+        data = flash.read_sfdp()
+        if save:
+            save_board(cache_path, board, lambda entry: entry.update(jedec_id=jedec_key, sfdp=data.hex()))
+
+    flash_capabilities = capabilities.lookup(jedec_id, data)
+    geometry = flash_capabilities.geometry
+    if not data:
+        print("SFDP is not supported, using built-in flash parameters")
+    erase_sizes = ', '.join(f"{erase_type.size // 1024}K" for erase_type in geometry.erase_types)
+    quad = flash_capabilities.quad_read
+    print(f"Flash {flash_capabilities.name}: {geometry.size // 1024} KB, page {geometry.page_size} bytes, "
+          f"erase {erase_sizes}, quad read {f'{quad.opcode:#04x} {quad.lines.value}' if quad else 'no'}"
+          f"{' (cached)' if cached else ''}")
+    flash.capabilities = flash_capabilities
+
+    return FlashInfo(jedec_id, data, flash_capabilities, cached)
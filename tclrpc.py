@@ -1,8 +1,10 @@
+from enum import Enum
 import re
 import socket
 from logging import getLogger
 import time
-from typing import List
+from typing import Dict, List, Tuple, Union
+from transfer import TransferMode, select_transfer
 logger = getLogger(__name__)
 
 class TclException(Exception):
@@ -41,6 +43,133 @@ def tcl_quote_cmd(arg):
     else:
         raise TypeError("Expected str or list or tuple, got %s: %r" % (type(arg), arg))
 
+class TargetState(Enum):
+    UNKNOWN = 'unknown'
+    HALTED = 'halted'
+    RUNNING = 'running'
+
+    def __str__(self):
+        return self.value
+
+
+# команды, после успешного выполнения которых состояние цели известно
+_STATE_COMMANDS = {
+    'halt': TargetState.HALTED,
+    'wait_halt': TargetState.HALTED,
+    'step': TargetState.HALTED,
+    'resume': TargetState.RUNNING,
+}
+
+
+# команды сценариев, которые только определяют переменные и процедуры
+_DEFINITION_COMMANDS = ('set', 'proc')
+
+
+def split_script(script: str) -> List[str]:
+    """
+    Команды сценария Tcl верхнего уровня без комментариев: разделители
+    перевода строки и ';' внутри фигурных скобок и кавычек не учитываются
+    """
+    commands: List[str] = []
+    current: List[str] = []
+    depth = 0
+    quoted = False
+    comment = False
+    i = 0
+    while i < script.__len__():
+        char = script[i]
+        if comment:
+            if char == '\n':
+                comment = False
+        elif char == '\\':
+            current.append(script[i:i + 2])
+            i += 2
+            continue
+        elif char == '#' and depth == 0 and not quoted and ''.join(current).strip() == '':
+            comment = True
+        elif char in '\n;' and depth == 0 and not quoted:
+            commands.append(''.join(current))
+            current = []
+        else:
+            if char == '{' and not quoted:
+                depth += 1
+            elif char == '}' and not quoted and depth > 0:
+                depth -= 1
+            elif char == '"' and depth == 0:
+                quoted = not quoted
+            current.append(char)
+        i += 1
+    commands.append(''.join(current))
+    return [command.strip() for command in commands if command.strip()]
+
+
+def target_state_after(cmd: str) -> Union[TargetState, None]:
+    """
+    Состояние цели после команды: остановлена, запущена, неизвестно.
+    None - команда не меняет состояние (обращения к памяти, точки останова,
+    определения переменных и процедур)
+    """
+    if cmd.startswith('capture '):
+        cmd = cmd[len('capture '):].strip('"{}')
+    words = cmd.split()
+    if words.__len__() == 0 or words[0] == 'proc':
+        return None
+    if ';' in cmd or '\n' in cmd.strip():
+        commands = split_script(cmd)
+        if all(command.split()[0] in _DEFINITION_COMMANDS for command in commands):
+            # описания регистров и процедуры Tcl
+            return None
+        if commands.__len__() > 1:
+            # сценарий из нескольких команд, например действие после прошивки
+            return TargetState.UNKNOWN
+        cmd = commands[0] if commands else ''
+        words = cmd.split()
+        if words.__len__() == 0:
+            return None
+    if words[0] == 'reset':
+        if words.__len__() > 1 and words[1] in ('halt', 'init'):
+            return TargetState.HALTED
+        return TargetState.RUNNING
+    return _STATE_COMMANDS.get(words[0])
+
+
+def is_reset_command(cmd: str) -> bool:
+    """Команда сброса цели: сбрасывает регистры периферии при любом прежнем состоянии"""
+    if cmd.startswith('capture '):
+        cmd = cmd[len('capture '):].strip('"{}')
+    words = cmd.split()
+    return words.__len__() > 0 and words[0] == 'reset'
+
+
+class RpcStats:
+    """
+    Счетчики обращений к OpenOCD одного соединения: число команд (Tcl и пакетов GDB),
+    байты, отправленные и принятые через сокет, полезные данные,
+    записанные в память через write_buffer, число смен состояния цели
+    и пропущенных остановок уже остановленной цели
+    """
+
+    __slots__ = (
+        'commands',
+        'bytes_sent',
+        'bytes_received',
+        'payload_bytes',
+        'state_changes',
+        'halts_skipped',
+    )
+
+    def __init__(self):
+        self.commands = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.payload_bytes = 0
+        self.state_changes = 0
+        self.halts_skipped = 0
+
+    def snapshot(self) -> Tuple[int, int, int, int, int, int]:
+        return (self.commands, self.bytes_sent, self.bytes_received, self.payload_bytes,
+                self.state_changes, self.halts_skipped)
+
 class OpenOcdTclRpc:
     DEFAULT_PORT = 6666
     SEPARATOR_VALUE = 0x1a
@@ -51,12 +180,26 @@ class OpenOcdTclRpc:
         'host',
         'port',
         'sock',
+        'transfer',
+        'stats',
+        'tracer',
+        'state',
+        'shadow',
     )
 
-    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT):
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, transfer_mode=TransferMode.AUTO):
         self.host = host
         self.port = port
         self.sock = None
+        self.transfer = select_transfer(host, transfer_mode)
+        self.stats = RpcStats()
+        # запись обращений (rpc_trace.RpcTracer), по умолчанию отключена
+        self.tracer = None
+        # состояние цели по командам этого соединения
+        self.state = TargetState.UNKNOWN
+        # теневые копии регистров периферии (mik32_debug_hal.register_cache),
+        # сбрасываются при смене состояния цели
+        self.shadow: Dict[int, int] = {}
 
     def __enter__(self):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -78,8 +221,16 @@ class OpenOcdTclRpc:
         """Send a command string and return reply"""
         logger.debug('send: %s', cmd)
         data = cmd.encode('utf-8') + self.SEPARATOR_BYTES
+        start_time = time.perf_counter()
         self.sock.sendall(data)
-        reply = self._recv().decode('utf-8')
+        reply = self._recv()
+        latency = time.perf_counter() - start_time
+        self.stats.commands += 1
+        self.stats.bytes_sent += len(data)
+        self.stats.bytes_received += len(reply) + 1
+        reply = reply.decode('utf-8')
+        if self.tracer is not None:
+            self.tracer.record(cmd, reply, start_time, latency)
         logger.debug('recv: %s', reply)
         return reply
 
@@ -114,17 +265,36 @@ class OpenOcdTclRpc:
         code, msg = reply.split(' ', 1)
         code = int(code)
 
+        state = target_state_after(cmd) if type(cmd) is str else None
         if code:
+            if state is not None:
+                self.set_state(TargetState.UNKNOWN)
             raise TclException(code, msg)
         else:
+            if state is not None:
+                self.set_state(state, reset=is_reset_command(cmd))
             return msg
+
+    def set_state(self, state: TargetState, reset=False):
+        """Record the target state, e.g. UNKNOWN after commands with unknown effect.
+        Register shadows are dropped when the state changes or the target is reset"""
+        if state != self.state:
+            self.stats.state_changes += 1
+            logger.debug('target state: %s -> %s', self.state, state)
+        if state != self.state or reset:
+            self.shadow.clear()
+        self.state = state
         
     def reset_halt(self):
         """Halt MCU and raise an error if it returns an error"""
         return self.run("capture \"reset halt\"")
     
     def halt(self):
-        """Halt MCU and raise an error if it returns an error"""
+        """Halt MCU and raise an error if it returns an error.
+        Does nothing if the target is already halted by this connection"""
+        if self.state == TargetState.HALTED:
+            self.stats.halts_skipped += 1
+            return ""
         return self.run("capture \"halt\"")
     
     def resume(self, address=None):
@@ -155,6 +325,13 @@ class OpenOcdTclRpc:
         data_string = " ".join(data_words)
         return self.run(f"capture \"write_memory {address:#0x} {width} {{{data_string}}}\"")
     
+    def write_buffer(self, address:int, data:List[int]):
+        """Write a byte buffer to the target memory using the fastest
+        available transfer (temporary file and load_image for local OpenOCD,
+        Tcl list otherwise). Returns an empty string on success"""
+        self.stats.payload_bytes += len(data)
+        return self.transfer.write_buffer(self, address, data)
+
     def write_word(self, address:int, word:int):
         return self.write_memory(address, 32, [word])
 
@@ -0,0 +1,155 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from enum import Enum
+from pathlib import Path
+from typing import List, Union
+
+from utils import bytes2words
+
+
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+
+def is_local_host(host: str) -> bool:
+    """
+    Проверка, что OpenOCD слушает локальный адрес и, возможно,
+    может открыть файл, созданный скриптом
+    """
+    return host in LOCAL_HOSTS
+
+
+class ScratchDirectory:
+    """
+    Временный каталог для файлов с буферами, создается при первом обращении
+    и удаляется при завершении программы
+    """
+
+    prefix = 'mik32-uploader-'
+
+    def __init__(self):
+        self._path: Union[str, None] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        with self._lock:
+            if self._path is None or not os.path.isdir(self._path):
+                self._path = tempfile.mkdtemp(prefix=self.prefix)
+                atexit.register(self.cleanup)
+            return self._path
+
+    def create_file(self, data: List[int], suffix: str = '.bin') -> str:
+        """
+        Записать буфер во временный файл в каталоге и вернуть абсолютный путь к нему
+        """
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.get())
+        with os.fdopen(fd, 'wb') as f:
+            f.write(bytes(data))
+        return path
+
+    def cleanup(self):
+        with self._lock:
+            if self._path is not None:
+                shutil.rmtree(self._path, ignore_errors=True)
+                self._path = None
+
+
+scratch_directory = ScratchDirectory()
+
+
+class TclTextTransfer:
+    """
+    Передача буфера списком чисел в команде write_memory.
+    Выровненные данные передаются словами, что сокращает длину команды в 4 раза
+    """
+
+    name = 'tcl-text'
+
+    def write_buffer(self, openocd, address: int, data: List[int]) -> str:
+        if (address % 4 == 0) and (len(data) % 4 == 0):
+            return openocd.write_memory(address, 32, bytes2words(data))
+
+        return openocd.write_memory(address, 8, data)
+
+
+class LoadImageTransfer:
+    """
+    Передача буфера через временный бинарный файл и команду load_image.
+    Доступна, только если OpenOCD работает на той же машине.
+    Короткие буферы передаются текстом, так как запись файла для них дороже.
+
+    С check=True первая передача проверяется чтением записанных данных:
+    OpenOCD на локальном порту может работать в контейнере или за SSH туннелем
+    и не видеть временный файл. Если файл не загружен, передача до конца
+    соединения выполняется текстом
+    """
+
+    name = 'load-image'
+
+    MIN_SIZE = 256
+    # число байт, читаемых при проверке первой передачи
+    CHECK_SIZE = 16
+
+    def __init__(self, scratch: ScratchDirectory = scratch_directory, check=False):
+        self.scratch = scratch
+        self.fallback = TclTextTransfer()
+        # None - общая файловая система не проверена
+        self.shared: Union[bool, None] = None if check else True
+
+    def write_buffer(self, openocd, address: int, data: List[int]) -> str:
+        if len(data) < self.MIN_SIZE or self.shared is False:
+            return self.fallback.write_buffer(openocd, address, data)
+
+        if self.shared is None:
+            self.shared = self.check_shared(openocd, address, data)
+            if not self.shared:
+                print("WARNING: OpenOCD cannot open temporary files of the script, "
+                      "buffers are sent as Tcl lists")
+                return self.fallback.write_buffer(openocd, address, data)
+            return ""
+
+        self.load_image(openocd, address, data)
+        return ""
+
+    def load_image(self, openocd, address: int, data: List[int]):
+        path = self.scratch.create_file(data)
+        try:
+            openocd.run(f"load_image {{{Path(path)}}} {address:#0x} bin")
+        finally:
+            os.remove(path)
+
+    def check_shared(self, openocd, address: int, data: List[int]) -> bool:
+        """Загрузка буфера через файл с чтением начала записанных данных"""
+        from tclrpc import TclException
+
+        try:
+            self.load_image(openocd, address, data)
+            return openocd.read_memory(address, 8, self.CHECK_SIZE) == list(data[:self.CHECK_SIZE])
+        except TclException:
+            return False
+
+
+class TransferMode(Enum):
+    AUTO = 'auto'
+    TCL_TEXT = TclTextTransfer.name
+    LOAD_IMAGE = LoadImageTransfer.name
+
+    def __str__(self):
+        return self.value
+
+
+def select_transfer(host: str, mode: TransferMode = TransferMode.AUTO):
+    """
+    Выбор способа передачи буферов.
+    В режиме auto load_image используется, если OpenOCD запущен локально
+    и открывает временные файлы скрипта (проверяется при первой передаче)
+    """
+    if mode == TransferMode.LOAD_IMAGE:
+        return LoadImageTransfer()
+    if mode == TransferMode.TCL_TEXT:
+        return TclTextTransfer()
+    if is_local_host(host):
+        return LoadImageTransfer(check=True)
+    return TclTextTransfer()
@@ -0,0 +1,35 @@
+from enum import Enum
+
+from gdbrsp import GdbRspClient, OpenOcdGdbRpc
+from tclrpc import OpenOcdTclRpc
+from transfer import TransferMode
+
+
+class Transport(Enum):
+    """
+    Транспорт между скриптом и OpenOCD.
+
+    Модули mik32_debug_hal и flash_drivers работают с объектом, реализующим
+    интерфейс OpenOcdTclRpc: run, halt, reset_halt, resume, write_memory,
+    write_word, write_buffer, read_memory, read_word. Реализации:
+    tcl - все команды и данные через Tcl сервер;
+    gdb - объемные данные через GDB сервер в двоичном виде, управление через Tcl
+    """
+    TCL = 'tcl'
+    GDB = 'gdb'
+
+    def __str__(self):
+        return self.value
+
+
+def create_rpc(
+    host: str = '127.0.0.1',
+    port: int = OpenOcdTclRpc.DEFAULT_PORT,
+    transport: Transport = Transport.TCL,
+    gdb_port: int = GdbRspClient.DEFAULT_PORT,
+    transfer_mode: TransferMode = TransferMode.AUTO,
+) -> OpenOcdTclRpc:
+    if transport == Transport.GDB:
+        return OpenOcdGdbRpc(host, port, gdb_port, transfer_mode)
+
+    return OpenOcdTclRpc(host, port, transfer_mode)
@@ -0,0 +1,102 @@
+import hashlib
+import os
+from typing import Callable, Dict, List, Set
+
+from tclrpc import OpenOcdTclRpc
+from flash_drivers.generic_flash import GenericFlash
+import mik32_debug_hal.crc as crc
+import mik32_debug_hal.registers.memory_map as mem_map
+import profiler
+from utils import read_json_file, update_json_file
+
+
+# Журнал записи флеш памяти SPIFI по секторам. Для платы (отладчик и файл
+# настроек интерфейса) сохраняются хэш страниц SPIFI прошивки, JEDEC ID
+# микросхемы и записанные секторы. С --resume записанные секторы той же
+# прошивки на той же плате проверяются по CRC на стороне МК
+# (mik32_debug_hal/crc.py) и не записываются повторно. Запись о плате
+# удаляется после успешной записи.
+
+default_journal_path = os.path.join(os.path.expanduser('~'), '.mik32-uploader', 'journal.json')
+
+
+def image_hash(pages: Dict[int, List[int]]) -> str:
+    """SHA-256 адресов и данных страниц"""
+    digest = hashlib.sha256()
+    for page_offset in sorted(pages):
+        digest.update(page_offset.to_bytes(4, 'little'))
+        digest.update(bytes(pages[page_offset]))
+    return digest.hexdigest()
+
+
+def load_journal(path: str) -> Dict[str, Dict]:
+    return read_json_file(path, {'boards': {}})
+
+
+def save_journal(path: str, update: Callable[[Dict[str, Dict]], None]):
+    """
+    Изменение журнала функцией update под блокировкой: записи других плат
+    (потоков --gang) перечитываются и не затираются
+    """
+    try:
+        update_json_file(path, update, {'boards': {}}, indent=None)
+    except OSError as e:
+        print(f"WARNING: Upload journal {path} is not written: {e}")
+
+
+class UploadJournal:
+    """Записанные секторы SPIFI прошивки для платы"""
+
+    def __init__(self, path: str, board: str, image: str, jedec_id: List[int], resume=False):
+        self.path = path
+        self.board = board
+
+        entry = load_journal(path)['boards'].get(board, {})
+        self.identity = {'image': image, 'jedec_id': bytes(jedec_id).hex()}
+        self.resumed = resume and all(entry.get(key) == value for key, value in self.identity.items())
+        if resume and not self.resumed and entry:
+            print("Upload journal is for another firmware or flash, writing from the start")
+
+        self.sectors: Set[int] = set(entry.get('sectors', [])) if self.resumed else set()
+        self.save()
+
+    def save(self):
+        entry = dict(self.identity, sectors=sorted(self.sectors))
+        save_journal(self.path, lambda journal: journal['boards'].update({self.board: entry}))
+
+    def sector_done(self, sector: int):
+        self.sectors.add(sector)
+        self.save()
+
+    def complete(self):
+        """Запись завершена, продолжать нечего"""
+        save_journal(self.path, lambda journal: journal['boards'].pop(self.board, None))
+
+
+def verify_sectors(
+    openocd: OpenOcdTclRpc,
+    flash: GenericFlash,
+    pages: Dict[int, List[int]],
+    sectors: Set[int],
+) -> Set[int]:
+    """
+    Проверка записанных секторов по CRC на стороне МК до загрузки драйвера.
+    @return: секторы, содержимое которых совпадает с прошивкой
+    """
+    if sectors.__len__() == 0:
+        return set()
+
+    ordered = sorted(sectors)
+    flash.init_memory()
+    with profiler.phase('spifi resume crc'):
+        crcs = crc.TargetCrc(openocd).crc([(mem_map.SPIFI_MEMORY + sector, flash.SECTOR_SIZE)
+                                           for sector in ordered])
+    # выход из режима отображения в память
+    flash.spifi.init_periphery()
+
+    verified = {sector for sector, value in zip(ordered, crcs)
+                if value == crc.host_crc(flash.sector_data(pages, sector))}
+    if verified.__len__() < sectors.__len__():
+        print(f"{sectors.__len__() - verified.__len__()} journaled sectors do not match the firmware "
+              f"and will be written again")
+    return verified
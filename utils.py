@@ -1,4 +1,9 @@
-from typing import List
+import copy
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, List, Union
 
 
 def bytes2words(arr: List[int]) -> List[int]:
@@ -11,4 +16,66 @@ def bytes2words(arr: List[int]) -> List[int]:
             bytes = []
     if bytes.__len__() != 0:
         print("WARNING: skipping not-word-aligned byte")
-    return words
\ No newline at end of file
+    return words
+
+
+def words2bytes(words: List[int]) -> List[int]:
+    bytes = []
+    for word in words:
+        bytes.extend([word & 0xFF, (word >> 8) & 0xFF, (word >> 16) & 0xFF, (word >> 24) & 0xFF])
+    return bytes
+
+
+_json_file_locks: Dict[str, threading.Lock] = {}
+_json_file_locks_guard = threading.Lock()
+
+
+def _json_file_lock(path: str) -> threading.Lock:
+    with _json_file_locks_guard:
+        return _json_file_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def read_json_file(path: str, initial: Union[dict, None] = None) -> dict:
+    """
+    Чтение словаря из файла JSON.
+    @initial: значения по умолчанию, дополняются прочитанными;
+    при отсутствии или повреждении файла возвращается копия initial
+    """
+    data = copy.deepcopy(initial) if initial is not None else {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return data
+
+
+def update_json_file(path: str, update: Callable[[dict], None], initial: Union[dict, None] = None,
+                     indent: Union[int, None] = 2) -> dict:
+    """
+    Изменение файла JSON: чтение, изменение функцией update и запись выполняются
+    под блокировкой пути, поэтому потоки --gang не затирают изменения друг друга.
+    Запись через уникальный временный файл в том же каталоге: прерванная запись
+    не портит файл.
+    @initial: значения по умолчанию, см. read_json_file
+    @return: записанный словарь
+    @raise OSError: файл не записан
+    """
+    with _json_file_lock(path):
+        data = read_json_file(path, initial)
+        update(data)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=indent)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return data